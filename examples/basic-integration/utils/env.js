@@ -12,7 +12,8 @@ var environments = {
     DEBUG: true,                    // Required for MCP logging
     LOG_LEVEL: 'debug',
     MCP_LOGGING: true,              // Enable MCP integration
-    MCP_LOG_ENDPOINT: 'http://127.0.0.1:3001/log'
+    MCP_LOG_ENDPOINT: 'http://127.0.0.1:3001/log',
+    MCP_BATCH: false                // Send logs in batches (fewer requests for chatty pages)
   },
   // Production environment
   production: {
@@ -9,9 +9,28 @@ let config = {
   maxRetries: 3,
   timeout: 5000,
   fallbackStorageKey: 'mcp_fallback_logs',
-  maxFallbackLogs: 100
+  maxFallbackLogs: 100,
+  // Batching: buffer logs and send them with one request to batchEndpoint
+  batch: false,
+  batchEndpoint: null,
+  batchMaxSize: 20,
+  batchMaxDelay: 1000,
+  // Logs per request when the fallback store is sent again
+  replayBatchSize: 50
 };
 
+// Logs waiting to be sent in the next batch
+var batchBuffer = [];
+var batchTimer = null;
+
+// Every log gets an id unique to this launch, so the server can drop copies
+// sent again by retries or fallback replays
+var sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2, 8);
+var logSequence = 0;
+
+// Whether the fallback store may hold logs to replay; unknown until the first replay
+var fallbackPending = true;
+
 // Store original console methods
 const originalConsole = {
   log: console.log,
@@ -37,6 +56,18 @@ function init(options) {
     return;
   }
   
+  // Batches and fallback replays go to the batch endpoint
+  if (!config.batchEndpoint) {
+    config.batchEndpoint = config.endpoint.replace(/\/log\/?$/, '/logs/batch');
+  }
+  
+  if (config.batch) {
+    // Send what is buffered before the mini-app goes to the background
+    if (typeof wx !== 'undefined' && wx.onAppHide) {
+      wx.onAppHide(flushBatch);
+    }
+  }
+  
   // Override console methods
   overrideConsoleMethods();
   
@@ -111,16 +142,57 @@ function sendToMCP(level, data) {
   if (!config.enabled) return;
   
   var logEntry = Object.assign({
+    id: nextLogId(),
     level: level,
     timestamp: Date.now(),
     source: 'wechat-miniapp'
   }, data);
   
-  sendWithRetry(logEntry, 0);
+  if (config.batch) {
+    addToBatch(logEntry);
+  } else {
+    sendWithRetry(logEntry, 0);
+  }
+}
+
+/**
+ * Id for the next log: the launch's id and a counter
+ */
+function nextLogId() {
+  logSequence++;
+  return sessionId + '-' + logSequence.toString(36);
+}
+
+/**
+ * Buffer a log for the next batch, sending once the batch is full or old enough
+ */
+function addToBatch(logEntry) {
+  batchBuffer.push(logEntry);
+  if (batchBuffer.length >= config.batchMaxSize) {
+    flushBatch();
+  } else if (!batchTimer) {
+    batchTimer = setTimeout(flushBatch, config.batchMaxDelay);
+  }
+}
+
+/**
+ * Send all buffered logs with one request
+ */
+function flushBatch() {
+  if (batchTimer) {
+    clearTimeout(batchTimer);
+    batchTimer = null;
+  }
+  if (!batchBuffer.length) return;
+  
+  var logEntries = batchBuffer;
+  batchBuffer = [];
+  sendWithRetry(logEntries, 0);
 }
 
 /**
  * Send with retry logic and exponential backoff
+ * logEntry is one log, or an array of logs sent as one batch
  */
 function sendWithRetry(logEntry, retryCount) {
   if (!config.enabled) return;
@@ -133,11 +205,29 @@ function sendWithRetry(logEntry, retryCount) {
   }
   
   wx.request({
-    url: config.endpoint,
+    url: Array.isArray(logEntry) ? config.batchEndpoint : config.endpoint,
     method: 'POST',
     data: logEntry,
     timeout: config.timeout,
     success: function(res) {
+      // wx.request succeeds for any HTTP response, so check the status here
+      if (isTransientStatus(res.statusCode)) {
+        retryOrFallback('HTTP ' + res.statusCode);
+        return;
+      }
+      if (res.statusCode === 413 && Array.isArray(logEntry) && logEntry.length > 1) {
+        // Batch too large: send each half on its own until the bad log is alone
+        var half = Math.ceil(logEntry.length / 2);
+        sendWithRetry(logEntry.slice(0, half), 0);
+        sendWithRetry(logEntry.slice(half), 0);
+        return;
+      }
+      if (res.statusCode < 200 || res.statusCode >= 300) {
+        // The server will never accept it: retrying or storing it would loop forever
+        var dropped = Array.isArray(logEntry) ? logEntry.length : 1;
+        originalConsole.warn('[MCP-REJECTED] Log server rejected ' + dropped + ' log(s) with HTTP ' + res.statusCode + '; dropping them');
+        return;
+      }
       // Reset failure count on success
       if (sendToMCP._failCount > 0) {
         sendToMCP._failCount = 0;
@@ -146,100 +236,139 @@ function sendWithRetry(logEntry, retryCount) {
       if (retryCount > 0) {
         originalConsole.error('[MCP-SUCCESS] Log server connection restored on attempt ' + (retryCount + 1));
       }
+      // The server is reachable again: send what was stored while it was not
+      if (fallbackPending) {
+        replayFallbackLogs();
+      }
     },
     fail: function(err) {
-      var isTimeout = err.errMsg && err.errMsg.indexOf('timeout') !== -1;
-      var isNetworkError = err.errMsg && (err.errMsg.indexOf('fail') !== -1 || err.errMsg.indexOf('network') !== -1);
-      
-      // Enhanced error categorization
-      if (!sendToMCP._failCount) sendToMCP._failCount = 0;
+      retryOrFallback(err.errMsg);
+    }
+  });
+  
+  function retryOrFallback(errMsg) {
+    var isTimeout = errMsg && errMsg.indexOf('timeout') !== -1;
+    var isNetworkError = errMsg && (errMsg.indexOf('fail') !== -1 || errMsg.indexOf('network') !== -1);
+    
+    // Enhanced error categorization
+    if (!sendToMCP._failCount) sendToMCP._failCount = 0;
+    
+    if (retryCount < config.maxRetries) {
+      // Retry with exponential backoff
+      setTimeout(function() {
+        originalConsole.error('[MCP-RETRY] Retrying log send (attempt ' + (retryCount + 2) + '/' + (config.maxRetries + 1) + ') after ' + retryDelay + 'ms delay. Error: ' + errMsg);
+        sendWithRetry(logEntry, retryCount + 1);
+      }, retryDelay);
+    } else {
+      // All retries exhausted - use fallback
+      fallbackToLocalStorage(logEntry);
       
-      if (retryCount < config.maxRetries) {
-        // Retry with exponential backoff
-        setTimeout(function() {
-          originalConsole.error('[MCP-RETRY] Retrying log send (attempt ' + (retryCount + 2) + '/' + (config.maxRetries + 1) + ') after ' + retryDelay + 'ms delay. Error: ' + err.errMsg);
-          sendWithRetry(logEntry, retryCount + 1);
-        }, retryDelay);
-      } else {
-        // All retries exhausted - use fallback
-        fallbackToLocalStorage(logEntry);
-        
-        // Categorized error reporting (only log first 3 times to avoid spam)
-        if (sendToMCP._failCount < 3) {
-          if (isTimeout) {
-            originalConsole.error('[MCP-TIMEOUT] Log server timeout after ' + (config.maxRetries + 1) + ' attempts. Using fallback storage.');
-          } else if (isNetworkError) {
-            originalConsole.error('[MCP-NETWORK] Network error after ' + (config.maxRetries + 1) + ' attempts: ' + err.errMsg);
-          } else {
-            originalConsole.error('[MCP-FAIL] Log server error after ' + (config.maxRetries + 1) + ' attempts: ' + err.errMsg);
-          }
-          sendToMCP._failCount++;
-        } else if (sendToMCP._failCount === 3) {
-          originalConsole.error('[MCP-DEGRADED] Log server persistently unreachable - operating in fallback mode');
-          sendToMCP._failCount++;
+      // Categorized error reporting (only log first 3 times to avoid spam)
+      if (sendToMCP._failCount < 3) {
+        if (isTimeout) {
+          originalConsole.error('[MCP-TIMEOUT] Log server timeout after ' + (config.maxRetries + 1) + ' attempts. Using fallback storage.');
+        } else if (isNetworkError) {
+          originalConsole.error('[MCP-NETWORK] Network error after ' + (config.maxRetries + 1) + ' attempts: ' + errMsg);
+        } else {
+          originalConsole.error('[MCP-FAIL] Log server error after ' + (config.maxRetries + 1) + ' attempts: ' + errMsg);
         }
+        sendToMCP._failCount++;
+      } else if (sendToMCP._failCount === 3) {
+        originalConsole.error('[MCP-DEGRADED] Log server persistently unreachable - operating in fallback mode');
+        sendToMCP._failCount++;
       }
     }
-  });
+  }
+}
+
+/**
+ * Whether an HTTP status may succeed on a later attempt
+ * (request timeout, rate limiting or a server error)
+ */
+function isTransientStatus(statusCode) {
+  return statusCode === 408 || statusCode === 429 || statusCode >= 500;
+}
+
+/**
+ * Read the logs kept in fallback storage
+ */
+function readFallbackLogs() {
+  try {
+    var logs = JSON.parse(wx.getStorageSync(config.fallbackStorageKey) || '[]');
+    return Array.isArray(logs) ? logs : [];
+  } catch (e) {
+    return [];
+  }
 }
 
 /**
  * Fallback to local storage when server unavailable
+ * Storage is read and written synchronously, so a replay can never run
+ * between the two and remove a log that is being stored.
  */
 function fallbackToLocalStorage(logEntry) {
   if (!config.enabled) return;
   
-  if (typeof wx === 'undefined' || !wx.getStorage) {
+  if (typeof wx === 'undefined' || !wx.getStorageSync || !wx.setStorageSync) {
     originalConsole.error('WeChat storage API not available');
     return;
   }
   
   try {
-    wx.getStorage({
-      key: config.fallbackStorageKey,
-      complete: function(res) {
-        var logs = [];
-        
-        // Parse existing logs or start fresh
-        if (res.data && res.errMsg === 'getStorage:ok') {
-          try {
-            logs = JSON.parse(res.data);
-            if (!Array.isArray(logs)) logs = [];
-          } catch (e) {
-            logs = [];
-          }
-        }
-        
-        // Add new log entry
-        logs.push(logEntry);
-        
-        // Implement log rotation to prevent storage overflow
-        if (logs.length > config.maxFallbackLogs) {
-          logs = logs.slice(-config.maxFallbackLogs);
-        }
-        
-        // Store updated logs
-        wx.setStorage({
-          key: config.fallbackStorageKey,
-          data: JSON.stringify(logs),
-          success: function() {
-            // Silent success - fallback working
-            if (sendToMCP._fallbackCount === undefined) sendToMCP._fallbackCount = 0;
-            sendToMCP._fallbackCount++;
-          },
-          fail: function(storageErr) {
-            originalConsole.error('[MCP-FALLBACK-FAIL] Local storage also failed:', storageErr);
-          }
-        });
-      }
-    });
+    // Add new log entry (or every entry of a batch)
+    var logs = readFallbackLogs().concat(logEntry);
+    
+    // Implement log rotation to prevent storage overflow
+    if (logs.length > config.maxFallbackLogs) {
+      logs = logs.slice(-config.maxFallbackLogs);
+    }
+    
+    wx.setStorageSync(config.fallbackStorageKey, JSON.stringify(logs));
+    fallbackPending = true;
+    if (sendToMCP._fallbackCount === undefined) sendToMCP._fallbackCount = 0;
+    sendToMCP._fallbackCount++;
   } catch (e) {
-    originalConsole.error('[MCP-FALLBACK-ERROR] Fallback storage mechanism failed:', e);
+    originalConsole.error('[MCP-FALLBACK-FAIL] Local storage also failed:', e);
+  }
+}
+
+/**
+ * Send the logs kept in fallback storage in batches and clear the store.
+ * The store is read and cleared synchronously, so no log stored meanwhile is
+ * cleared with it. Batches that fail again go back to the store, while logs
+ * the server rejects outright are dropped; the server ignores logs it already
+ * has, so a log sent twice is only written once.
+ */
+function replayFallbackLogs() {
+  if (!config.enabled) return;
+  
+  if (typeof wx === 'undefined' || !wx.getStorageSync || !wx.removeStorageSync) {
+    return;
+  }
+  
+  var logs;
+  try {
+    logs = readFallbackLogs();
+    if (logs.length) {
+      wx.removeStorageSync(config.fallbackStorageKey);
+    }
+  } catch (e) {
+    originalConsole.error('[MCP-REPLAY-FAIL] Could not take logs out of local storage:', e);
+    return;
+  }
+  fallbackPending = false;
+  if (!logs.length) return;
+  
+  originalConsole.log('[MCP-REPLAY] Sending ' + logs.length + ' logs kept while the log server was unreachable');
+  for (var i = 0; i < logs.length; i += config.replayBatchSize) {
+    sendWithRetry(logs.slice(i, i + config.replayBatchSize), 0);
   }
 }
 
 module.exports = {
   init: init,
   sendToMCP: sendToMCP,
+  flushBatch: flushBatch,
+  replayFallbackLogs: replayFallbackLogs,
   originalConsole: originalConsole
 };
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the MCP server
+Generates synthetic WeChat mini-app logs shaped like the ones logger.js and
+log-collector.js write (console arguments arrays, global_error entries with
+message and stack, mixed levels, ids and serverTimestamp), the same bytes for
+the same seed and size. For each size it times building the sidecar indexes,
+then calls every tool a few times in-process and through the stdio JSON-RPC
+loop of a spawned server, and reports p50/p99 latency, throughput over the
+log and the peak RSS of the server process. Each run happens in a fresh
+process so sizes and modes don't share caches or memory.
+
+Results can be saved as a baseline and later runs compared with it; a case
+whose p50 latency or a run whose peak RSS grew by more than the threshold is
+reported as a regression and the exit status is 1.
+
+Usage: python scripts/benchmark.py [--sizes 10k,100k,1m] [--modes build,inprocess,stdio]
+                                   [--iterations 5] [--seed 1] [--data-dir logs/bench]
+                                   [--save-baseline [PATH]] [--compare [PATH]] [--threshold 0.25]
+                                   [--output results.json] [--result-cache] [--generate-only]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SERVER_DIR = ROOT_DIR / "server"
+DEFAULT_DATA_DIR = ROOT_DIR / "logs" / "bench"
+DEFAULT_BASELINE = DEFAULT_DATA_DIR / "baseline.json"
+
+# Bump when the generated logs change, so old files and baselines aren't mixed with new ones
+GENERATOR_VERSION = 1
+
+# Time of the first generated entry: 2025-01-01T00:00:00Z
+START_MS = 1735689600000
+
+# Largest gap between two generated entries; the mean is half of it
+MAX_GAP_MS = 100
+
+# Lines written per launch of the mini-app (each launch has its own id prefix)
+SESSION_LINES = 2000
+
+# Text of a rare error, about one entry in a thousand
+RARE_TEXT = "WebSocket closed unexpectedly"
+
+PAGES = ["pages/index/index", "pages/cart/cart", "pages/order/list", "pages/order/detail", "pages/user/profile",
+         "pages/goods/detail", "pages/search/search", "pages/pay/result"]
+API_PATHS = ["/v1/goods", "/v1/cart", "/v1/orders", "/v1/user/info", "/v1/search", "/v1/coupons", "/v1/pay/prepay"]
+ERROR_MESSAGES = ["Cannot read property 'length' of undefined", "Cannot read properties of null (reading 'id')",
+                  "xxx is not a function", "Maximum call stack size exceeded", "Unexpected token u in JSON at position 0"]
+WARNINGS = ["[Deprecation] wx.getSystemInfoSync is deprecated, use wx.getWindowInfo",
+            "setData payload is larger than 256KB", "图片加载失败", "Component 'goods-card' is not found in path"]
+
+
+def parse_size(text: str) -> int:
+    """'10k' → 10000, '1m' → 1000000"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def size_label(lines: int) -> str:
+    for suffix, scale in (("m", 1000000), ("k", 1000)):
+        if lines >= scale and lines % scale == 0:
+            return f"{lines // scale}{suffix}"
+    return str(lines)
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+def peak_rss_mb(who: int) -> Optional[float]:
+    """Peak resident set size of this process or its waited-for children"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# ----------------------------------------------------------------------
+# Log generator
+
+def _session_id(rng: random.Random, timestamp: int) -> str:
+    return _base36(timestamp) + "".join(rng.choice("0123456789abcdefghijklmnopqrstuvwxyz") for _ in range(6))
+
+
+def _base36(value: int) -> str:
+    digits = ""
+    while True:
+        value, digit = divmod(value, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        if not value:
+            return digits
+
+
+def _entry_data(rng: random.Random) -> Tuple[str, Dict[str, Any]]:
+    """Level and console payload of one generated entry"""
+    roll = rng.random()
+    page = rng.choice(PAGES)
+    url = f"https://api.example.com{rng.choice(API_PATHS)}?id={rng.randint(1, 99999)}"
+    if roll < 0.30:
+        return "log", {"arguments": [f"request:ok {url}", {"statusCode": 200, "duration": rng.randint(20, 900)}]}
+    if roll < 0.50:
+        return "log", {"arguments": ["setData", {"page": page, "keys": rng.sample(["list", "loading", "total", "user",
+                                                                                   "cart", "coupon"], 2),
+                                                 "size": rng.randint(100, 60000)}]}
+    if roll < 0.58:
+        return "log", {"arguments": [f"[{page}] onShow"]}
+    if roll < 0.75:
+        return "info", {"arguments": [f"[{page}] onLoad", {"query": {"id": str(rng.randint(1, 99999)),
+                                                                     "from": rng.choice(["share", "search", "tab"])}}]}
+    if roll < 0.87:
+        if rng.random() < 0.5:
+            return "warn", {"arguments": [rng.choice(WARNINGS)]}
+        return "warn", {"arguments": [f"request slow {url}", {"duration": rng.randint(1000, 8000)}]}
+    if roll < 0.979:
+        if rng.random() < 0.6:
+            return "error", {"arguments": [f"request:fail {url}", {"errMsg": rng.choice(
+                ["request:fail timeout", "request:fail net::ERR_CONNECTION_RESET", "request:fail 网络异常"])}]}
+        return "error", {"arguments": ["TypeError: " + rng.choice(ERROR_MESSAGES), {"page": page}]}
+    if roll < 0.98:
+        return "error", {"arguments": [RARE_TEXT, {"code": 1006, "reason": ""}]}
+    message = rng.choice(ERROR_MESSAGES)
+    line, column = rng.randint(1, 400), rng.randint(1, 60)
+    stack = (f"TypeError: {message}\n    at Page.onShow ({page}.js:{line}:{column})\n"
+             f"    at Page.__callPageLifeTime__ (WAServiceMainContext.js:1:{rng.randint(100000, 999999)})")
+    return "error", {"message": message, "stack": stack, "type": "global_error"}
+
+
+def generate_log(path: Path, lines: int, seed: int) -> Dict[str, Any]:
+    """Write ``lines`` synthetic entries to ``path``; the same seed gives the same file"""
+    rng = random.Random(f"{GENERATOR_VERSION}:{seed}")
+    timestamp = START_MS
+    session = ""
+    sequence = 0
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "w", encoding="utf-8", newline="\n") as out:
+        batch: List[str] = []
+        for number in range(lines):
+            if number % SESSION_LINES == 0:
+                session, sequence = _session_id(rng, timestamp), 0
+            sequence += 1
+            timestamp += rng.randint(0, MAX_GAP_MS)
+            level, data = _entry_data(rng)
+            entry = {"id": f"{session}-{_base36(sequence)}", "level": level, "timestamp": timestamp,
+                     "source": "wechat-miniapp", **data, "serverTimestamp": timestamp + rng.randint(5, 400)}
+            batch.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+            if len(batch) == 10000:
+                out.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            out.write("\n".join(batch) + "\n")
+    os.replace(temporary, path)
+    return {"lines": lines, "bytes": path.stat().st_size, "first_ms": START_MS, "last_ms": timestamp}
+
+
+def ensure_log(data_dir: Path, lines: int, seed: int) -> Tuple[Path, Dict[str, Any]]:
+    """The generated log for ``lines`` and ``seed``, generating it unless it exists"""
+    path = data_dir / f"synthetic-v{GENERATOR_VERSION}-{size_label(lines)}-s{seed}.log"
+    info_path = path.with_name(path.name + ".bench.json")
+    if path.exists() and info_path.exists():
+        return path, json.loads(info_path.read_text(encoding="utf-8"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    print(f"📝 Generating {lines:,} lines into {path.name}...")
+    started = time.perf_counter()
+    info = generate_log(path, lines, seed)
+    info_path.write_text(json.dumps(info), encoding="utf-8")
+    print(f"   {info['bytes'] / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+    return path, info
+
+
+def remove_sidecars(path: Path) -> None:
+    """Delete the indexes and saved summaries built for a generated log"""
+    for suffix in (".trgm", ".trgm.lock", ".fidx", ".fidx.lock", ".cols", ".cols.lock", ".errors.json"):
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+# ----------------------------------------------------------------------
+# Cases
+
+def tool_cases(info: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any], bool]]:
+    """(case name, tool, arguments, whether the call reads the whole log) for every case"""
+    first, last = info["first_ms"], info["last_ms"]
+    middle, tenth = (first + last) // 2, max((last - first) // 10, 1)
+    # get_error_summary only takes hours back from now; cover the whole log
+    hours = math.ceil((time.time() * 1000 - first) / 3600000) + 1
+    window = {"since": str(first), "until": str(last + 1)}
+    return [
+        ("recent_logs", "get_recent_logs", {"count": 50, "level": "ALL"}, False),
+        ("recent_errors", "get_recent_logs", {"count": 50, "level": "ERROR"}, False),
+        ("search_rare", "search_logs", {"query": RARE_TEXT, "limit": 50}, True),
+        ("search_common", "search_logs", {"query": "request", "limit": 50}, True),
+        ("search_last", "search_logs", {"query": "request", "limit": 50, "mode": "last"}, True),
+        ("search_sample", "search_logs", {"query": "request", "limit": 50, "mode": "sample", "seed": 1}, True),
+        ("search_stratified", "search_logs", {"where": {"type": "global_error"}, "limit": 50,
+                                              "mode": "stratified", "seed": 1}, True),
+        ("search_where", "search_logs", {"where": {"type": "global_error"}, "limit": 50}, True),
+        ("search_window", "search_logs", {"query": "setData", "limit": 50, "since": str(middle),
+                                          "until": str(middle + tenth)}, False),
+        ("error_summary", "get_error_summary", {"hours": hours}, True),
+        ("log_stats_level", "log_stats", {**window, "group_by": "level"}, True),
+        ("log_stats_type", "log_stats", {**window, "group_by": "type"}, True),
+        ("health_check", "health_check", {}, False),
+        ("server_metrics", "server_metrics", {}, False),
+    ]
+
+
+def case_result(info: Dict[str, Any], samples: List[float], first: Optional[float], scans: bool,
+                result_bytes: int = 0) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    p50 = percentile(ordered, 0.5)
+    return {
+        "first_ms": round(first if first is not None else ordered[0], 3),
+        "p50_ms": round(p50, 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "mb_per_s": round(info["bytes"] / 1e6 / (p50 / 1000), 1) if scans and p50 > 0 else None,
+        "lines_per_s": round(info["lines"] / (p50 / 1000)) if scans and p50 > 0 else None,
+        "result_bytes": result_bytes
+    }
+
+
+def server_env(job: Dict[str, Any]) -> Dict[str, str]:
+    env = dict(os.environ, WECHAT_LOG_PATH=job["path"], WECHAT_LOG_TAIL="0", WECHAT_METRICS_FILE="")
+    if not job["result_cache"]:
+        # Repeated calls would otherwise be answered from the cache instead of reading the log
+        env["WECHAT_RESULT_CACHE_MB"] = "0"
+    return env
+
+
+# ----------------------------------------------------------------------
+# Workers, each run in a process of its own
+
+def run_build(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Time building every sidecar of the log from scratch"""
+    sys.path.insert(0, str(SERVER_DIR))
+    from column_store import LogCompactor
+    from field_index import FieldIndex
+    from log_index import TimeIndex
+    from search_index import TrigramIndex
+
+    path, info = Path(job["path"]), job["info"]
+    remove_sidecars(path)
+    fields = [field.strip() for field in os.getenv("WECHAT_INDEXED_FIELDS", "source,type").split(",")
+              if field.strip()]
+    builds = [("time_index", lambda: TimeIndex(path).update()),
+              ("trigram_index", lambda: TrigramIndex(path).update()),
+              ("field_index", lambda: FieldIndex(path, fields).update()),
+              ("column_store", lambda: LogCompactor(path).update())]
+    cases = {}
+    for name, build in builds:
+        started = time.perf_counter()
+        build()
+        cases[name] = case_result(info, [(time.perf_counter() - started) * 1000], None, True)
+    return {"cases": cases, "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None}
+
+
+def _check_response(case: str, response: Dict[str, Any]) -> int:
+    """Size of a tool call's text; fails the run when the call failed"""
+    if "error" in response:
+        raise RuntimeError(f"{case}: {response['error'].get('message')}")
+    text = response["result"]["content"][0]["text"]
+    if text.startswith("❌"):
+        raise RuntimeError(f"{case}: {text}")
+    return len(text.encode("utf-8"))
+
+
+def _time_cases(job: Dict[str, Any], call) -> Dict[str, Any]:
+    """Call every case once cold and ``iterations`` times more; ``call(case, tool, arguments)`` returns the text size"""
+    cases = {}
+    for name, tool, arguments, scans in tool_cases(job["info"]):
+        started = time.perf_counter()
+        result_bytes = call(name, tool, arguments)
+        first = (time.perf_counter() - started) * 1000
+        samples = []
+        for _ in range(job["iterations"]):
+            started = time.perf_counter()
+            call(name, tool, arguments)
+            samples.append((time.perf_counter() - started) * 1000)
+        cases[name] = case_result(job["info"], samples, first, scans, result_bytes)
+    return cases
+
+
+def run_inprocess(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the tools on a server object in this process"""
+    started = time.perf_counter()
+    os.environ.update(server_env(job))
+    sys.path.insert(0, str(SERVER_DIR))
+    spec = importlib.util.spec_from_file_location("mcp_server", SERVER_DIR / "mcp-server.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    server = module.WeChatMCPServer()
+    server.running = True
+    for source in server.log_sources():
+        server.start_source(source)
+    startup = (time.perf_counter() - started) * 1000
+
+    loop = asyncio.new_event_loop()
+    request_ids = iter(range(1, 1 << 30))
+
+    def call(case: str, tool: str, arguments: Dict[str, Any]) -> int:
+        request = {"jsonrpc": "2.0", "id": next(request_ids), "method": "tools/call",
+                   "params": {"name": tool, "arguments": arguments}}
+        return _check_response(case, loop.run_until_complete(server.handle_request(request)))
+
+    try:
+        cases = _time_cases(job, call)
+    finally:
+        for source in server.log_sources():
+            source.stop()
+        server.scan_engine.shutdown()
+        loop.close()
+    cases["startup"] = case_result(job["info"], [startup], None, False)
+    return {"cases": cases, "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None}
+
+
+def run_stdio(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the tools over the stdio JSON-RPC loop of a spawned server"""
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, str(SERVER_DIR / "mcp-server.py")], cwd=SERVER_DIR,
+                              env=server_env(job), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    request_ids = iter(range(1, 1 << 30))
+
+    def request(method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        request_id = next(request_ids)
+        server.stdin.write(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method,
+                                       "params": params}).encode("utf-8") + b"\n")
+        server.stdin.flush()
+        while True:
+            line = server.stdout.readline()
+            if not line:
+                raise RuntimeError(f"Server exited with status {server.wait()}")
+            message = json.loads(line)
+            # Skip notifications and anything else not answering this request
+            if isinstance(message, dict) and message.get("id") == request_id:
+                return message
+
+    try:
+        request("initialize", {"protocolVersion": "2024-11-05", "capabilities": {},
+                               "clientInfo": {"name": "benchmark", "version": "1.0"}})
+        server.stdin.write(b'{"jsonrpc": "2.0", "method": "notifications/initialized"}\n')
+        startup = (time.perf_counter() - started) * 1000
+        cases = _time_cases(job, lambda case, tool, arguments: _check_response(
+            case, request("tools/call", {"name": tool, "arguments": arguments})))
+    finally:
+        server.stdin.close()
+        server.wait()
+    cases["startup"] = case_result(job["info"], [startup], None, False)
+    # The server is the only child this process waited for, so the children's peak is its peak
+    return {"cases": cases, "peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None}
+
+
+WORKERS = {"build": run_build, "inprocess": run_inprocess, "stdio": run_stdio}
+
+
+def run_job(job: Dict[str, Any], data_dir: Path) -> Dict[str, Any]:
+    """Run one worker in a fresh process; its log output goes to a .err file in the data directory"""
+    error_path = data_dir / f"{job['mode']}-{size_label(job['info']['lines'])}.err"
+    with open(error_path, "wb") as errors:
+        completed = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--worker", json.dumps(job)],
+                                   stdout=subprocess.PIPE, stderr=errors)
+    if completed.returncode != 0:
+        tail = error_path.read_text(encoding="utf-8", errors="replace").splitlines()[-15:]
+        raise SystemExit(f"❌ {job['mode']} run failed; last lines of {error_path}:\n" + "\n".join(tail))
+    return json.loads(completed.stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+# ----------------------------------------------------------------------
+# Reporting
+
+def print_run(key: str, run: Dict[str, Any]) -> None:
+    rss = f"{run['peak_rss_mb']:.1f} MB" if run.get("peak_rss_mb") is not None else "n/a"
+    print(f"\n📊 {key} · {run['lines']:,} lines ({run['bytes'] / 1e6:.1f} MB) · peak RSS {rss}")
+    print(f"   {'case':<20}{'first ms':>11}{'p50 ms':>11}{'p99 ms':>11}{'MB/s':>10}{'lines/s':>13}")
+    for name, case in run["cases"].items():
+        mb_per_s = f"{case['mb_per_s']:.1f}" if case["mb_per_s"] is not None else "-"
+        lines_per_s = f"{case['lines_per_s']:,}" if case["lines_per_s"] is not None else "-"
+        print(f"   {name:<20}{case['first_ms']:>11.1f}{case['p50_ms']:>11.1f}{case['p99_ms']:>11.1f}"
+              f"{mb_per_s:>10}{lines_per_s:>13}")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """Print how the runs changed against the baseline and return the regressions"""
+    if (baseline.get("generator"), baseline.get("seed")) != (results["generator"], results["seed"]):
+        print("\n⚠️  Baseline was taken with another generator version or seed; nothing to compare")
+        return []
+    regressions = []
+    print(f"\n🔍 Compared with baseline from {baseline.get('created', 'unknown time')} "
+          f"(threshold {threshold:.0%}, ignoring changes under {min_delta_ms:g} ms)")
+    for key, run in results["runs"].items():
+        old_run = baseline["runs"].get(key)
+        if old_run is None:
+            continue
+        old_rss, rss = old_run.get("peak_rss_mb"), run.get("peak_rss_mb")
+        if old_rss and rss and rss > old_rss * (1 + threshold):
+            regressions.append(f"{key} peak RSS {old_rss:.1f} → {rss:.1f} MB")
+        for name, case in run["cases"].items():
+            old_case = old_run["cases"].get(name)
+            if old_case is None or not old_case["p50_ms"]:
+                continue
+            old, new = old_case["p50_ms"], case["p50_ms"]
+            change = new / old - 1
+            mark = ""
+            if change > threshold and new - old >= min_delta_ms:
+                mark = "⚠️  regression"
+                regressions.append(f"{key} {name} p50 {old:.1f} → {new:.1f} ms ({change:+.0%})")
+            elif change < -threshold and old - new >= min_delta_ms:
+                mark = "🚀 faster"
+            if mark:
+                print(f"   {key:<16}{name:<20}{old:>10.1f}{new:>10.1f} ms {change:>+6.0%}  {mark}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"   • {regression}")
+    else:
+        print("   ✅ No regressions")
+    return regressions
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the MCP server tools on generated logs")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="Comma-separated log sizes in lines, e.g. 10k,1m,10m")
+    parser.add_argument("--modes", default="build,inprocess,stdio",
+                        help="Comma-separated runs per size: build (sidecar indexes), inprocess, stdio")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed calls per case after the first")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the log generator")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="Where generated logs are kept")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, type=Path, metavar="PATH",
+                        help=f"Save the results as the baseline (default {DEFAULT_BASELINE.relative_to(ROOT_DIR)})")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, type=Path, metavar="PATH",
+                        help="Compare the results with a saved baseline and exit with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="Slowdowns smaller than this many milliseconds are never regressions")
+    parser.add_argument("--output", type=Path, help="Also write the results to this JSON file")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Keep the server's result cache on, so repeated calls measure cache hits")
+    parser.add_argument("--generate-only", action="store_true", help="Only generate the logs")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        job = json.loads(args.worker)
+        print(json.dumps(WORKERS[job["mode"]](job)))
+        return 0
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(modes) - set(WORKERS)
+    if unknown:
+        raise SystemExit(f"❌ Unknown mode(s): {', '.join(sorted(unknown))}; use {', '.join(WORKERS)}")
+    if "build" not in modes:
+        print("ℹ️  Without the build run, indexes left by an earlier run are used as they are")
+    data_dir = args.data_dir.resolve()
+    results: Dict[str, Any] = {
+        "version": 1, "generator": GENERATOR_VERSION, "seed": args.seed,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "iterations": args.iterations,
+        "result_cache": args.result_cache, "python": platform.python_version(),
+        "platform": platform.platform(), "cpus": os.cpu_count(), "runs": {}
+    }
+
+    print("🏁 MCP Server Benchmark")
+    print("=======================")
+    for lines in (parse_size(size) for size in args.sizes.split(",") if size.strip()):
+        path, info = ensure_log(data_dir, lines, args.seed)
+        if args.generate_only:
+            continue
+        for mode in modes:
+            job = {"mode": mode, "path": str(path), "info": info, "iterations": args.iterations,
+                   "result_cache": args.result_cache}
+            key = f"{mode}/{size_label(lines)}"
+            print(f"\n⏱️  {key}...")
+            run = {"lines": info["lines"], "bytes": info["bytes"], **run_job(job, data_dir)}
+            results["runs"][key] = run
+            print_run(key, run)
+
+    if args.generate_only:
+        return 0
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\n💾 Results written to {args.output}")
+    regressions: List[str] = []
+    if args.compare:
+        if not args.compare.exists():
+            raise SystemExit(f"❌ No baseline at {args.compare}; create one with --save-baseline")
+        regressions = compare(results, json.loads(args.compare.read_text(encoding="utf-8")), args.threshold,
+                              args.min_delta_ms)
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\n💾 Baseline saved to {args.save_baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
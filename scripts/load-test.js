@@ -0,0 +1,122 @@
+#!/usr/bin/env node
+/**
+ * Ingest load test for the log collection server
+ * Sends the same number of log entries through POST /log (one request per
+ * entry) and POST /logs/batch (one request per batch) and reports requests
+ * and entries per second with p50/p99 request latency. A request only
+ * completes once its entries are on disk, so latency is ingest latency.
+ *
+ * Usage: node scripts/load-test.js [--url http://127.0.0.1:3001] [--entries 20000]
+ *                                  [--concurrency 32] [--batch-size 50] [--mode both|single|batch]
+ */
+
+const http = require('http');
+
+function parseArgs(argv) {
+  const options = { url: 'http://127.0.0.1:3001', entries: 20000, concurrency: 32, batchSize: 50, mode: 'both' };
+  for (let i = 0; i < argv.length; i += 2) {
+    const key = argv[i].replace(/^--/, '').replace(/-([a-z])/g, (_, c) => c.toUpperCase());
+    if (!(key in options)) {
+      throw new Error(`Unknown option: ${argv[i]}`);
+    }
+    options[key] = typeof options[key] === 'number' ? Number(argv[i + 1]) : argv[i + 1];
+  }
+  return options;
+}
+
+function makeEntry(i) {
+  return {
+    level: i % 20 === 0 ? 'error' : 'log',
+    timestamp: Date.now(),
+    source: 'load-test',
+    arguments: [`load test entry ${i}`, { page: 'pages/index/index', n: i }]
+  };
+}
+
+function post(agent, url, body) {
+  return new Promise((resolve, reject) => {
+    const data = JSON.stringify(body);
+    const req = http.request(url, {
+      method: 'POST',
+      agent,
+      headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(data) }
+    }, (res) => {
+      res.resume();
+      res.on('end', () => (res.statusCode === 200 ? resolve() : reject(new Error(`HTTP ${res.statusCode}`))));
+    });
+    req.on('error', reject);
+    req.end(data);
+  });
+}
+
+function percentile(sorted, p) {
+  return sorted.length ? sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))] : 0;
+}
+
+/**
+ * Send `requests` bodies from `concurrency` connections; returns throughput and latencies
+ */
+async function run(name, url, bodies, entries, concurrency) {
+  const agent = new http.Agent({ keepAlive: true, maxSockets: concurrency });
+  const latencies = [];
+  let next = 0;
+  let errors = 0;
+  const started = process.hrtime.bigint();
+
+  async function worker() {
+    while (next < bodies.length) {
+      const body = bodies[next++];
+      const sent = process.hrtime.bigint();
+      try {
+        await post(agent, url, body);
+        latencies.push(Number(process.hrtime.bigint() - sent) / 1e6);
+      } catch (e) {
+        errors++;
+      }
+    }
+  }
+
+  await Promise.all(Array.from({ length: concurrency }, worker));
+  const seconds = Number(process.hrtime.bigint() - started) / 1e9;
+  agent.destroy();
+  latencies.sort((a, b) => a - b);
+  return {
+    mode: name,
+    requests: bodies.length,
+    entries,
+    errors,
+    seconds: seconds.toFixed(2),
+    'req/s': Math.round(bodies.length / seconds),
+    'entries/s': Math.round(entries / seconds),
+    'p50 ms': percentile(latencies, 0.5).toFixed(2),
+    'p99 ms': percentile(latencies, 0.99).toFixed(2)
+  };
+}
+
+async function main() {
+  const options = parseArgs(process.argv.slice(2));
+  const base = options.url.replace(/\/$/, '');
+  const results = [];
+
+  if (options.mode === 'both' || options.mode === 'single') {
+    const bodies = Array.from({ length: options.entries }, (_, i) => makeEntry(i));
+    results.push(await run('POST /log', `${base}/log`, bodies, options.entries, options.concurrency));
+  }
+  if (options.mode === 'both' || options.mode === 'batch') {
+    const bodies = [];
+    for (let i = 0; i < options.entries; i += options.batchSize) {
+      const size = Math.min(options.batchSize, options.entries - i);
+      bodies.push(Array.from({ length: size }, (_, j) => makeEntry(i + j)));
+    }
+    results.push(await run(`POST /logs/batch (${options.batchSize}/batch)`, `${base}/logs/batch`, bodies,
+      options.entries, options.concurrency));
+  }
+
+  console.log(`📈 ${options.entries} entries, ${options.concurrency} concurrent connections against ${base}`);
+  console.table(results);
+}
+
+main().catch((err) => {
+  console.error('❌ Load test failed:', err.message);
+  process.exit(1);
+});
@@ -0,0 +1,597 @@
+"""
+Columnar side store for log_stats
+A background compactor turns complete, line-aligned ranges of each log file
+and of its rotated segments into column blocks stored next to them
+(wechat_logs.log.cols, wechat_logs.log.000042.cols). A block has one row per
+entry: its timestamp, its level code, codes for its source and type in the
+block's own dictionary, and its byte offset back into the raw log. Time-
+bucketed counts read only the timestamp column and the column grouped by,
+skip blocks whose time range misses the window, and aggregate with numpy
+when it is installed. Whatever has not been compacted yet is scanned directly.
+"""
+
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import uuid
+import zlib
+from array import array
+from collections import Counter
+from itertools import takewhile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from log_index import entry_timestamp
+from log_reader import LOG_LEVELS, decode_entry, iter_lines
+from log_segments import Segment, iter_segment_lines, list_segments, open_segment
+from metrics import count_read
+from scan_engine import check_cancel
+from search_index import try_lock_file, unlock_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+STORE_MAGIC = b"WXCOLS\x00\x00"
+STORE_VERSION = 1
+
+# Log bytes compacted into one block
+COLUMN_BLOCK_SIZE = 1024 * 1024
+
+# Bytes of the log start whose checksum tells a rewritten log from the compacted one
+SIGNATURE_BYTES = 4096
+
+# Level codes are LOG_LEVELS values; levels it doesn't know count as INFO, as in the other tools
+LEVEL_NAMES = ("", "DEBUG", "INFO", "WARN", "ERROR")
+
+GROUP_BY = ("level", "type", "source")
+
+# Name shown for entries without the grouped field, and for values past a block's dictionary limit
+MISSING_VALUE = "(none)"
+OVERFLOW_VALUE = "(other)"
+_MAX_DICTIONARY = 0xFFFF
+_MAX_VALUE_LENGTH = 100
+
+# Column names and array type codes, in file order; every column is stored little-endian
+_COLUMNS = (("timestamp", "d"), ("offset", "I"), ("level", "B"), ("source", "H"), ("type", "H"))
+_ITEM_SIZES = {typecode: array(typecode).itemsize for _, typecode in _COLUMNS}
+_NUMPY_TYPES = {"d": "<f8", "I": "<u4", "B": "u1", "H": "<u2"}
+
+# magic, version, block size, device, inode, signature length, signature crc, generation id, header crc
+_HEADER = struct.Struct("<8sIIQQII16sI")
+# start, end, rows, min timestamp, max timestamp, dictionary bytes, one crc per column,
+# dictionary crc, block header crc
+_BLOCK = struct.Struct("<QQIddI" + "I" * len(_COLUMNS) + "II")
+
+
+class ColumnBlock(NamedTuple):
+    """One compacted range of a log and where its columns sit in the store file"""
+    start: int
+    end: int
+    rows: int
+    min_timestamp: float
+    max_timestamp: float
+    dictionary_bytes: int
+    crcs: Tuple[int, ...]
+    data_offset: int
+
+    def column(self, name: str) -> Tuple[int, int, int]:
+        """Return (file offset, byte length, crc) of a column, or of the dictionary for "dictionary" """
+        offset = self.data_offset
+        for index, (column, typecode) in enumerate(_COLUMNS):
+            length = self.rows * _ITEM_SIZES[typecode]
+            if column == name:
+                return offset, length, self.crcs[index]
+            offset += length
+        return offset, self.dictionary_bytes, self.crcs[-1]
+
+    @property
+    def size(self) -> int:
+        """Bytes the block takes in the store file, its header included"""
+        return (_BLOCK.size + sum(self.rows * _ITEM_SIZES[typecode] for _, typecode in _COLUMNS)
+                + self.dictionary_bytes)
+
+    def overlaps(self, since: float, until: float) -> bool:
+        # NaN bounds mean no row has a timestamp, so the comparison fails as it should
+        return self.max_timestamp >= since and self.min_timestamp <= until
+
+
+class StatsResult(NamedTuple):
+    """Entry counts keyed by (bucket number, group value), and how many rows came from where"""
+    counts: Counter
+    compacted_rows: int
+    scanned_rows: int
+
+
+def level_code(level: Any) -> int:
+    return LOG_LEVELS.get(level.upper() if isinstance(level, str) else "INFO", 2)
+
+
+def group_value(value: Any) -> Optional[str]:
+    """The string a source or type value is grouped under; None when it is missing"""
+    if value is None:
+        return None
+    return (value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))[:_MAX_VALUE_LENGTH]
+
+
+def count_lines(lines: Iterable[Tuple[int, bytes]], since: float, until: float, bucket_ms: float,
+                group_by: str, counts: Counter) -> int:
+    """Add the entries of raw log lines to ``counts``; returns the number counted"""
+    rows = 0
+    for _, line in lines:
+        entry = decode_entry(line)
+        if entry is None:
+            continue
+        timestamp = entry_timestamp(entry)
+        if timestamp is None or not since <= timestamp <= until:
+            continue
+        if group_by == "level":
+            key = LEVEL_NAMES[level_code(entry.get("level"))]
+        else:
+            key = group_value(entry.get(group_by)) or MISSING_VALUE
+        counts[(int(timestamp // bucket_ms), key)] += 1
+        rows += 1
+    return rows
+
+
+def _column_bytes(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_array(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+class _BlockBuilder:
+    """Collects the rows of one block"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        self.dictionary: List[Optional[str]] = [None]
+        self.codes: Dict[Optional[str], int] = {None: 0}
+
+    def add(self, offset: int, entry: Dict[str, Any]) -> None:
+        timestamp = entry_timestamp(entry)
+        self.columns["timestamp"].append(math.nan if timestamp is None else timestamp)
+        self.columns["offset"].append(offset - self.start)
+        self.columns["level"].append(level_code(entry.get("level")))
+        self.columns["source"].append(self._code(group_value(entry.get("source"))))
+        self.columns["type"].append(self._code(group_value(entry.get("type"))))
+
+    def _code(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            if len(self.dictionary) >= _MAX_DICTIONARY - 1:
+                # The last code is kept for everything that doesn't fit
+                value = OVERFLOW_VALUE
+                code = self.codes.get(value)
+            if code is None:
+                code = len(self.dictionary)
+                self.dictionary.append(value)
+                self.codes[value] = code
+        return code
+
+    def encode(self, end: int) -> bytes:
+        timestamps = [timestamp for timestamp in self.columns["timestamp"] if not math.isnan(timestamp)]
+        min_timestamp = min(timestamps) if timestamps else math.nan
+        max_timestamp = max(timestamps) if timestamps else math.nan
+        parts = [_column_bytes(self.columns[name]) for name, _ in _COLUMNS]
+        parts.append(json.dumps(self.dictionary, ensure_ascii=False).encode("utf-8"))
+        fields = (self.start, end, len(self.columns["timestamp"]), min_timestamp, max_timestamp, len(parts[-1]),
+                  *(zlib.crc32(part) for part in parts))
+        header = _BLOCK.pack(*fields, 0)
+        return _BLOCK.pack(*fields, zlib.crc32(header[:-4])) + b"".join(parts)
+
+
+def _read_blocks(f, position: int, size: int, expected_start: int) -> Tuple[List[ColumnBlock], int, bool]:
+    """Read consecutive block headers from ``position``; returns (blocks, next position, corrupt)
+
+    Only the headers are read; each column is checked against its own crc when
+    a query reads it. A block extending past ``size`` is still being written
+    and ends the list.
+    """
+    blocks = []
+    while position + _BLOCK.size <= size:
+        f.seek(position)
+        header = f.read(_BLOCK.size)
+        fields = _BLOCK.unpack(header)
+        start, end, rows, min_timestamp, max_timestamp, dictionary_bytes = fields[:6]
+        if zlib.crc32(header[:-4]) != fields[-1] or start != expected_start or end <= start:
+            return blocks, position, True
+        block = ColumnBlock(start, end, rows, min_timestamp, max_timestamp, dictionary_bytes, fields[6:-1],
+                            position + _BLOCK.size)
+        if position + block.size > size:
+            break
+        blocks.append(block)
+        expected_start = end
+        position += block.size
+    return blocks, position, False
+
+
+class ColumnStore:
+    """Reader and incremental builder for the column blocks of one log file or rotated segment
+
+    Like the trigram index, the store is a checksummed header followed by
+    appended blocks, built under a file lock by one process and read by all.
+    The store of the active log is rebuilt when the log's inode changes, it
+    shrinks below what was compacted, or its first bytes change. A segment
+    never changes, so its store is complete once it covers the whole segment.
+    """
+
+    def __init__(self, log_path: Union[str, Path], segment: Optional[Segment] = None):
+        self.log_path = Path(log_path)
+        self.segment = segment
+        name = segment.name if segment is not None else self.log_path.name
+        self.store_path = self.log_path.with_name(name + ".cols")
+        self.lock_path = self.store_path.with_name(self.store_path.name + ".lock")
+        self._lock = threading.Lock()
+        # Reader state: blocks loaded so far from the store file
+        self._blocks: List[ColumnBlock] = []
+        self._header: Optional[bytes] = None
+        self._read_position = 0
+        # Builder state: where the last update left off, to skip re-validation
+        self._built: Optional[Tuple[bytes, int, int]] = None
+
+    def _identity(self) -> Optional[Tuple[int, int, int]]:
+        """(device, inode, size) of the compacted file; None while there is nothing to compact"""
+        if self.segment is None:
+            try:
+                stat = os.stat(self.log_path)
+            except FileNotFoundError:
+                return None
+            return stat.st_dev, stat.st_ino, stat.st_size
+        # Segments are renamed when compressed, so only their contents identify them
+        return None if self.segment.size is None else (0, 0, self.segment.size)
+
+    def _read_signature(self, length: int) -> bytes:
+        if self.segment is None:
+            with open(self.log_path, "rb") as f:
+                return f.read(length)
+        with open_segment(self.segment) as f:
+            return f.read(length)
+
+    def lines(self, start: int, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        """(offset, line) pairs of the compacted file from ``start`` up to ``end``"""
+        if self.segment is None:
+            return iter_lines(self.log_path, start, end)
+        lines = iter_segment_lines(self.segment, start)
+        return lines if end is None else takewhile(lambda pair: pair[0] < end, lines)
+
+    def complete(self) -> bool:
+        """True when every byte of a segment has been compacted"""
+        if self.segment is None or self.segment.size is None:
+            return False
+        blocks = self.blocks()
+        return blocks is not None and (blocks[-1].end if blocks else 0) >= self.segment.size
+
+    # ------------------------------------------------------------------
+    # Building
+
+    def update(self, stop: Optional[threading.Event] = None) -> bool:
+        """Compact complete blocks added since the last update; False if another process holds the lock"""
+        identity = self._identity()
+        if identity is None:
+            return True
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not try_lock_file(lock_fd):
+                return False
+            try:
+                self._update_locked(identity, stop)
+            finally:
+                unlock_file(lock_fd)
+        finally:
+            os.close(lock_fd)
+        return True
+
+    def _update_locked(self, identity: Tuple[int, int, int], stop: Optional[threading.Event]) -> None:
+        resume = self._resume_point(identity)
+        if resume is None:
+            logger.info(f"Rebuilding column store {self.store_path}")
+            self._write_header(identity)
+            resume = (0, _HEADER.size)
+        start, store_size = resume
+
+        with open(self.store_path, "r+b") as store_file:
+            store_file.truncate(store_size)
+            store_file.seek(store_size)
+            for block in self._build_blocks(start, identity[2]):
+                store_file.write(block)
+                store_file.flush()
+                start = _BLOCK.unpack_from(block)[1]
+                store_size += len(block)
+                if stop is not None and stop.is_set():
+                    break
+            store_file.seek(0)
+            header = store_file.read(_HEADER.size)
+        self._built = (header, start, store_size)
+
+    def _resume_point(self, identity: Tuple[int, int, int]) -> Optional[Tuple[int, int]]:
+        """Return (log offset, store size) to continue from, or None to rebuild"""
+        try:
+            store_size = os.stat(self.store_path).st_size
+            with open(self.store_path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if not self._check_header(header, identity):
+            return None
+
+        if self._built is not None:
+            built_header, end, built_size = self._built
+            if built_header == header and store_size == built_size and end <= identity[2]:
+                return end, built_size
+
+        # Another process may have compacted part of the log; verify what's there
+        with open(self.store_path, "rb") as f:
+            blocks, position, corrupt = _read_blocks(f, _HEADER.size, store_size, 0)
+        if corrupt or (blocks and blocks[-1].end > identity[2]):
+            return None
+        # A block cut short by a crash is dropped by truncating to `position`
+        return (blocks[-1].end if blocks else 0), position
+
+    def _build_blocks(self, start: int, size: int) -> Iterator[bytes]:
+        builder = _BlockBuilder(start)
+        for offset, line in self.lines(start):
+            line_end = offset + len(line) + 1
+            if line_end > size:
+                if self.segment is None:
+                    break  # No newline yet: the line is still being written
+                line_end = size  # The last line of a segment may lack a newline
+            entry = decode_entry(line)
+            if entry is not None:
+                builder.add(offset, entry)
+            if line_end - builder.start >= COLUMN_BLOCK_SIZE or (self.segment is not None and line_end >= size):
+                yield builder.encode(line_end)
+                builder = _BlockBuilder(line_end)
+
+    def _write_header(self, identity: Tuple[int, int, int]) -> None:
+        signature = self._read_signature(SIGNATURE_BYTES)
+        fields = (STORE_MAGIC, STORE_VERSION, COLUMN_BLOCK_SIZE, identity[0], identity[1],
+                  len(signature), zlib.crc32(signature), uuid.uuid4().bytes)
+        header = _HEADER.pack(*fields, 0)
+        header = _HEADER.pack(*fields, zlib.crc32(header[:-4]))
+        tmp_path = self.store_path.with_name(self.store_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+        os.replace(tmp_path, self.store_path)
+
+    def _check_header(self, header: bytes, identity: Tuple[int, int, int]) -> bool:
+        if len(header) < _HEADER.size:
+            return False
+        magic, version, block_size, device, inode, signature_length, signature_crc, _, header_crc = \
+            _HEADER.unpack(header)
+        if (magic != STORE_MAGIC or version != STORE_VERSION or block_size != COLUMN_BLOCK_SIZE
+                or zlib.crc32(header[:-4]) != header_crc):
+            return False
+        if (device, inode) != identity[:2] or identity[2] < signature_length:
+            return False
+        return zlib.crc32(self._read_signature(signature_length)) == signature_crc
+
+    # ------------------------------------------------------------------
+    # Queries
+
+    def blocks(self) -> Optional[List[ColumnBlock]]:
+        """Blocks compacted so far, reading only headers appended since the last call; None when stale"""
+        with self._lock:
+            identity = self._identity()
+            if identity is None:
+                return None
+            try:
+                with open(self.store_path, "rb") as f:
+                    header = f.read(_HEADER.size)
+                    if header != self._header:
+                        if not self._check_header(header, identity):
+                            self._header = None
+                            return None
+                        self._header = header
+                        self._blocks = []
+                        self._read_position = _HEADER.size
+                    expected_start = self._blocks[-1].end if self._blocks else 0
+                    blocks, position, corrupt = _read_blocks(f, self._read_position, os.fstat(f.fileno()).st_size,
+                                                             expected_start)
+            except FileNotFoundError:
+                self._header = None
+                return None
+            if corrupt:
+                self._header = None
+                return None
+            self._blocks.extend(blocks)
+            self._read_position = position
+            if self._blocks and self._blocks[-1].end > identity[2]:
+                return None
+            return self._blocks
+
+    def aggregate(self, since: float, until: float, bucket_ms: float, group_by: str, counts: Counter,
+                  start: int = 0, end: Optional[int] = None) -> Tuple[int, int, int]:
+        """Add the compacted entries in [since, until] that lie in bytes ``[start, end)`` to ``counts``
+
+        Returns (compacted bytes, rows counted from columns, rows scanned from
+        the log); the caller scans what lies past the compacted bytes. A block
+        whose columns fail their checksum is scanned from the log instead.
+        """
+        blocks = self.blocks()
+        if not blocks:
+            return 0, 0, 0
+        compacted_rows = scanned_rows = 0
+        with open(self.store_path, "rb") as f:
+            for block in blocks:
+                if block.end <= start:
+                    continue
+                if end is not None and block.start >= end:
+                    break
+                if not block.rows or not block.overlaps(since, until):
+                    continue
+                try:
+                    compacted_rows += _aggregate_block(f, block, since, until, bucket_ms, group_by, counts)
+                except ValueError as e:
+                    logger.warning(f"{e} in {self.store_path}; reading the log instead")
+                    scanned_rows += count_lines(self.lines(block.start, block.end), since, until, bucket_ms,
+                                                group_by, counts)
+        return blocks[-1].end, compacted_rows, scanned_rows
+
+
+def _read_column(f, block: ColumnBlock, name: str) -> bytes:
+    offset, length, crc = block.column(name)
+    f.seek(offset)
+    data = f.read(length)
+    count_read(len(data))
+    if len(data) != length or zlib.crc32(data) != crc:
+        raise ValueError(f"Corrupt {name} column in block at {block.start}")
+    return data
+
+
+def _aggregate_block(f, block: ColumnBlock, since: float, until: float, bucket_ms: float, group_by: str,
+                     counts: Counter) -> int:
+    """Count one block's rows in [since, until] by bucket and group; returns the rows counted"""
+    typecode = dict(_COLUMNS)[group_by]
+    timestamps = _read_column(f, block, "timestamp")
+    keys = _read_column(f, block, group_by)
+    if group_by == "level":
+        names: List[Optional[str]] = list(LEVEL_NAMES)
+    else:
+        names = json.loads(_read_column(f, block, "dictionary"))
+
+    if numpy is not None:
+        timestamp_array = numpy.frombuffer(timestamps, dtype=_NUMPY_TYPES["d"])
+        selected = (timestamp_array >= since) & (timestamp_array <= until)
+        buckets = numpy.floor_divide(timestamp_array[selected], bucket_ms).astype(numpy.int64)
+        if not len(buckets):
+            return 0
+        codes = numpy.frombuffer(keys, dtype=_NUMPY_TYPES[typecode])[selected].astype(numpy.int64)
+        first = int(buckets.min())
+        width = int(codes.max()) + 1
+        combined, totals = numpy.unique((buckets - first) * width + codes, return_counts=True)
+        block_counts = {(first + int(value) // width, int(value) % width): int(total)
+                        for value, total in zip(combined, totals)}
+    else:
+        block_counts = Counter((int(timestamp // bucket_ms), code)
+                               for timestamp, code in zip(_column_array("d", timestamps),
+                                                          _column_array(typecode, keys))
+                               if since <= timestamp <= until)
+
+    rows = 0
+    for (bucket, code), total in block_counts.items():
+        counts[(bucket, names[code] if code < len(names) and names[code] else MISSING_VALUE)] += total
+        rows += total
+    return rows
+
+
+class LogCompactor:
+    """Keeps the column stores of one log file and its rotated segments up to date
+
+    The active file is compacted in whole blocks as it grows and each rotated
+    segment once, from a background thread. ``stats`` combines the stores
+    with a direct scan of whatever they don't cover yet, so it is correct
+    whether or not the compactor is running.
+    """
+
+    def __init__(self, log_path: Union[str, Path], update_interval: float = 5.0):
+        self.log_path = Path(log_path)
+        self.update_interval = update_interval
+        self.active = ColumnStore(self.log_path)
+        self._segments: Dict[int, ColumnStore] = {}
+        self._segments_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Compact from a background thread"""
+        self._thread = threading.Thread(target=self._update_loop, name="log-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _update_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Log compaction failed: {e}")
+            self._stop_event.wait(self.update_interval)
+
+    def update(self) -> None:
+        """Compact what the active file gained and any segment not fully compacted yet"""
+        self.active.update(self._stop_event)
+        for segment in self._list_segments():
+            if self._stop_event.is_set():
+                break
+            store = self._segment_store(segment)
+            if segment.size is not None and not store.complete():
+                try:
+                    store.update(self._stop_event)
+                except FileNotFoundError:
+                    pass  # Removed by retention meanwhile
+
+    def _list_segments(self) -> List[Segment]:
+        segments = list_segments(self.log_path)
+        with self._segments_lock:
+            for seq in set(self._segments) - {segment.seq for segment in segments}:
+                del self._segments[seq]
+        return segments
+
+    def _segment_store(self, segment: Segment) -> ColumnStore:
+        with self._segments_lock:
+            store = self._segments.get(segment.seq)
+            if store is None:
+                store = self._segments[segment.seq] = ColumnStore(self.log_path, segment)
+            # The path changes once the segment is compressed, and its size once the sidecar is written
+            store.segment = segment
+            return store
+
+    def stats(self, since: float, until: float, bucket_ms: float, group_by: str,
+              window: Tuple[int, Optional[int]] = (0, None),
+              cancel: Optional[threading.Event] = None) -> StatsResult:
+        """Count the entries in [since, until] by ``bucket_ms`` time bucket and ``group_by`` value
+
+        Bucket numbers are times divided by ``bucket_ms``. ``window`` is a byte
+        range of the active file known to hold every entry of the time window,
+        such as one from its TimeIndex.
+        """
+        counts: Counter = Counter()
+        compacted_rows = scanned_rows = 0
+        for segment in self._list_segments():
+            if not segment.overlaps(since, until):
+                continue
+            store = self._segment_store(segment)
+            covered, compacted, scanned = store.aggregate(since, until, bucket_ms, group_by, counts)
+            compacted_rows += compacted
+            scanned_rows += scanned
+            if segment.size is None or covered < segment.size:
+                try:
+                    scanned_rows += count_lines(check_cancel(store.lines(covered), cancel), since, until,
+                                                bucket_ms, group_by, counts)
+                except FileNotFoundError:
+                    pass  # Removed by retention meanwhile
+
+        start, end = window
+        covered, compacted, scanned = self.active.aggregate(since, until, bucket_ms, group_by, counts, start, end)
+        compacted_rows += compacted
+        scanned_rows += scanned
+        start = max(start, covered)
+        if end is None or start < end:
+            try:
+                scanned_rows += count_lines(check_cancel(iter_lines(self.log_path, start, end), cancel), since,
+                                            until, bucket_ms, group_by, counts)
+            except FileNotFoundError:
+                pass
+        return StatsResult(counts, compacted_rows, scanned_rows)
@@ -0,0 +1,92 @@
+"""
+Opaque pagination cursors for tool results
+A cursor records where a page stopped in each log source as a byte offset
+into the log file (or into one of its rotated segments), together with the
+file's identity and a hash of the query it belongs to, so the next page
+resumes exactly there instead of rescanning from the start.
+"""
+
+import base64
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from log_segments import find_segment
+
+CURSOR_VERSION = 2
+
+
+class Cursor(NamedTuple):
+    """Position in one source: the byte offset of a line and the number of lines before it
+
+    ``segment`` is the rotated segment the offset belongs to, or None for the
+    active log file.
+    """
+    offset: int
+    line: int
+    segment: Optional[int] = None
+
+
+def next_line_offset(path: Union[str, Path], offset: int) -> int:
+    """Return the offset just past the line that starts at ``offset``"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return offset + len(f.readline())
+
+
+def _query_hash(kind: str, query: Any) -> str:
+    text = json.dumps([kind, query], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def encode_cursor(kind: str, query: Any, positions: Dict[Path, Cursor]) -> str:
+    """Return a cursor for the ``kind`` page of ``query`` stopping at ``positions``
+
+    Sources without a position have not been read yet; the next page starts
+    them from the beginning.
+    """
+    encoded = []
+    for path, position in positions.items():
+        item = {"f": str(path), "o": position.offset, "l": position.line}
+        if position.segment is None:
+            stat = os.stat(path)
+            item.update(d=stat.st_dev, i=stat.st_ino)
+        else:
+            # Segments never change once written, so their number identifies them
+            item["s"] = position.segment
+        encoded.append(item)
+    payload = {"v": CURSOR_VERSION, "h": _query_hash(kind, query), "p": encoded}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, kind: str, query: Any) -> Dict[Path, Cursor]:
+    """Check a cursor against the log files and query; raises ValueError when it can't be used"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["v"] != CURSOR_VERSION:
+            raise ValueError
+        items = [(Path(item["f"]), int(item["o"]), int(item["l"]),
+                  None if item.get("s") is None else int(item["s"]), item) for item in payload["p"]]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid cursor") from None
+    if payload["h"] != _query_hash(kind, query):
+        raise ValueError("Cursor belongs to a different query; repeat the original arguments with it")
+
+    positions = {}
+    for path, offset, line, segment, item in items:
+        if segment is not None:
+            if find_segment(path, segment) is None:
+                raise ValueError("Cursor expired: the log segment it points into was deleted")
+        else:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                raise ValueError(f"Cursor expired: {path.name} no longer exists") from None
+            if (stat.st_dev, stat.st_ino) != (item.get("d"), item.get("i")) or stat.st_size < offset:
+                raise ValueError("Cursor expired: the log file was rotated or truncated")
+        positions[path] = Cursor(offset, line, segment)
+    return positions
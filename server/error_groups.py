@@ -0,0 +1,205 @@
+"""
+Error fingerprinting for get_error_summary
+Messages and stacks are normalized into fingerprints by stripping what changes
+between occurrences of the same problem (numbers, ids, URLs, line and column
+positions). Occurrences are counted per fingerprint with the Space-Saving
+heavy-hitter algorithm, so memory stays bounded however many distinct
+messages a log holds.
+"""
+
+import hashlib
+import heapq
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Groups tracked per level. Any group occurring more than 1/GROUP_CAPACITY of
+# the time is guaranteed to be tracked, with a count at most that far too high.
+GROUP_CAPACITY = 256
+
+# Stack frames that contribute to a fingerprint
+FINGERPRINT_FRAMES = 3
+
+# Longest sample message kept per group
+SAMPLE_CHARS = 500
+
+_URL = re.compile(r"\b[a-z][a-z0-9+.-]*://[^/\s()\"']*([^\s?#()\"']*)(?:[?#][^\s()\"']*)?", re.IGNORECASE)
+_POSITION = re.compile(r"(:\d+){1,2}(?=\)|\s|$)", re.MULTILINE)
+_ID = re.compile(r"\b(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+                 r"|0x[0-9a-f]+|(?=[0-9a-f]*\d)[0-9a-f]{8,})\b", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_DIGIT = re.compile(r"\d")
+_SPACES = re.compile(r"[ \t]+")
+
+_fingerprint_memo: Dict[Tuple[str, str, str], str] = {}
+
+
+def normalize_text(text: str) -> str:
+    """Strip URLs' hosts and queries, ids, numbers and line:column positions"""
+    # Each pass is skipped when the text can't contain what it replaces
+    if "://" in text:
+        text = _URL.sub(lambda match: "<url>" + match.group(1), text)
+    if _DIGIT.search(text) is not None:
+        if ":" in text:
+            text = _POSITION.sub("", text)
+        text = _ID.sub("<id>", text)
+        text = _NUMBER.sub("<n>", text)
+    if "  " in text or "\t" in text:
+        text = _SPACES.sub(" ", text)
+    return text.strip()
+
+
+def fingerprint(level: str, message: str, stack: Any = None) -> str:
+    """Return a short key shared by occurrences of the same error"""
+    stack_text = stack if isinstance(stack, str) else ""
+    memo_key = (level, message, stack_text)
+    key = _fingerprint_memo.get(memo_key)
+    if key is not None:
+        return key
+
+    frames = [line.strip() for line in stack_text.splitlines()[1:] if line.strip()][:FINGERPRINT_FRAMES]
+    normalized = "\n".join([level, normalize_text(message)] + [normalize_text(frame) for frame in frames])
+    key = hashlib.blake2b(normalized.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+    if len(_fingerprint_memo) >= 4096:
+        _fingerprint_memo.clear()
+    _fingerprint_memo[memo_key] = key
+    return key
+
+
+class ErrorGroup:
+    """Occurrences of one fingerprint
+
+    ``count`` may overstate the true number by up to ``error``, the count of
+    the group this one replaced when it started being tracked.
+    """
+
+    __slots__ = ("key", "count", "error", "first_seen", "last_seen", "sample")
+
+    def __init__(self, key: str, count: int, error: int, first_seen: Optional[float],
+                 last_seen: Optional[float], sample: str):
+        self.key = key
+        self.count = count
+        self.error = error
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.sample = sample
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ErrorGroup":
+        return cls(data["key"], data["count"], data["error"], data["first_seen"], data["last_seen"],
+                   data["sample"])
+
+
+def _earliest(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _latest(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return b if a is None else a if b is None else max(a, b)
+
+
+class ErrorGroups:
+    """Space-Saving top-K counter of error fingerprints
+
+    Tracks at most ``capacity`` groups. A new fingerprint arriving when every
+    slot is taken replaces the group with the smallest count and inherits that
+    count, which bounds how far any count can be overstated.
+    """
+
+    def __init__(self, capacity: int = GROUP_CAPACITY):
+        self.capacity = capacity
+        self.groups: Dict[str, ErrorGroup] = {}
+        self.total = 0
+        # One (count, key) entry per group; counts only grow, so an entry whose
+        # count is out of date is refreshed when it reaches the top
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    @property
+    def full(self) -> bool:
+        return len(self.groups) >= self.capacity
+
+    def add(self, level: str, message: str, stack: Any, timestamp: Optional[float]) -> None:
+        """Count one occurrence"""
+        self.total += 1
+        key = fingerprint(level, message, stack)
+        group = self.groups.get(key)
+        if group is not None:
+            group.count += 1
+            group.first_seen = _earliest(group.first_seen, timestamp)
+            group.last_seen = _latest(group.last_seen, timestamp)
+            group.sample = message[:SAMPLE_CHARS]
+            return
+
+        count = error = 0
+        if self.full:
+            evicted = self._pop_smallest()
+            count = error = evicted.count
+        group = ErrorGroup(key, count + 1, error, timestamp, timestamp, message[:SAMPLE_CHARS])
+        self.groups[key] = group
+        heapq.heappush(self._heap, (group.count, key))
+
+    def merge(self, other: "ErrorGroups") -> "ErrorGroups":
+        """Return the groups of this summary followed by ``other``'s
+
+        A fingerprint missing from a full summary may still have occurred there
+        up to its smallest count times, so that much is added to its count and
+        error bound.
+        """
+        floor_self = self._smallest_count() if self.full else 0
+        floor_other = other._smallest_count() if other.full else 0
+        merged: List[ErrorGroup] = []
+        for key in self.groups.keys() | other.groups.keys():
+            mine, theirs = self.groups.get(key), other.groups.get(key)
+            count = (mine.count if mine else floor_self) + (theirs.count if theirs else floor_other)
+            error = (mine.error if mine else floor_self) + (theirs.error if theirs else floor_other)
+            first_seen = _earliest(mine.first_seen if mine else None, theirs.first_seen if theirs else None)
+            last_seen = _latest(mine.last_seen if mine else None, theirs.last_seen if theirs else None)
+            sample = theirs.sample if theirs else mine.sample
+            merged.append(ErrorGroup(key, count, error, first_seen, last_seen, sample))
+        result = ErrorGroups(max(self.capacity, other.capacity))
+        result.total = self.total + other.total
+        result._load(heapq.nlargest(result.capacity, merged, key=lambda group: group.count))
+        return result
+
+    def top(self, count: int) -> List[ErrorGroup]:
+        """Return the ``count`` most frequent groups, most frequent first"""
+        return heapq.nlargest(count, self.groups.values(), key=lambda group: (group.count, group.last_seen or 0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "total": self.total,
+                "groups": [group.to_dict() for group in self.groups.values()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ErrorGroups":
+        result = cls(data["capacity"])
+        result.total = data["total"]
+        result._load(ErrorGroup.from_dict(group) for group in data["groups"])
+        return result
+
+    def _load(self, groups: Iterable[ErrorGroup]) -> None:
+        self.groups = {group.key: group for group in groups}
+        self._heap = [(group.count, group.key) for group in self.groups.values()]
+        heapq.heapify(self._heap)
+
+    def _pop_smallest(self) -> ErrorGroup:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            group = self.groups[key]
+            if group.count == count:
+                del self.groups[key]
+                return group
+            heapq.heappush(self._heap, (group.count, key))
+
+    def _smallest_count(self) -> int:
+        while self._heap:
+            count, key = self._heap[0]
+            group = self.groups[key]
+            if group.count == count:
+                return count
+            heapq.heapreplace(self._heap, (group.count, key))
+        return 0
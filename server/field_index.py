@@ -0,0 +1,521 @@
+"""
+Secondary indexes on top-level entry fields for `where` filters
+For each hot field (source and type unless WECHAT_INDEXED_FIELDS says
+otherwise) the index maps every value seen in a line-aligned chunk of the log
+to the lines holding it, as line numbers and byte offsets. Equality and prefix
+filters on those fields then read only the candidate lines instead of the
+whole file. Like the trigram index it lives next to the log
+(wechat_logs.log.fidx), is built in the background under a file lock and is
+shared by every mcp-server.py process. Filters on other fields, and rotated
+segments, fall back to a full scan.
+"""
+
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import uuid
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from log_reader import decode_entry, iter_lines, iter_lines_reverse
+from metrics import count_read
+from search_index import try_lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"WXFIDX\x00\x00"
+INDEX_VERSION = 1
+
+# Log bytes covered by one index record
+FIELD_CHUNK_SIZE = 1024 * 1024
+
+# Bytes of the log start whose checksum tells a rewritten log from the indexed one
+SIGNATURE_BYTES = 4096
+
+# Strings are indexed by their first characters; longer values share a key and
+# are told apart when the candidate lines are decoded
+MAX_KEY_LENGTH = 256
+
+# A chunk is read whole rather than line by line once this share of its lines are candidates
+DENSE_FRACTION = 0.125
+
+# magic, version, chunk size, fields crc, device, inode, signature length,
+# signature crc, generation id, header crc
+_HEADER = struct.Struct("<8sIIIQQII16sI")
+# start, end, first line, line count, directory bytes, posting count, postings crc, record crc
+_RECORD = struct.Struct("<QQQIIIII")
+# Each posting is a (line, offset) pair relative to its chunk, two little-endian uint32
+_POSTING_BYTES = 8
+
+
+class FieldFilter(NamedTuple):
+    """One `where` condition: a top-level field equal to a value, or a string field starting with one"""
+    field: str
+    value: Any
+    prefix: bool = False
+
+    def matches(self, entry: Dict[str, Any]) -> bool:
+        actual = entry.get(self.field)
+        if self.prefix:
+            return isinstance(actual, str) and actual.startswith(self.value)
+        return _kind(actual) == _kind(self.value) and actual == self.value
+
+    def describe(self) -> str:
+        return f"{self.field}^={self.value!r}" if self.prefix else f"{self.field}={self.value!r}"
+
+
+def _kind(value: Any) -> str:
+    # True == 1 in Python but not in a log filter
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    return type(value).__name__
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, bool, int)) or (isinstance(value, float) and math.isfinite(value))
+
+
+def parse_where(where: Any) -> Tuple[FieldFilter, ...]:
+    """Read a tool's `where` argument; raises ValueError when it is malformed
+
+    Each key is a top-level field name. A plain value (string, number, boolean
+    or null) asks for equality, ``{"eq": value}`` spells the same explicitly,
+    and ``{"prefix": "text"}`` matches strings starting with the text.
+    """
+    if where is None:
+        return ()
+    if not isinstance(where, dict):
+        raise ValueError("'where' must be an object mapping field names to values")
+    filters = []
+    for field, condition in where.items():
+        if isinstance(condition, dict):
+            if set(condition) == {"prefix"} and isinstance(condition["prefix"], str):
+                filters.append(FieldFilter(field, condition["prefix"], True))
+                continue
+            if set(condition) == {"eq"} and _is_scalar(condition["eq"]):
+                filters.append(FieldFilter(field, condition["eq"]))
+                continue
+        elif _is_scalar(condition):
+            filters.append(FieldFilter(field, condition))
+            continue
+        raise ValueError(f"'where.{field}' must be a string, number, boolean or null, "
+                         f"{{\"eq\": value}} or {{\"prefix\": \"text\"}}")
+    return tuple(filters)
+
+
+def decode_candidates(lines: Iterable[Tuple[int, int, bytes]]) -> Iterator[Tuple[int, Dict[str, Any], int]]:
+    """Decode candidate lines into the (line_num, entry, offset) triples the scan engine produces"""
+    for line_num, offset, line in lines:
+        entry = decode_entry(line)
+        if entry is not None:
+            yield line_num, entry, offset
+
+
+def value_key(value: Any) -> Optional[str]:
+    """The key a field value is indexed under; None for values that aren't indexed"""
+    if isinstance(value, str):
+        return "s:" + value[:MAX_KEY_LENGTH]
+    if isinstance(value, bool):
+        return "b:" + ("1" if value else "0")
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return "n:" + repr(float(value))
+    return None
+
+
+class IndexChunk(NamedTuple):
+    """One indexed range of the log: field -> key -> (first posting, posting count)"""
+    start: int
+    end: int
+    first_line: int
+    line_count: int
+    posting_count: int
+    postings_crc: int
+    postings_offset: int
+    directory: Dict[str, Dict[str, Tuple[int, int]]]
+
+
+def _encode_record(start: int, end: int, first_line: int, line_count: int,
+                   postings: Dict[Tuple[str, str], array]) -> bytes:
+    directory = []
+    blobs = []
+    posting_count = 0
+    for (field, key), pairs in sorted(postings.items()):
+        directory.append([field, key, len(pairs) // 2])
+        posting_count += len(pairs) // 2
+        if sys.byteorder == "big":
+            pairs.byteswap()
+        blobs.append(pairs.tobytes())
+    directory_bytes = json.dumps(directory, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    postings_bytes = b"".join(blobs)
+    fields = (start, end, first_line, line_count, len(directory_bytes), posting_count, zlib.crc32(postings_bytes))
+    crc = zlib.crc32(directory_bytes, zlib.crc32(_RECORD.pack(*fields, 0)[:-4]))
+    return _RECORD.pack(*fields, crc) + directory_bytes + postings_bytes
+
+
+def _read_records(f, position: int, size: int, expected_start: int) -> Tuple[List[IndexChunk], int, bool]:
+    """Read consecutive records from ``position``; returns (chunks, next position, corrupt)
+
+    Only record headers and directories are read; postings are checked against
+    their crc when a query reads them. A record extending past ``size`` is
+    still being written and ends the list.
+    """
+    chunks = []
+    while position + _RECORD.size <= size:
+        f.seek(position)
+        header = f.read(_RECORD.size)
+        start, end, first_line, line_count, directory_bytes, posting_count, postings_crc, crc = \
+            _RECORD.unpack(header)
+        record_size = _RECORD.size + directory_bytes + posting_count * _POSTING_BYTES
+        if position + record_size > size:
+            break
+        directory_data = f.read(directory_bytes)
+        if (zlib.crc32(directory_data, zlib.crc32(header[:-4])) != crc or start != expected_start
+                or end <= start):
+            return chunks, position, True
+        directory: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        first = 0
+        for field, key, count in json.loads(directory_data):
+            directory.setdefault(field, {})[key] = (first, count)
+            first += count
+        chunks.append(IndexChunk(start, end, first_line, line_count, posting_count, postings_crc,
+                                 position + _RECORD.size + directory_bytes, directory))
+        expected_start = end
+        position += record_size
+    return chunks, position, False
+
+
+class FieldIndex:
+    """Reader and incremental builder for the on-disk field index
+
+    The file holds a fixed header followed by one record per chunk, each with
+    its own checksums. Records are only ever appended; a rebuild rewrites the
+    header with a new generation id so readers in other processes notice and
+    reload. The index is considered stale when the log's inode changes, the
+    log shrinks below the indexed size, its first bytes no longer match, or
+    the set of indexed fields changes.
+    """
+
+    def __init__(self, log_path: Union[str, Path], fields: Sequence[str], update_interval: float = 2.0):
+        self.log_path = Path(log_path)
+        self.fields = tuple(sorted(set(fields)))
+        self.index_path = self.log_path.with_name(self.log_path.name + ".fidx")
+        self.lock_path = self.index_path.with_name(self.index_path.name + ".lock")
+        self.update_interval = update_interval
+        self._fields_crc = zlib.crc32("\n".join(self.fields).encode("utf-8"))
+        self._lock = threading.Lock()
+        # Reader state: records loaded so far from the index file
+        self._chunks: List[IndexChunk] = []
+        self._header: Optional[bytes] = None
+        self._read_position = 0
+        # Builder state: where the last update left off, to skip re-validation
+        self._built: Optional[Tuple[bytes, int, int, int]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Background building
+
+    def start(self) -> None:
+        """Keep the index up to date from a background thread"""
+        self._thread = threading.Thread(target=self._update_loop, name="field-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _update_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Field index update failed: {e}")
+            self._stop_event.wait(self.update_interval)
+
+    def update(self) -> bool:
+        """Index complete chunks appended to the log; False if another process holds the lock"""
+        if not self.log_path.exists():
+            return True
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not try_lock_file(lock_fd):
+                return False
+            try:
+                self._update_locked()
+            finally:
+                unlock_file(lock_fd)
+        finally:
+            os.close(lock_fd)
+        return True
+
+    def _update_locked(self) -> None:
+        stat = os.stat(self.log_path)
+        resume = self._resume_point(stat)
+        if resume is None:
+            logger.info(f"Rebuilding field index {self.index_path}")
+            self._write_header(stat)
+            resume = (0, 0, _HEADER.size)
+        start, first_line, index_size = resume
+
+        with open(self.index_path, "r+b") as index_file:
+            index_file.truncate(index_size)
+            index_file.seek(index_size)
+            for record in self._build_records(start, first_line, stat.st_size):
+                index_file.write(record)
+                index_file.flush()
+                start, end, first_line, line_count = _RECORD.unpack_from(record)[:4]
+                start, first_line = end, first_line + line_count
+                index_size += len(record)
+                if self._stop_event.is_set():
+                    break
+            index_file.seek(0)
+            header = index_file.read(_HEADER.size)
+        self._built = (header, start, first_line, index_size)
+
+    def _resume_point(self, stat: os.stat_result) -> Optional[Tuple[int, int, int]]:
+        """Return (log offset, line number, index size) to continue from, or None to rebuild"""
+        try:
+            index_size = os.stat(self.index_path).st_size
+            with open(self.index_path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if not self._check_header(header, stat):
+            return None
+
+        if self._built is not None:
+            built_header, start, first_line, built_size = self._built
+            if built_header == header and index_size == built_size and start <= stat.st_size:
+                return start, first_line, built_size
+
+        # Another process may have built part of the index; verify what's there
+        with open(self.index_path, "rb") as f:
+            chunks, position, corrupt = _read_records(f, _HEADER.size, index_size, 0)
+        if corrupt or (chunks and chunks[-1].end > stat.st_size):
+            return None
+        if not chunks:
+            return 0, 0, _HEADER.size
+        # A record cut short by a crash is dropped by truncating to `position`
+        return chunks[-1].end, chunks[-1].first_line + chunks[-1].line_count, position
+
+    def _build_records(self, start: int, first_line: int, size: int) -> Iterator[bytes]:
+        postings: Dict[Tuple[str, str], array] = {}
+        chunk_start = start
+        line_count = 0
+        for offset, line in iter_lines(self.log_path, start=start, end=size):
+            line_end = offset + len(line) + 1
+            if line_end > size:
+                break  # No newline yet: the line is still being written
+            entry = decode_entry(line)
+            if entry is not None:
+                for field in self.fields:
+                    key = value_key(entry.get(field))
+                    if key is not None:
+                        postings.setdefault((field, key), array("I")).extend((line_count, offset - chunk_start))
+            line_count += 1
+            if line_end - chunk_start >= FIELD_CHUNK_SIZE:
+                yield _encode_record(chunk_start, line_end, first_line, line_count, postings)
+                first_line += line_count
+                chunk_start = line_end
+                line_count = 0
+                postings = {}
+
+    def _write_header(self, stat: os.stat_result) -> None:
+        with open(self.log_path, "rb") as f:
+            signature = f.read(SIGNATURE_BYTES)
+        fields = (INDEX_MAGIC, INDEX_VERSION, FIELD_CHUNK_SIZE, self._fields_crc, stat.st_dev, stat.st_ino,
+                  len(signature), zlib.crc32(signature), uuid.uuid4().bytes)
+        header = _HEADER.pack(*fields, 0)
+        header = _HEADER.pack(*fields, zlib.crc32(header[:-4]))
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+        os.replace(tmp_path, self.index_path)
+
+    def _check_header(self, header: bytes, stat: os.stat_result) -> bool:
+        if len(header) < _HEADER.size:
+            return False
+        (magic, version, chunk_size, fields_crc, device, inode, signature_length, signature_crc, _,
+         header_crc) = _HEADER.unpack(header)
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION or chunk_size != FIELD_CHUNK_SIZE
+                or fields_crc != self._fields_crc or zlib.crc32(header[:-4]) != header_crc):
+            return False
+        if (device, inode) != (stat.st_dev, stat.st_ino) or stat.st_size < signature_length:
+            return False
+        with open(self.log_path, "rb") as f:
+            return zlib.crc32(f.read(signature_length)) == signature_crc
+
+    # ------------------------------------------------------------------
+    # Queries
+
+    def _usable(self, where: Sequence[FieldFilter]) -> List[FieldFilter]:
+        """The conditions the index can answer"""
+        return [condition for condition in where if condition.field in self.fields
+                and (condition.prefix or value_key(condition.value) is not None)]
+
+    def candidate_lines(self, where: Sequence[FieldFilter], start: int = 0, start_line: int = 0,
+                        end: Optional[int] = None) -> Optional[Iterator[Tuple[int, int, bytes]]]:
+        """Return an iterator of (line_num, offset, line) for lines of ``[start, end)`` that may satisfy ``where``
+
+        ``start`` must be line-aligned with ``start_line`` lines before it, and
+        line numbers count from 1 like the scan engine's. Indexed chunks yield
+        only lines whose indexed fields satisfy every indexed condition;
+        whatever lies past the last indexed chunk is yielded line by line.
+        Returns None when no condition is on an indexed field or the index is
+        missing or stale, in which case the caller scans normally.
+        """
+        conditions = self._usable(where)
+        chunks = self._load() if conditions else None
+        if chunks is None:
+            return None
+        return self._iter_candidates(chunks, conditions, start, start_line, end)
+
+    def candidate_lines_reverse(self, where: Sequence[FieldFilter], start: int = 0,
+                                end: Optional[int] = None) -> Optional[Iterator[Tuple[int, bytes]]]:
+        """Like candidate_lines, newest-first and as (offset, line) pairs"""
+        conditions = self._usable(where)
+        chunks = self._load() if conditions else None
+        if chunks is None:
+            return None
+        return self._iter_candidates_reverse(chunks, conditions, start, end)
+
+    def _iter_candidates(self, chunks: List[IndexChunk], conditions: List[FieldFilter], start: int,
+                         start_line: int, end: Optional[int]) -> Iterator[Tuple[int, int, bytes]]:
+        tail_start, tail_line = 0, 0
+        if chunks:
+            tail_start, tail_line = chunks[-1].end, chunks[-1].first_line + chunks[-1].line_count
+        with open(self.index_path, "rb") as index_file, open(self.log_path, "rb") as log_file:
+            for chunk in chunks:
+                if chunk.end <= start:
+                    continue
+                if end is not None and chunk.start >= end:
+                    return
+                for line_num, offset, line in self._chunk_lines(index_file, log_file, chunk, conditions):
+                    if offset >= start and (end is None or offset < end):
+                        yield line_num, offset, line
+
+        if tail_start < start:
+            tail_start, tail_line = start, start_line
+        if end is None or tail_start < end:
+            for line_num, (offset, line) in enumerate(iter_lines(self.log_path, tail_start, end), tail_line + 1):
+                yield line_num, offset, line
+
+    def _iter_candidates_reverse(self, chunks: List[IndexChunk], conditions: List[FieldFilter], start: int,
+                                 end: Optional[int]) -> Iterator[Tuple[int, bytes]]:
+        tail_start = max(chunks[-1].end if chunks else 0, start)
+        if end is None or tail_start < end:
+            yield from iter_lines_reverse(self.log_path, end=end, start=tail_start)
+        with open(self.index_path, "rb") as index_file, open(self.log_path, "rb") as log_file:
+            for chunk in reversed(chunks):
+                if end is not None and chunk.start >= end:
+                    continue
+                if chunk.end <= start:
+                    return
+                for _, offset, line in reversed(self._chunk_lines(index_file, log_file, chunk, conditions)):
+                    if offset >= start and (end is None or offset < end):
+                        yield offset, line
+
+    def _chunk_lines(self, index_file, log_file, chunk: IndexChunk,
+                     conditions: List[FieldFilter]) -> List[Tuple[int, int, bytes]]:
+        """Read the lines of one chunk that satisfy every indexed condition, in file order
+
+        Postings that fail their checksum make every line of the chunk a candidate.
+        """
+        spans = []
+        for condition in conditions:
+            keys = chunk.directory.get(condition.field, {})
+            if condition.prefix:
+                wanted = "s:" + condition.value[:MAX_KEY_LENGTH]
+                spans.append([span for key, span in keys.items() if key.startswith(wanted)])
+            else:
+                span = keys.get(value_key(condition.value))
+                spans.append([span] if span is not None else [])
+            if not spans[-1]:
+                return []
+
+        index_file.seek(chunk.postings_offset)
+        data = index_file.read(chunk.posting_count * _POSTING_BYTES)
+        count_read(len(data))
+        if zlib.crc32(data) != chunk.postings_crc:
+            logger.warning(f"Corrupt postings in {self.index_path} at {chunk.start}; reading the whole chunk")
+            log_file.seek(chunk.start)
+            block = log_file.read(chunk.end - chunk.start)
+            count_read(len(block))
+            lines = block.split(b"\n")[:chunk.line_count]
+            result = []
+            offset = chunk.start
+            for line_index, line in enumerate(lines):
+                result.append((chunk.first_line + line_index + 1, offset, line))
+                offset += len(line) + 1
+            return result
+        postings = array("I")
+        postings.frombytes(data)
+        if sys.byteorder == "big":
+            postings.byteswap()
+
+        selected: Optional[Set[Tuple[int, int]]] = None
+        for condition_spans in spans:
+            pairs: Set[Tuple[int, int]] = set()
+            for first, count in condition_spans:
+                values = postings[first * 2:(first + count) * 2]
+                pairs.update(zip(values[0::2], values[1::2]))
+            selected = pairs if selected is None else selected & pairs
+            if not selected:
+                return []
+
+        candidates = sorted(selected)
+        result = []
+        if len(candidates) > chunk.line_count * DENSE_FRACTION:
+            log_file.seek(chunk.start)
+            block = log_file.read(chunk.end - chunk.start)
+            count_read(len(block))
+            for line_index, relative in candidates:
+                newline = block.find(b"\n", relative)
+                result.append((chunk.first_line + line_index + 1, chunk.start + relative,
+                               block[relative:newline if newline != -1 else len(block)]))
+        else:
+            for line_index, relative in candidates:
+                log_file.seek(chunk.start + relative)
+                line = log_file.readline()
+                count_read(len(line))
+                result.append((chunk.first_line + line_index + 1, chunk.start + relative, line.rstrip(b"\n")))
+        return result
+
+    def _load(self) -> Optional[List[IndexChunk]]:
+        """Read records appended since the last call, reloading after a rebuild"""
+        with self._lock:
+            try:
+                stat = os.stat(self.log_path)
+                with open(self.index_path, "rb") as f:
+                    header = f.read(_HEADER.size)
+                    if header != self._header:
+                        if not self._check_header(header, stat):
+                            self._header = None
+                            return None
+                        self._header = header
+                        self._chunks = []
+                        self._read_position = _HEADER.size
+                    expected_start = self._chunks[-1].end if self._chunks else 0
+                    chunks, position, corrupt = _read_records(f, self._read_position, os.fstat(f.fileno()).st_size,
+                                                              expected_start)
+            except FileNotFoundError:
+                self._header = None
+                return None
+            if corrupt:
+                self._header = None
+                return None
+            self._chunks.extend(chunks)
+            self._read_position = position
+            if self._chunks and self._chunks[-1].end > stat.st_size:
+                return None
+            return self._chunks
@@ -0,0 +1,153 @@
+"""
+Health checks for the MCP server
+An incremental line counter for the log file and a cached, non-blocking
+probe of the log collection server, so health_check costs the same no
+matter how large the log grows.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+# Give up on the collector after this many seconds
+PROBE_TIMEOUT = 2.0
+
+# Largest collector response body read
+MAX_RESPONSE_BYTES = 1024 * 1024
+
+
+class LineCounter:
+    """Line count of a growing log file
+
+    Remembers how far it has counted and only reads bytes appended since the
+    last call. Starts over when the file is replaced or truncated. A final
+    line without a newline counts as a line.
+    """
+
+    def __init__(self, path: Union[str, Path], block_size: int = 1024 * 1024):
+        self.path = Path(path)
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, identity: Optional[Tuple[int, int]]) -> None:
+        self._identity = identity
+        self._offset = 0
+        self._newlines = 0
+        self._ends_with_newline = True
+
+    def count(self) -> Tuple[int, int]:
+        """Return (lines, size) of the file"""
+        with self._lock:
+            self._update()
+            return self._newlines + (not self._ends_with_newline), self._offset
+
+    def lines_before(self, offset: int) -> int:
+        """Return the number of lines before the line-aligned byte ``offset``
+
+        Only the bytes between ``offset`` and the end of the file are read, so
+        this is cheap for offsets near the end.
+        """
+        with self._lock:
+            self._update()
+            newlines_after = 0
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                remaining = self._offset - offset
+                while remaining > 0:
+                    block = f.read(min(self.block_size, remaining))
+                    if not block:
+                        break
+                    newlines_after += block.count(b"\n")
+                    remaining -= len(block)
+            return self._newlines - newlines_after
+
+    def _update(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset(None)
+            return
+
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self._identity or stat.st_size < self._offset:
+            self._reset(identity)
+
+        if stat.st_size > self._offset:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                remaining = stat.st_size - self._offset
+                while remaining > 0:
+                    block = f.read(min(self.block_size, remaining))
+                    if not block:
+                        break
+                    self._newlines += block.count(b"\n")
+                    self._offset += len(block)
+                    self._ends_with_newline = block.endswith(b"\n")
+                    remaining -= len(block)
+
+
+def http_get(url: str, timeout: float) -> Tuple[int, bytes]:
+    """Fetch ``url`` with a blocking GET; returns (status, body), also for HTTP error statuses"""
+    request = urllib.request.Request(url, headers={"Accept": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read(MAX_RESPONSE_BYTES)
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+
+
+class CollectorProbe:
+    """Cached health probe of the log collection server
+
+    Results are reused for ``ttl`` seconds. Callers arriving while a probe is
+    running share it, and a caller that is cancelled does not cancel the probe.
+    """
+
+    def __init__(self, url: str, ttl: float, timeout: float = PROBE_TIMEOUT):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._running: Optional[asyncio.Future] = None
+
+    async def status(self) -> Dict[str, Any]:
+        """Return the collector's health, probing it if the cached result is stale"""
+        if self._result is not None and time.monotonic() - self._checked_at < self.ttl:
+            return dict(self._result)
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._probe())
+        return dict(await asyncio.shield(self._running))
+
+    async def _probe(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"url": self.url}
+        try:
+            # urllib blocks, so the request runs on a worker thread
+            status, body = await asyncio.wait_for(asyncio.to_thread(http_get, self.url, self.timeout),
+                                                  self.timeout + 1)
+            if status == 200:
+                result["status"] = "healthy"
+                result["details"] = json.loads(body)
+            else:
+                result["status"] = f"unhealthy (HTTP {status})"
+        except Exception as e:
+            reason = e.reason if isinstance(e, urllib.error.URLError) else e
+            if isinstance(reason, ConnectionRefusedError):
+                result["status"] = "connection_refused"
+            elif isinstance(reason, (asyncio.TimeoutError, socket.timeout)):
+                result["status"] = "timeout"
+            else:
+                result["status"] = f"error: {str(reason)}"
+        result["checked_at"] = time.time()
+        self._result = result
+        self._checked_at = time.monotonic()
+        self._running = None
+        return result
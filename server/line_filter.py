@@ -0,0 +1,133 @@
+"""
+Byte-level prefilters for raw log lines
+Cheap checks run on a line's raw bytes before it is JSON-decoded. Every filter
+is a necessary condition for the structured check that follows: a line it
+rejects can never match, so results are identical to decoding every line.
+"""
+
+import re
+from typing import Any, Callable, Optional, Sequence
+
+# `"level":"warn"` / `"level":"error"` in any ASCII case. No non-ASCII character
+# upper-cases to a plain-ASCII WARN or ERROR, so this can't miss a real match.
+_LEVEL_PATTERNS = {
+    3: re.compile(rb'"level"\s*:\s*"(?:warn|error)"', re.IGNORECASE),
+    4: re.compile(rb'"level"\s*:\s*"error"', re.IGNORECASE),
+}
+
+# Characters outside the query fragments the substring prefilter checks. Spaces,
+# quotes, backslashes and container punctuation render differently in the JSON
+# text than in Python's str() of nested values (e.g. `[1, 2]` vs `[1,2]`).
+_UNSAFE_QUERY_CHARS = re.compile(r"[^a-z0-9!#$%&()*+\-./;<=>?@^_`|~]+")
+_NUMBER_CHARS = frozenset("0123456789.e+-")
+
+# The only non-ASCII characters whose lower-case form contains ASCII letters:
+# KELVIN SIGN -> "k" and LATIN CAPITAL LETTER I WITH DOT ABOVE -> "i̇"
+_ASCII_LOWERING = {"k": "K".encode("utf-8"), "i": "İ".encode("utf-8")}
+
+# Characters JSON writes as escapes inside a string
+_JSON_ESCAPED = re.compile(r'["\\\x00-\x1f\x7f-\x9f\u2028\u2029]')
+
+LinePrefilter = Callable[[bytes], bool]
+
+
+def level_prefilter(min_level: int) -> Optional[LinePrefilter]:
+    """Return a filter for lines that can have a level of at least ``min_level``
+
+    Entries without a level count as INFO, so only WARN and ERROR thresholds
+    can be checked on the raw bytes. Lines using JSON \\u escapes are always
+    passed through, since the level may be spelled with one.
+    """
+    pattern = _LEVEL_PATTERNS.get(min_level)
+    if pattern is None:
+        return None
+    search = pattern.search
+
+    def check(line: bytes) -> bool:
+        return search(line) is not None or b"\\u" in line
+
+    return check
+
+
+def query_prefilter(query: str) -> Optional[LinePrefilter]:
+    """Return a filter for lines whose searchable text can contain ``query``
+
+    ``query`` must already be lower-cased. The query is cut at characters that
+    may render differently in the JSON text than in the str() of decoded values
+    (spaces, quotes, container punctuation, non-ASCII), and every remaining
+    fragment must then appear in the case-folded raw line. Fragments made only
+    of number, None or infinity characters are ignored, because Python spells
+    those values differently from JSON. Lines where the two texts can still
+    disagree (JSON escapes, non-printable characters that repr() escapes, or
+    characters that lower-case to ASCII letters) are passed through.
+    """
+    fragments = []
+    for fragment in _UNSAFE_QUERY_CHARS.split(query):
+        if not fragment or set(fragment) <= _NUMBER_CHARS or fragment in "none" or fragment in "-inf":
+            continue
+        fragments.append(fragment.encode("ascii"))
+    if not fragments:
+        return None
+    lowering = [encoded for letter, encoded in _ASCII_LOWERING.items()
+                if any(letter.encode("ascii") in fragment for fragment in fragments)]
+    check_slash = any(b"/" in fragment for fragment in fragments)
+
+    def check(line: bytes) -> bool:
+        folded = line.lower()
+        if all(fragment in folded for fragment in fragments):
+            return True
+        if b"\\u" in line or b"\x7f" in line or (check_slash and b"\\/" in line):
+            return True
+        if not line.isascii():
+            if any(encoded in line for encoded in lowering):
+                return True
+            try:
+                return not line.decode("utf-8").isprintable()
+            except UnicodeDecodeError:
+                return False
+        return False
+
+    return check
+
+
+def field_prefilter(where: Sequence[Any]) -> Optional[LinePrefilter]:
+    """Return a filter for lines that can satisfy every string condition of a `where` filter
+
+    An equality or prefix condition (see field_index.FieldFilter) on a string
+    needs `"field":"value` in the raw line, without the closing quote for a
+    prefix. Conditions whose field or value JSON would escape, and conditions
+    on other types, are not checked here. Lines using JSON \\u escapes, or
+    \\/ when a slash is involved, are always passed through.
+    """
+    patterns = []
+    check_slash = False
+    for condition in where:
+        if not isinstance(condition.value, str) or _JSON_ESCAPED.search(condition.field + condition.value):
+            continue
+        field = re.escape(condition.field.encode("utf-8"))
+        value = re.escape(condition.value.encode("utf-8"))
+        check_slash = check_slash or "/" in condition.field + condition.value
+        patterns.append(re.compile(b'"' + field + rb'"\s*:\s*"' + value + (b"" if condition.prefix else b'"')).search)
+    if not patterns:
+        return None
+
+    def check(line: bytes) -> bool:
+        if all(search(line) is not None for search in patterns):
+            return True
+        return b"\\u" in line or (check_slash and b"\\/" in line)
+
+    return check
+
+
+def combine_prefilters(*prefilters: Optional[LinePrefilter]) -> Optional[LinePrefilter]:
+    """Return a filter that passes a line only when every given filter does"""
+    active = [prefilter for prefilter in prefilters if prefilter is not None]
+    if not active:
+        return None
+    if len(active) == 1:
+        return active[0]
+
+    def check(line: bytes) -> bool:
+        return all(prefilter(line) for prefilter in active)
+
+    return check
@@ -9,6 +9,9 @@ const bodyParser = require('body-parser');
 const fs = require('fs');
 const path = require('path');
 const cors = require('cors');
+const { LogRotator } = require('./log-rotator');
+const { GroupCommitWriter } = require('./log-writer');
+const { LogDeduplicator } = require('./log-dedup');
 
 const app = express();
 const port = process.env.PORT || 3001;
@@ -16,8 +19,8 @@ const port = process.env.PORT || 3001;
 // Enable CORS for requests from the WeChat Mini Program
 app.use(cors());
 
-// Parse JSON bodies
-app.use(bodyParser.json());
+// Parse JSON bodies; batches need more room than the default 100kb
+app.use(bodyParser.json({ limit: `${process.env.WECHAT_MAX_BODY_KB || 1024}kb` }));
 
 // Log file path - in logs directory
 const logFilePath = path.join(__dirname, '../logs/wechat_logs.log');
@@ -29,6 +32,40 @@ if (!fs.existsSync(logsDir)) {
   console.log(`✅ Created logs directory: ${logsDir}`);
 }
 
+/**
+ * Read a numeric setting from the environment; 0 disables a limit
+ */
+function envNumber(name, fallback) {
+  const value = parseFloat(process.env[name]);
+  return Number.isFinite(value) ? value : fallback;
+}
+
+// Rotate the log file into compressed segments by size or age, keeping the newest ones
+const rotator = new LogRotator(logFilePath, {
+  maxBytes: envNumber('WECHAT_SEGMENT_MAX_MB', 64) * 1024 * 1024,
+  maxAgeMs: envNumber('WECHAT_SEGMENT_MAX_AGE_HOURS', 24) * 3600 * 1000,
+  retainSegments: envNumber('WECHAT_RETENTION_SEGMENTS', 50),
+  retainMs: envNumber('WECHAT_RETENTION_DAYS', 0) * 24 * 3600 * 1000
+}).init();
+
+// Age-based rotation also applies while no logs arrive
+setInterval(() => rotator.rotateIfDue(), 60 * 1000).unref();
+
+// Lines from concurrent requests are written together; requests are answered once written
+const writer = new GroupCommitWriter(rotator, {
+  maxBatchBytes: envNumber('WECHAT_GROUP_COMMIT_KB', 256) * 1024,
+  maxDelayMs: envNumber('WECHAT_GROUP_COMMIT_MS', 0)
+});
+
+// Entries repeated by client retries and fallback replays are recognised by their id
+const dedup = new LogDeduplicator({
+  capacity: envNumber('WECHAT_DEDUP_CAPACITY', 500000),
+  falsePositiveRate: envNumber('WECHAT_DEDUP_FP_RATE', 1e-6)
+});
+
+// Largest number of entries accepted by one POST /logs/batch
+const maxBatchEntries = envNumber('WECHAT_BATCH_MAX_ENTRIES', 1000);
+
 // Health check tracking
 let healthStats = {
   startTime: Date.now(),
@@ -39,6 +76,45 @@ let healthStats = {
   logFileSize: 0
 };
 
+/**
+ * Stamp a log entry with the server time and format it as one line of JSON
+ */
+function formatEntry(logData) {
+  // Add server-side timestamp if not present
+  if (!logData.serverTimestamp) {
+    logData.serverTimestamp = Date.now();
+  }
+  return `${JSON.stringify(logData)}\n`;
+}
+
+function isEntry(logData) {
+  return Boolean(logData) && typeof logData === 'object' && !Array.isArray(logData);
+}
+
+/**
+ * Write the entries not seen before; resolves with how many were duplicates
+ */
+function persist(entries) {
+  const fresh = dedup.filter(entries);
+  return writer.writeAll(fresh.entries.map(formatEntry)).then(() => {
+    dedup.commit(fresh.ids);
+    return fresh.duplicates;
+  }, (err) => {
+    dedup.release(fresh.ids);
+    throw err;
+  });
+}
+
+function writeFailed(res, err) {
+  healthStats.errorCount++;
+  healthStats.lastError = err.message;
+  console.error('❌ Failed to write to log file:', err);
+  res.status(500).json({
+    error: 'Failed to save log',
+    message: err.message
+  });
+}
+
 /**
  * Root endpoint - API information
  */
@@ -49,7 +125,8 @@ app.get('/', (req, res) => {
     status: 'running',
     endpoints: {
       health: 'GET /health',
-      log: 'POST /log'
+      log: 'POST /log',
+      batch: 'POST /logs/batch'
     },
     uptime: Date.now() - healthStats.startTime,
     requestCount: healthStats.requestCount
@@ -82,6 +159,8 @@ app.get('/health', (req, res) => {
     const uptime = Date.now() - healthStats.startTime;
     const status = healthStats.logFileStatus === 'ok' ? 'healthy' : 'unhealthy';
 
+    const segmentStats = rotator.stats();
+
     res.status(status === 'healthy' ? 200 : 503).json({
       status: status,
       uptime: uptime,
@@ -90,6 +169,10 @@ app.get('/health', (req, res) => {
       logFileStatus: healthStats.logFileStatus,
       logFilePath: logFilePath,
       logFileSize: healthStats.logFileSize,
+      segmentCount: segmentStats.segmentCount,
+      segmentBytes: segmentStats.segmentBytes,
+      groupCommit: writer.stats,
+      dedup: dedup.stats(),
       lastError: healthStats.lastError,
       timestamp: new Date().toISOString()
     });
@@ -106,7 +189,7 @@ app.post('/log', (req, res) => {
   const logData = req.body;
   
   // Validate log data
-  if (!logData || typeof logData !== 'object') {
+  if (!isEntry(logData)) {
     healthStats.errorCount++;
     return res.status(400).json({ 
       error: 'Invalid log data',
@@ -114,32 +197,48 @@ app.post('/log', (req, res) => {
     });
   }
   
-  // Add server-side timestamp if not present
-  if (!logData.serverTimestamp) {
-    logData.serverTimestamp = Date.now();
+  // Format as single-line JSON for easy parsing and append it with the next group
+  persist([logData]).then((duplicates) => {
+    // Success - return 200, also for a copy of a log already received
+    res.status(200).json({
+      status: 'success',
+      message: duplicates ? 'Duplicate log ignored' : 'Log received'
+    });
+  }, (err) => writeFailed(res, err));
+});
+
+/**
+ * Batched log collection endpoint
+ * Receives a JSON array of log entries and appends them together, in order
+ */
+app.post('/logs/batch', (req, res) => {
+  healthStats.requestCount++;
+  
+  const entries = req.body;
+  
+  if (!Array.isArray(entries) || !entries.every(isEntry)) {
+    healthStats.errorCount++;
+    return res.status(400).json({
+      error: 'Invalid log batch',
+      message: 'Log batch must be a JSON array of objects'
+    });
+  }
+  if (maxBatchEntries && entries.length > maxBatchEntries) {
+    healthStats.errorCount++;
+    return res.status(413).json({
+      error: 'Log batch too large',
+      message: `At most ${maxBatchEntries} entries per batch`
+    });
   }
   
-  // Format as single-line JSON for easy parsing
-  const logString = `${JSON.stringify(logData)}\n`;
-
-  // Append log to file
-  fs.appendFile(logFilePath, logString, (err) => {
-    if (err) {
-      healthStats.errorCount++;
-      healthStats.lastError = err.message;
-      console.error('❌ Failed to write to log file:', err);
-      return res.status(500).json({
-        error: 'Failed to save log',
-        message: err.message
-      });
-    }
-    
-    // Success - return 200
+  persist(entries).then((duplicates) => {
     res.status(200).json({
       status: 'success',
-      message: 'Log received'
+      message: 'Logs received',
+      count: entries.length - duplicates,
+      duplicates: duplicates
     });
-  });
+  }, (err) => writeFailed(res, err));
 });
 
 /**
@@ -152,6 +251,7 @@ app.use((req, res) => {
     availableEndpoints: {
       health: 'GET /health',
       log: 'POST /log',
+      batch: 'POST /logs/batch',
       root: 'GET /'
     }
   });
@@ -180,6 +280,7 @@ app.listen(port, '127.0.0.1', () => {
   console.log('==========================================');
   console.log(`✅ Server listening at http://127.0.0.1:${port}`);
   console.log(`📁 Logs will be saved to: ${logFilePath}`);
+  console.log(`🗂️  Rotating into compressed segments at ${rotator.maxBytes / 1024 / 1024} MB or ${rotator.maxAgeMs / 3600000} h`);
   console.log(`🏥 Health check: http://127.0.0.1:${port}/health`);
   console.log('');
   console.log('Press Ctrl+C to stop the server');
@@ -191,10 +292,10 @@ app.listen(port, '127.0.0.1', () => {
  */
 process.on('SIGTERM', () => {
   console.log('\n🛑 SIGTERM received, shutting down gracefully...');
-  process.exit(0);
+  writer.flush().finally(() => process.exit(0));
 });
 
 process.on('SIGINT', () => {
   console.log('\n🛑 SIGINT received, shutting down gracefully...');
-  process.exit(0);
+  writer.flush().finally(() => process.exit(0));
 });
@@ -0,0 +1,132 @@
+/**
+ * Duplicate detection for client log ids
+ * The mini-app logger gives every entry an id, so a retried request or a
+ * replay of the fallback store can be recognised and dropped. Ids are
+ * remembered in two Bloom filter generations: new ids go into the current
+ * one, and once it holds `capacity` ids the older generation is discarded.
+ * Memory is fixed by the capacity, and the last `capacity` to `2 * capacity`
+ * ids are always recognised; an id is mistaken for a duplicate with
+ * probability `falsePositiveRate`.
+ */
+
+/**
+ * 32-bit FNV-1a of a string's UTF-16 code units
+ */
+function fnv1a(text, seed) {
+  let hash = seed;
+  for (let i = 0; i < text.length; i++) {
+    hash ^= text.charCodeAt(i);
+    hash = Math.imul(hash, 0x01000193);
+  }
+  return hash >>> 0;
+}
+
+class BloomFilter {
+  constructor(bits, hashes) {
+    this.bits = bits;
+    this.hashes = hashes;
+    this.data = new Uint8Array(Math.ceil(bits / 8));
+    this.count = 0;
+  }
+
+  _positions(id) {
+    // Double hashing: position i is h1 + i * h2
+    const h1 = fnv1a(id, 0x811c9dc5);
+    const h2 = fnv1a(id, 0x01000193) | 1;
+    const positions = [];
+    for (let i = 0; i < this.hashes; i++) {
+      positions.push((h1 + Math.imul(i, h2) >>> 0) % this.bits);
+    }
+    return positions;
+  }
+
+  has(id) {
+    return this._positions(id).every((bit) => (this.data[bit >> 3] & (1 << (bit & 7))) !== 0);
+  }
+
+  add(id) {
+    for (const bit of this._positions(id)) {
+      this.data[bit >> 3] |= 1 << (bit & 7);
+    }
+    this.count++;
+  }
+}
+
+class LogDeduplicator {
+  /**
+   * @param {object} options - capacity (ids per generation), falsePositiveRate
+   */
+  constructor(options = {}) {
+    this.capacity = Math.max(1, options.capacity || 500000);
+    const rate = options.falsePositiveRate || 1e-6;
+    this.bits = Math.ceil(-this.capacity * Math.log(rate) / (Math.LN2 * Math.LN2));
+    this.hashes = Math.max(1, Math.round(this.bits / this.capacity * Math.LN2));
+    this.current = new BloomFilter(this.bits, this.hashes);
+    this.previous = null;
+    // Ids accepted but not written yet; a copy arriving meanwhile is a duplicate too
+    this.pending = new Set();
+    this.duplicates = 0;
+  }
+
+  /**
+   * Split entries into those to write and the number of duplicates dropped.
+   * Entries without an id are always written. Call commit() or release() with
+   * the returned ids once the write finishes.
+   */
+  filter(entries) {
+    const fresh = [];
+    const ids = [];
+    for (const entry of entries) {
+      const id = typeof entry.id === 'string' || typeof entry.id === 'number' ? String(entry.id) : null;
+      if (id === null) {
+        fresh.push(entry);
+        continue;
+      }
+      if (this.pending.has(id) || this.seen(id)) {
+        this.duplicates++;
+        continue;
+      }
+      this.pending.add(id);
+      ids.push(id);
+      fresh.push(entry);
+    }
+    return { entries: fresh, ids, duplicates: entries.length - fresh.length };
+  }
+
+  seen(id) {
+    return this.current.has(id) || (this.previous !== null && this.previous.has(id));
+  }
+
+  /**
+   * Remember ids whose entries were written
+   */
+  commit(ids) {
+    for (const id of ids) {
+      this.pending.delete(id);
+      this.current.add(id);
+      if (this.current.count >= this.capacity) {
+        this.previous = this.current;
+        this.current = new BloomFilter(this.bits, this.hashes);
+      }
+    }
+  }
+
+  /**
+   * Forget ids whose write failed, so a retry is accepted
+   */
+  release(ids) {
+    for (const id of ids) {
+      this.pending.delete(id);
+    }
+  }
+
+  stats() {
+    return {
+      duplicates: this.duplicates,
+      tracked: this.current.count + (this.previous ? this.previous.count : 0),
+      memoryBytes: this.current.data.length * 2
+    };
+  }
+}
+
+module.exports = { LogDeduplicator };
@@ -0,0 +1,315 @@
+/**
+ * Segment rotation for the WeChat log file
+ * Appends go to the active file (wechat_logs.log). Once it grows past a size
+ * or age limit it is renamed to a numbered segment (wechat_logs.log.000042),
+ * gzip-compressed to wechat_logs.log.000042.gz and described by a sidecar
+ * (wechat_logs.log.000042.meta.json) recording its time range and line count,
+ * so readers can skip segments outside a query's window. The oldest segments
+ * are deleted by the retention policy.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+const { StringDecoder } = require('string_decoder');
+
+const SEGMENT_PATTERN = /^\.(\d{6})(\.gz)?$/;
+const FIRST_LINE_BYTES = 64 * 1024;
+
+/**
+ * Time of a log entry in epoch ms, preferring the collector's clock
+ */
+function entryTimestamp(entry) {
+  for (const key of ['serverTimestamp', 'timestamp']) {
+    const value = entry && entry[key];
+    let timestamp = value;
+    if (typeof value === 'string') {
+      timestamp = value.trim() !== '' && !Number.isNaN(Number(value)) ? Number(value) : Date.parse(value);
+    }
+    if (typeof timestamp === 'number' && Number.isFinite(timestamp)) {
+      return timestamp;
+    }
+  }
+  return null;
+}
+
+function lineTimestamp(line) {
+  try {
+    return entryTimestamp(JSON.parse(line));
+  } catch (e) {
+    return null;
+  }
+}
+
+class LogRotator {
+  /**
+   * @param {string} logFilePath - Active log file
+   * @param {object} options - maxBytes, maxAgeMs, retainSegments, retainMs (0 disables each limit)
+   */
+  constructor(logFilePath, options = {}) {
+    this.logFilePath = logFilePath;
+    this.dir = path.dirname(logFilePath);
+    this.base = path.basename(logFilePath);
+    this.maxBytes = options.maxBytes || 0;
+    this.maxAgeMs = options.maxAgeMs || 0;
+    this.retainSegments = options.retainSegments || 0;
+    this.retainMs = options.retainMs || 0;
+
+    this.activeSize = 0;
+    this.activeStartedAt = null;
+    this.nextSeq = 1;
+    this.queue = Promise.resolve();
+    this.compressing = Promise.resolve();
+    this.lastError = null;
+  }
+
+  /**
+   * Pick up the state left by a previous run and finish any interrupted compression
+   */
+  init() {
+    try {
+      this.activeSize = fs.statSync(this.logFilePath).size;
+    } catch (e) {
+      this.activeSize = 0;
+    }
+    if (this.activeSize > 0) {
+      this.activeStartedAt = this._firstTimestamp() || Date.now();
+    }
+
+    const segments = this.listSegments();
+    if (segments.length) {
+      this.nextSeq = segments[segments.length - 1].seq + 1;
+    }
+    for (const segment of segments) {
+      if (!segment.compressed) {
+        this._compressInBackground(segment.seq);
+      } else if (segment.plain) {
+        // Compressed before the last run stopped; only the plain copy was left over
+        fs.rmSync(this.segmentPath(segment.seq, false), { force: true });
+      }
+    }
+    return this;
+  }
+
+  /**
+   * Append text to the active file, rotating first when it is due.
+   * Appends and rotations run one at a time, in call order.
+   */
+  append(text) {
+    const result = this.queue.then(() => this._append(text));
+    this.queue = result.catch(() => {});
+    return result;
+  }
+
+  /**
+   * Rotate now if the active file is past its age limit; for idle periods
+   */
+  rotateIfDue() {
+    const result = this.queue.then(() => {
+      if (this._due(0)) {
+        return this._rotate();
+      }
+      return null;
+    });
+    this.queue = result.catch(() => {});
+    return result;
+  }
+
+  /**
+   * Segments on disk, oldest first
+   */
+  listSegments() {
+    let names;
+    try {
+      names = fs.readdirSync(this.dir);
+    } catch (e) {
+      return [];
+    }
+    const bySeq = new Map();
+    for (const name of names) {
+      if (!name.startsWith(this.base)) {
+        continue;
+      }
+      const match = SEGMENT_PATTERN.exec(name.slice(this.base.length));
+      if (!match) {
+        continue;
+      }
+      const seq = parseInt(match[1], 10);
+      const segment = bySeq.get(seq) || { seq, compressed: false, plain: false };
+      if (match[2]) {
+        segment.compressed = true;
+      } else {
+        segment.plain = true;
+      }
+      bySeq.set(seq, segment);
+    }
+    return [...bySeq.values()].sort((a, b) => a.seq - b.seq);
+  }
+
+  /**
+   * Segment count and bytes on disk, for the health endpoint
+   */
+  stats() {
+    let bytes = 0;
+    const segments = this.listSegments();
+    for (const segment of segments) {
+      const file = this.segmentPath(segment.seq, segment.compressed && !segment.plain);
+      try {
+        bytes += fs.statSync(file).size;
+      } catch (e) {
+        // Removed by retention or compression in the meantime
+      }
+    }
+    return { segmentCount: segments.length, segmentBytes: bytes, activeSize: this.activeSize };
+  }
+
+  segmentPath(seq, compressed) {
+    return path.join(this.dir, `${this.base}.${String(seq).padStart(6, '0')}${compressed ? '.gz' : ''}`);
+  }
+
+  metaPath(seq) {
+    return path.join(this.dir, `${this.base}.${String(seq).padStart(6, '0')}.meta.json`);
+  }
+
+  async _append(text) {
+    const bytes = Buffer.byteLength(text);
+    if (this._due(bytes)) {
+      await this._rotate();
+    }
+    await fs.promises.appendFile(this.logFilePath, text);
+    if (this.activeSize === 0) {
+      this.activeStartedAt = Date.now();
+    }
+    this.activeSize += bytes;
+  }
+
+  _due(incomingBytes) {
+    if (this.activeSize === 0) {
+      return false;
+    }
+    if (this.maxBytes && this.activeSize + incomingBytes > this.maxBytes) {
+      return true;
+    }
+    return Boolean(this.maxAgeMs && this.activeStartedAt && Date.now() - this.activeStartedAt >= this.maxAgeMs);
+  }
+
+  async _rotate() {
+    const seq = this.nextSeq++;
+    await fs.promises.rename(this.logFilePath, this.segmentPath(seq, false));
+    // Readers expect the active file to exist even before the next log arrives
+    await fs.promises.appendFile(this.logFilePath, '');
+    this.activeSize = 0;
+    this.activeStartedAt = null;
+    this._compressInBackground(seq);
+    return seq;
+  }
+
+  _compressInBackground(seq) {
+    this.compressing = this.compressing
+      .then(() => this._compress(seq))
+      .then(() => this._applyRetention())
+      .catch((err) => {
+        this.lastError = err.message;
+        console.error(`❌ Failed to compress log segment ${seq}:`, err);
+      });
+    return this.compressing;
+  }
+
+  /**
+   * Gzip a plain segment, write its sidecar, then remove the plain copy.
+   * Readers prefer the plain file while it exists, so a segment is readable
+   * at every step.
+   */
+  _compress(seq) {
+    const source = this.segmentPath(seq, false);
+    const target = this.segmentPath(seq, true);
+    const meta = { segment: seq, lines: 0, firstTimestamp: null, lastTimestamp: null, bytes: 0 };
+    let carry = '';
+    const countLines = (text) => {
+      const lines = (carry + text).split('\n');
+      carry = lines.pop();
+      for (const line of lines) {
+        meta.lines++;
+        const timestamp = lineTimestamp(line);
+        if (timestamp !== null) {
+          meta.firstTimestamp = meta.firstTimestamp === null ? timestamp : Math.min(meta.firstTimestamp, timestamp);
+          meta.lastTimestamp = meta.lastTimestamp === null ? timestamp : Math.max(meta.lastTimestamp, timestamp);
+        }
+      }
+    };
+
+    return new Promise((resolve, reject) => {
+      const input = fs.createReadStream(source);
+      const output = fs.createWriteStream(`${target}.tmp`);
+      const decoder = new StringDecoder('utf8');
+      input.on('data', (chunk) => {
+        meta.bytes += chunk.length;
+        countLines(decoder.write(chunk));
+      });
+      input.on('end', () => {
+        const rest = carry + decoder.end();
+        carry = '';
+        if (rest) {
+          countLines(`${rest}\n`);
+        }
+      });
+      const gzip = zlib.createGzip();
+      input.on('error', reject);
+      gzip.on('error', reject);
+      output.on('error', reject);
+      output.on('finish', resolve);
+      input.pipe(gzip).pipe(output);
+    }).then(async () => {
+      meta.compressedBytes = (await fs.promises.stat(`${target}.tmp`)).size;
+      await fs.promises.writeFile(`${this.metaPath(seq)}.tmp`, JSON.stringify(meta));
+      await fs.promises.rename(`${this.metaPath(seq)}.tmp`, this.metaPath(seq));
+      await fs.promises.rename(`${target}.tmp`, target);
+      await fs.promises.unlink(source);
+    });
+  }
+
+  async _applyRetention() {
+    const segments = this.listSegments().filter((segment) => segment.compressed && !segment.plain);
+    const now = Date.now();
+    for (let i = 0; i < segments.length; i++) {
+      const { seq } = segments[i];
+      let expired = this.retainSegments && segments.length - i > this.retainSegments;
+      if (!expired && this.retainMs) {
+        try {
+          const meta = JSON.parse(await fs.promises.readFile(this.metaPath(seq), 'utf8'));
+          expired = meta.lastTimestamp !== null && now - meta.lastTimestamp > this.retainMs;
+        } catch (e) {
+          expired = false;
+        }
+      }
+      if (!expired) {
+        // Segments are oldest first; keep everything from the first one retained
+        break;
+      }
+      await fs.promises.rm(this.segmentPath(seq, true), { force: true });
+      await fs.promises.rm(this.metaPath(seq), { force: true });
+      // Column store and its lock, written by the MCP server's compactor
+      await fs.promises.rm(`${this.segmentPath(seq, false)}.cols`, { force: true });
+      await fs.promises.rm(`${this.segmentPath(seq, false)}.cols.lock`, { force: true });
+      console.log(`🗑️  Removed log segment ${seq} (retention)`);
+    }
+  }
+
+  _firstTimestamp() {
+    let fd;
+    try {
+      fd = fs.openSync(this.logFilePath, 'r');
+      const buffer = Buffer.alloc(FIRST_LINE_BYTES);
+      const length = fs.readSync(fd, buffer, 0, FIRST_LINE_BYTES, 0);
+      return lineTimestamp(buffer.toString('utf8', 0, length).split('\n')[0]);
+    } catch (e) {
+      return null;
+    } finally {
+      if (fd !== undefined) {
+        fs.closeSync(fd);
+      }
+    }
+  }
+}
+
+module.exports = { LogRotator, entryTimestamp };
@@ -0,0 +1,110 @@
+/**
+ * Group-commit writer for the WeChat log file
+ * Log lines from concurrent requests are queued and written together with a
+ * single append once the queue reaches a size limit or its oldest line has
+ * waited long enough. Lines arriving while a write is in progress form the
+ * next group. Each caller's promise settles only after the group holding its
+ * lines is on disk, so a request is acknowledged once its logs are persisted.
+ */
+
+class GroupCommitWriter {
+  /**
+   * @param {object} sink - Anything with append(text) returning a promise, e.g. a LogRotator
+   * @param {object} options - maxBatchBytes, maxDelayMs (0 flushes on the next turn of the event loop)
+   */
+  constructor(sink, options = {}) {
+    this.sink = sink;
+    this.maxBatchBytes = options.maxBatchBytes || 1024 * 1024;
+    this.maxDelayMs = options.maxDelayMs || 0;
+
+    this.lines = [];
+    this.bytes = 0;
+    this.waiters = [];
+    this.timer = null;
+    this.writing = false;
+
+    this.stats = { flushes: 0, lines: 0, largestFlush: 0 };
+  }
+
+  /**
+   * Queue one line; resolves once it has been written
+   */
+  write(text) {
+    return this.writeAll([text]);
+  }
+
+  /**
+   * Queue several lines as one unit; resolves once all of them have been written
+   */
+  writeAll(texts) {
+    if (!texts.length) {
+      return Promise.resolve();
+    }
+    return new Promise((resolve, reject) => {
+      for (const text of texts) {
+        this.lines.push(text);
+        this.bytes += Buffer.byteLength(text);
+      }
+      this.waiters.push({ resolve, reject });
+      this._schedule();
+    });
+  }
+
+  /**
+   * Write whatever is queued now and wait for it
+   */
+  flush() {
+    if (!this.lines.length) {
+      return Promise.resolve();
+    }
+    const done = new Promise((resolve, reject) => this.waiters.push({ resolve, reject }));
+    this._flushNow();
+    return done;
+  }
+
+  _schedule() {
+    if (this.bytes >= this.maxBatchBytes) {
+      this._flushNow();
+    } else if (!this.timer && !this.writing) {
+      // While a write is in progress, the group waiting behind it is flushed when it finishes
+      this.timer = this.maxDelayMs
+        ? setTimeout(() => this._flushNow(), this.maxDelayMs)
+        : setImmediate(() => this._flushNow());
+    }
+  }
+
+  _flushNow() {
+    if (this.timer) {
+      clearTimeout(this.timer);
+      clearImmediate(this.timer);
+      this.timer = null;
+    }
+    if (!this.lines.length) {
+      return;
+    }
+    const text = this.lines.join('');
+    const waiters = this.waiters;
+    const count = this.lines.length;
+    this.lines = [];
+    this.bytes = 0;
+    this.waiters = [];
+    this.writing = true;
+
+    // The sink runs appends one at a time in call order, so groups stay in order
+    this.sink.append(text).then(() => {
+      this.stats.flushes++;
+      this.stats.lines += count;
+      this.stats.largestFlush = Math.max(this.stats.largestFlush, count);
+      waiters.forEach((waiter) => waiter.resolve());
+    }, (err) => {
+      waiters.forEach((waiter) => waiter.reject(err));
+    }).then(() => {
+      this.writing = false;
+      if (this.lines.length) {
+        this._flushNow();
+      }
+    });
+  }
+}
+
+module.exports = { GroupCommitWriter };
@@ -0,0 +1,170 @@
+"""
+Timestamp index for the WeChat log file
+Sparse checkpoints mapping serverTimestamp to byte offset, so time-windowed
+queries seek to the start of the window by bisection instead of scanning the file.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from log_reader import iter_lines
+
+# One checkpoint per this many bytes of log. A 1 GB file needs ~16k checkpoints,
+# and a windowed query reads at most one stride of lines outside its window.
+TIME_INDEX_STRIDE = 64 * 1024
+
+# How far a client timestamp may lag behind newer lines already in the file.
+# Windows that end before "now" stop reading this far past their end.
+TIME_INDEX_SKEW_MS = 5 * 60 * 1000
+
+_NUMERIC_TIMESTAMP = re.compile(rb'"(?:serverTimestamp|timestamp)"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)')
+_STRING_TIMESTAMP = re.compile(rb'"(?:serverTimestamp|timestamp)"\s*:\s*"')
+
+
+def parse_time(value: Any) -> Optional[float]:
+    """Convert epoch milliseconds or an ISO 8601 string to epoch milliseconds"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return float(text) if math.isfinite(float(text)) else None
+        except ValueError:
+            pass
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.astimezone()
+        return parsed.astimezone(timezone.utc).timestamp() * 1000
+    return None
+
+
+def entry_timestamp(entry: Dict[str, Any]) -> Optional[float]:
+    """Return an entry's time in epoch ms, preferring the collector's clock"""
+    for key in ("serverTimestamp", "timestamp"):
+        timestamp = parse_time(entry.get(key))
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def in_window(entry: Dict[str, Any], since: Optional[float], until: Optional[float]) -> bool:
+    """True when the entry's timestamp falls inside [since, until]"""
+    timestamp = entry_timestamp(entry)
+    if timestamp is None:
+        return False
+    return (since is None or timestamp >= since) and (until is None or timestamp <= until)
+
+
+def _line_timestamp_bound(line: bytes) -> Optional[float]:
+    """Upper bound for a raw line's entry_timestamp without decoding the JSON
+
+    Takes the largest number found under either timestamp key anywhere in the line,
+    which can't be smaller than the value entry_timestamp picks. Lines that carry
+    a timestamp as a string are decoded, since the bytes alone don't bound them.
+    """
+    if _STRING_TIMESTAMP.search(line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry_timestamp(entry) if isinstance(entry, dict) else None
+    bound = None
+    for match in _NUMERIC_TIMESTAMP.finditer(line):
+        value = float(match.group(1))
+        if bound is None or value > bound:
+            bound = value
+    return bound
+
+
+class TimeIndex:
+    """Sparse timestamp → byte offset index over one log file
+
+    Each checkpoint records a line-aligned offset, the number of lines before it,
+    and the largest timestamp seen before it. The running maximum never
+    decreases, so bisection finds the last checkpoint before which every entry is
+    older than ``since`` even when client timestamps arrive slightly out of order.
+    The index grows incrementally as the file does and is rebuilt after
+    truncation or rotation.
+    """
+
+    def __init__(self, path: Union[str, Path], stride: int = TIME_INDEX_STRIDE,
+                 skew_ms: float = TIME_INDEX_SKEW_MS):
+        self.path = Path(path)
+        self.stride = stride
+        self.skew_ms = skew_ms
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, identity: Optional[Tuple[int, int]]) -> None:
+        self._identity = identity
+        self._offsets = array("q", [0])
+        self._lines = array("q", [0])
+        self._max_timestamps = array("d", [-math.inf])
+        self._indexed_offset = 0
+        self._indexed_lines = 0
+        self._running_max = -math.inf
+
+    def update(self) -> int:
+        """Index complete lines appended since the last update; returns the file size"""
+        with self._lock:
+            return self._update()
+
+    def _update(self) -> int:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset(None)
+            return 0
+
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self._identity or stat.st_size < self._indexed_offset:
+            self._reset(identity)
+
+        size = stat.st_size
+        for offset, line in iter_lines(self.path, start=self._indexed_offset, end=size):
+            line_end = offset + len(line)
+            if line_end >= size:
+                break  # No newline yet: the line is still being written
+            if offset - self._offsets[-1] >= self.stride:
+                self._offsets.append(offset)
+                self._lines.append(self._indexed_lines)
+                self._max_timestamps.append(self._running_max)
+            bound = _line_timestamp_bound(line)
+            if bound is not None and bound > self._running_max:
+                self._running_max = bound
+            self._indexed_lines += 1
+            self._indexed_offset = line_end + 1
+        return size
+
+    def window(self, since: Optional[float], until: Optional[float]) -> Tuple[int, int, Optional[int]]:
+        """Return (start_offset, start_line, end_offset) covering [since, until]
+
+        Every entry with a timestamp in the window lies in the returned byte
+        range; ``start_line`` is the number of lines before ``start_offset`` and
+        ``end_offset`` is None when the range runs to the end of the file. Callers
+        still check each entry's timestamp, since the range is checkpoint-aligned.
+        """
+        with self._lock:
+            self._update()
+            start = 0
+            if since is not None:
+                start = max(bisect_left(self._max_timestamps, since) - 1, 0)
+            end_offset = None
+            if until is not None:
+                end = bisect_right(self._max_timestamps, until + self.skew_ms)
+                if end < len(self._offsets):
+                    end_offset = self._offsets[end]
+            return self._offsets[start], self._lines[start], end_offset
@@ -0,0 +1,147 @@
+"""
+Log file readers for the WeChat MCP server
+Block-oriented helpers for reading the JSONL log written by log-collector.js
+without loading the whole file into memory.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from metrics import count_read, current_stats
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# orjson turns integers wider than 64 bits into floats, where json keeps them exact
+_WIDE_INTEGER = re.compile(rb"[0-9]{19}")
+
+LOG_LEVELS = {"DEBUG": 1, "INFO": 2, "WARN": 3, "ERROR": 4, "log": 2, "info": 2, "warn": 3, "error": 4}
+
+# Size of each forward read when scanning a byte range
+FORWARD_BLOCK_SIZE = 1024 * 1024
+
+# Size of each backwards read. Large enough to amortize syscalls, small enough
+# that asking for the last few entries only touches the tail of the file.
+REVERSE_BLOCK_SIZE = 64 * 1024
+
+
+def decode_entry(line: bytes) -> Optional[Dict[str, Any]]:
+    """Decode one raw log line, returning None unless it is a JSON object
+
+    Uses orjson when it is installed. orjson is stricter than the json module
+    (it rejects NaN, lone surrogates and a BOM) and reads very wide integers as
+    floats, so those lines go through json to keep results identical either way.
+    """
+    if HAS_ORJSON and not _WIDE_INTEGER.search(line):
+        try:
+            entry = orjson.loads(line)
+        except ValueError:
+            entry = _json_decode(line)
+    else:
+        entry = _json_decode(line)
+    if not isinstance(entry, dict):
+        entry = None
+    stats = current_stats.get()
+    if stats is not None:
+        stats.lines_decoded += 1
+        stats.decode_failures += entry is None and bool(line.strip())
+    return entry
+
+
+def _json_decode(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def entry_message(entry: Dict[str, Any]) -> Any:
+    """Return the text of a log entry: its message, its joined console arguments, or the whole entry"""
+    if "message" in entry:
+        return entry.get("message")
+    elif "arguments" in entry:
+        args_list = entry.get("arguments", [])
+        return " ".join(str(arg) for arg in args_list)
+    return str(entry)
+
+
+def iter_lines(path: Union[str, Path], start: int = 0, end: Optional[int] = None,
+               block_size: int = FORWARD_BLOCK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) pairs oldest-first for the lines in ``[start, end)``.
+
+    ``start`` must be the beginning of a line. Lines are raw bytes without the
+    newline, and empty lines are included so callers can keep line numbers in
+    step with the file. As with the reverse reader, ``end`` defaults to the size
+    when reading starts and a trailing line without a newline is yielded as-is.
+    """
+    with open(path, "rb") as f:
+        if end is None:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+
+        f.seek(start)
+        position = start
+        pending = b""
+        while position < end:
+            block = f.read(min(block_size, end - position))
+            if not block:
+                break
+            count_read(len(block))
+            position += len(block)
+            data = pending + block
+            offset = position - len(data)
+
+            parts = data.split(b"\n")
+            # The last part may continue in the next block; carry it over
+            pending = parts.pop()
+            for part in parts:
+                yield offset, part
+                offset += len(part) + 1
+
+        if pending:
+            yield position - len(pending), pending
+
+
+def iter_lines_reverse(path: Union[str, Path], block_size: int = REVERSE_BLOCK_SIZE,
+                       end: Optional[int] = None, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) pairs newest-first by reading fixed-size blocks back from EOF.
+
+    Lines are yielded as raw bytes without the newline, so a multi-byte UTF-8
+    character split across two blocks is reassembled before anyone decodes it.
+    The file size is captured once when reading starts (or taken from ``end``),
+    so bytes appended during the walk are ignored. A final line with no newline
+    yet is a write still in progress; it is yielded like any other line and the
+    caller rejects it if it does not parse. Empty lines are skipped. Reading
+    stops at ``start``, which must be the beginning of a line.
+    """
+    with open(path, "rb") as f:
+        if end is None:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+
+        position = end
+        remainder = b""
+        while position > start:
+            read_size = min(block_size, position - start)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            count_read(read_size)
+
+            parts = block.split(b"\n")
+            # The first part may continue in the previous block; carry it over
+            remainder = parts[0]
+            offset = position + len(block)
+            for part in reversed(parts[1:]):
+                offset -= len(part) + 1
+                if part:
+                    yield offset + 1, part
+
+        if remainder:
+            yield start, remainder
@@ -0,0 +1,276 @@
+"""
+Rotated log segments
+log-collector.js rotates the log into numbered segments next to it
+(wechat_logs.log.000042), gzip-compresses them and writes a .meta.json
+sidecar with each segment's time range and line count. These helpers list
+and read the segments, so the active file and its segments can be queried
+as one stream and segments outside a time window skipped unopened.
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from log_reader import iter_lines_reverse
+from metrics import count_read
+
+SEGMENT_PATTERN = re.compile(r"\.(\d{6})(\.gz)?$")
+
+# Uncompressed bytes between two restart points of a compressed segment read backwards
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+# Compressed segments whose restart points are kept
+CHECKPOINT_CACHE_SEGMENTS = 8
+
+# Compressed bytes decompressed at a time
+_INPUT_BLOCK = 64 * 1024
+
+# zlib window bits for a gzip stream
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_meta_cache: Dict[Path, Tuple[int, Dict]] = {}
+_meta_lock = threading.Lock()
+
+_checkpoint_cache: "OrderedDict[Tuple[Path, int, int], _SegmentCheckpoints]" = OrderedDict()
+_checkpoint_lock = threading.Lock()
+
+
+class Segment(NamedTuple):
+    """One rotated segment; ``path`` is the plain file until compression finishes"""
+    seq: int
+    path: Path
+    compressed: bool
+    first_timestamp: Optional[float] = None
+    last_timestamp: Optional[float] = None
+    lines: Optional[int] = None
+    # Uncompressed size in bytes
+    size: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return self.path.name[:-3] if self.compressed else self.path.name
+
+    @property
+    def has_meta(self) -> bool:
+        return self.lines is not None
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        """False only when the sidecar shows no entry can fall inside [since, until]"""
+        if since is None and until is None or not self.has_meta:
+            return True
+        if self.first_timestamp is None or self.last_timestamp is None:
+            return False
+        return (since is None or self.last_timestamp >= since) and (until is None or self.first_timestamp <= until)
+
+    def within(self, since: Optional[float], until: Optional[float]) -> bool:
+        """True when the sidecar shows every timestamped entry falls inside [since, until]"""
+        if self.first_timestamp is None or self.last_timestamp is None:
+            return False
+        return (since is None or self.first_timestamp >= since) and (until is None or self.last_timestamp <= until)
+
+
+def _read_meta(path: Path) -> Optional[Dict]:
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    with _meta_lock:
+        cached = _meta_cache.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    try:
+        meta = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    with _meta_lock:
+        _meta_cache[path] = (mtime_ns, meta)
+    return meta
+
+
+def list_segments(log_path: Union[str, Path]) -> List[Segment]:
+    """Return the segments of a log file, oldest first"""
+    log_path = Path(log_path)
+    found: Dict[int, Dict[bool, Path]] = {}
+    try:
+        names = os.listdir(log_path.parent)
+    except OSError:
+        return []
+    for name in names:
+        if not name.startswith(log_path.name):
+            continue
+        match = SEGMENT_PATTERN.fullmatch(name[len(log_path.name):])
+        if match:
+            found.setdefault(int(match.group(1)), {})[bool(match.group(2))] = log_path.parent / name
+
+    segments = []
+    for seq in sorted(found):
+        # The plain file is still complete while its compressed copy is being written
+        compressed = False not in found[seq]
+        path = found[seq][compressed]
+        meta = _read_meta(log_path.parent / f"{log_path.name}.{seq:06d}.meta.json")
+        if meta is None:
+            segments.append(Segment(seq, path, compressed))
+        else:
+            segments.append(Segment(seq, path, compressed, meta.get("firstTimestamp"), meta.get("lastTimestamp"),
+                                    meta.get("lines"), meta.get("bytes")))
+    return segments
+
+
+def find_segment(log_path: Union[str, Path], seq: int) -> Optional[Segment]:
+    for segment in list_segments(log_path):
+        if segment.seq == seq:
+            return segment
+    return None
+
+
+def open_segment(segment: Segment):
+    """Open a segment for reading its uncompressed bytes"""
+    if not segment.compressed:
+        try:
+            return open(segment.path, "rb")
+        except FileNotFoundError:
+            # Compressed and removed since it was listed
+            return gzip.open(segment.path.with_name(segment.path.name + ".gz"), "rb")
+    return gzip.open(segment.path, "rb")
+
+
+def iter_segment_lines(segment: Segment, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) pairs oldest-first from ``start``, offsets counted in uncompressed bytes"""
+    with open_segment(segment) as f:
+        f.seek(start)
+        offset = start
+        try:
+            for line in f:
+                yield offset, line.rstrip(b"\n")
+                offset += len(line)
+        finally:
+            count_read(offset - start)
+
+
+def iter_segment_lines_reverse(segment: Segment, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) pairs newest-first, ending before ``end``
+
+    A compressed segment can only be decompressed front to back. The first
+    backward read records restart points every CHECKPOINT_BYTES of output,
+    and reads walk back one stretch between restart points at a time, so a
+    page costs one stretch rather than the whole segment.
+    """
+    if not segment.compressed:
+        try:
+            yield from iter_lines_reverse(segment.path, end=end)
+            return
+        except FileNotFoundError:
+            segment = segment._replace(path=segment.path.with_name(segment.path.name + ".gz"), compressed=True)
+
+    with open(segment.path, "rb") as f:
+        checkpoints = _segment_checkpoints(segment.path, f)
+        points, size = checkpoints.covering(f, end)
+        if size is not None:
+            end = size if end is None else min(end, size)
+        remainder = b""
+        stop = end
+        for point in reversed([point for point in points if point.offset < end]):
+            block = _inflate_range(f, point, stop)
+            count_read(len(block))
+            block += remainder
+            parts = block.split(b"\n")
+            # The first part may continue in the previous stretch; carry it over
+            remainder = parts[0]
+            offset = point.offset + len(block)
+            for part in reversed(parts[1:]):
+                offset -= len(part) + 1
+                if part:
+                    yield offset + 1, part
+            stop = point.offset
+        if remainder:
+            yield 0, remainder
+
+
+class _Checkpoint(NamedTuple):
+    """Decompressor state at uncompressed ``offset``, ready for the compressed input at ``position``"""
+    offset: int
+    position: int
+    decompressor: Any
+
+
+class _SegmentCheckpoints:
+    """Restart points of one compressed segment, recorded as far as reads have needed them"""
+
+    def __init__(self):
+        self.points = [_Checkpoint(0, 0, zlib.decompressobj(_GZIP_WBITS))]
+        # Uncompressed size, known once the whole segment has been decompressed
+        self.size: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def covering(self, f, end: Optional[int]) -> Tuple[List[_Checkpoint], int]:
+        """Return the restart points recorded up to at least ``end`` (the whole segment for None)
+
+        Also returns the uncompressed size once the whole segment has been read,
+        otherwise None.
+        """
+        with self.lock:
+            last = self.points[-1]
+            if self.size is None and (end is None or last.offset < end):
+                decompressor = last.decompressor.copy()
+                offset, position = last.offset, last.position
+                f.seek(position)
+                while True:
+                    data = f.read(_INPUT_BLOCK)
+                    if not data:
+                        self.size = offset
+                        break
+                    decompressor, output = _inflate(decompressor, data)
+                    offset += len(output)
+                    position += len(data)
+                    if offset - self.points[-1].offset >= CHECKPOINT_BYTES:
+                        self.points.append(_Checkpoint(offset, position, decompressor.copy()))
+                    if end is not None and offset >= end:
+                        break
+                count_read(offset - last.offset)
+            return list(self.points), self.size
+
+
+def _segment_checkpoints(path: Path, f) -> _SegmentCheckpoints:
+    stat = os.fstat(f.fileno())
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _checkpoint_lock:
+        checkpoints = _checkpoint_cache.get(key)
+        if checkpoints is None:
+            checkpoints = _checkpoint_cache[key] = _SegmentCheckpoints()
+            while len(_checkpoint_cache) > CHECKPOINT_CACHE_SEGMENTS:
+                _checkpoint_cache.popitem(last=False)
+        else:
+            _checkpoint_cache.move_to_end(key)
+        return checkpoints
+
+
+def _inflate(decompressor, data: bytes) -> Tuple[Any, bytes]:
+    """Decompress ``data``, moving on to a new decompressor at each further gzip member"""
+    output = [decompressor.decompress(data)]
+    while decompressor.eof and decompressor.unused_data:
+        data = decompressor.unused_data
+        decompressor = zlib.decompressobj(_GZIP_WBITS)
+        output.append(decompressor.decompress(data))
+    return decompressor, b"".join(output)
+
+
+def _inflate_range(f, point: _Checkpoint, stop: int) -> bytes:
+    """Decompress from ``point`` up to the uncompressed offset ``stop``"""
+    decompressor = point.decompressor.copy()
+    f.seek(point.position)
+    chunks = []
+    produced = 0
+    while produced < stop - point.offset:
+        data = f.read(_INPUT_BLOCK)
+        if not data:
+            break
+        decompressor, output = _inflate(decompressor, data)
+        chunks.append(output)
+        produced += len(output)
+    return b"".join(chunks)[:stop - point.offset]
@@ -0,0 +1,161 @@
+"""
+Log sources for the MCP server
+WECHAT_LOG_PATH may name one log file, a glob pattern, or several of either
+separated by os.pathsep. Every file it resolves to is a source with its own
+indexes, tail buffer and rotated segments. Tools query the sources side by
+side and combine their results with a heap-based k-way merge on entry time,
+so memory grows with the number of sources rather than with what they hold.
+"""
+
+import heapq
+import math
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar, Union
+
+from column_store import LogCompactor
+from field_index import FieldIndex
+from health import LineCounter
+from log_index import TimeIndex, entry_timestamp
+from log_segments import SEGMENT_PATTERN
+from log_tailer import LogTailer
+from search_index import TrigramIndex
+
+T = TypeVar("T")
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+# Files next to a log that belong to it rather than being logs themselves
+_SIDECAR_SUFFIXES = (".trgm", ".fidx", ".cols", ".lock", ".json", ".tmp", ".pid", ".gz")
+
+
+def _is_log_file(path: Path) -> bool:
+    name = path.name
+    return path.is_file() and not SEGMENT_PATTERN.search(name) and not name.endswith(_SIDECAR_SUFFIXES)
+
+
+def resolve_log_paths(spec: str, base_dir: Union[str, Path]) -> List[Path]:
+    """Return the log files named by ``spec``, in a stable order
+
+    Relative paths are taken from ``base_dir``. A plain path is returned even
+    while the file doesn't exist yet; a glob only yields files that do, and
+    skips the indexes, sidecars and segments stored next to each log.
+    """
+    paths: List[Path] = []
+    for part in spec.split(os.pathsep):
+        part = part.strip()
+        if not part:
+            continue
+        pattern = Path(part).expanduser()
+        if not pattern.is_absolute():
+            pattern = Path(base_dir) / pattern
+        if _GLOB_CHARS.search(str(pattern)):
+            anchor = Path(pattern.anchor)
+            matches = sorted(path.resolve() for path in anchor.glob(str(pattern.relative_to(anchor)))
+                             if _is_log_file(path))
+        else:
+            matches = [pattern.resolve()]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def unique_name(path: Path, taken: Iterable[str]) -> str:
+    """Shortest trailing part of ``path`` not already used as a source name"""
+    taken = set(taken)
+    parts = path.parts
+    for length in range(1, len(parts) + 1):
+        name = "/".join(parts[-length:]).lstrip("/")
+        if name not in taken:
+            return name
+    return str(path)
+
+
+class LogSource:
+    """One log file and the state kept for querying it"""
+
+    def __init__(self, path: Path, name: str):
+        self.path = path
+        self.name = name
+        self.tailer: Optional[LogTailer] = None
+        self.time_index = TimeIndex(path)
+        self.search_index: Optional[TrigramIndex] = None
+        self.field_index: Optional[FieldIndex] = None
+        # Always available to log_stats; only compacts in the background once started
+        self.compactor = LogCompactor(path)
+        self.line_counter = LineCounter(path)
+        # Summaries of rotated segments lying wholly inside a summary window, by segment number
+        self.segment_summaries: Dict[int, Any] = {}
+
+    @property
+    def error_summary_path(self) -> Path:
+        """Where this source's error summaries are saved between runs"""
+        return self.path.with_name(self.path.name + ".errors.json")
+
+    def start(self, tail_options: Optional[Dict[str, Any]], search_index: bool, indexed_fields: Sequence[str],
+              column_store: bool) -> None:
+        """Start the live tail (when ``tail_options`` is given), the trigram and field indexes and the compactor"""
+        if tail_options is not None:
+            self.tailer = LogTailer(self.path, **tail_options)
+            self.tailer.start()
+        if search_index:
+            self.search_index = TrigramIndex(self.path)
+            self.search_index.start()
+        if indexed_fields:
+            self.field_index = FieldIndex(self.path, indexed_fields)
+            self.field_index.start()
+        if column_store:
+            self.compactor.start()
+
+    def stop(self) -> None:
+        if self.tailer:
+            self.tailer.stop()
+        if self.search_index:
+            self.search_index.stop()
+        if self.field_index:
+            self.field_index.stop()
+        self.compactor.stop()
+
+
+def merge_by_time(streams: Iterable[Iterable[T]], entry_of: Callable[[T], Dict[str, Any]],
+                  newest_first: bool = False) -> Iterator[T]:
+    """Merge streams that are each in time order into one, lazily
+
+    A heap holds the next item of every stream, so memory depends on the
+    number of streams only. An entry without a timestamp keeps the time of
+    the entry before it in its stream. Entries with equal times are ordered by
+    stream, so a newest-first merge is exactly the reverse of an oldest-first one.
+    """
+    def keyed(index: int, stream: Iterable[T]) -> Iterator[tuple]:
+        last = math.inf if newest_first else -math.inf
+        for item in stream:
+            timestamp = entry_timestamp(entry_of(item))
+            if timestamp is not None:
+                last = timestamp
+            yield (last, index), item
+
+    merged = heapq.merge(*(keyed(index, stream) for index, stream in enumerate(streams)),
+                         key=lambda pair: pair[0], reverse=newest_first)
+    return (item for _, item in merged)
+
+
+class ProgressSplitter:
+    """Combine progress reports of scans running side by side into one report"""
+
+    def __init__(self, report: Callable[[int, int], None], parts: int):
+        self._report = report
+        self._done = [0] * parts
+        self._total = [0] * parts
+        self._lock = threading.Lock()
+
+    def part(self, index: int) -> Callable[[int, int], None]:
+        def report(done: int, total: int) -> None:
+            with self._lock:
+                self._done[index] = done
+                self._total[index] = total
+                done, total = sum(self._done), sum(self._total)
+            self._report(done, total)
+        return report
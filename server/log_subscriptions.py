@@ -0,0 +1,308 @@
+"""
+Live log subscriptions for MCP resources
+Each log file is exposed as a resource (wechat-log://logs/<name>, or
+wechat-log://logs for all of them), optionally narrowed with ?level= and
+?query= in the URI. Subscribed files are followed from their current end with
+watchdog when it is installed and stat polling otherwise; only appended bytes
+are read. Matching entries that arrive within the debounce window are
+coalesced into a single notification per subscription.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from line_filter import LinePrefilter, combine_prefilters, level_prefilter, query_prefilter
+from log_reader import LOG_LEVELS, decode_entry
+from scan_engine import SearchSpec, entry_matches
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_SCHEME = "wechat-log"
+RESOURCE_HOST = "logs"
+
+# With watchdog, files are still checked this often in case an event was missed
+WATCHDOG_FALLBACK_INTERVAL = 5.0
+
+# Read appended bytes in chunks so a large burst never needs one huge allocation
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class LogResource(NamedTuple):
+    """What a resource URI names: one log file (None for all of them) and an entry filter"""
+    source: Optional[str]
+    spec: SearchSpec
+
+
+def resource_uri(source: Optional[str] = None, level: Optional[str] = None, query: Optional[str] = None) -> str:
+    """Return the URI of a log resource"""
+    uri = f"{RESOURCE_SCHEME}://{RESOURCE_HOST}"
+    if source is not None:
+        uri += "/" + quote(source)
+    params = {key: value for key, value in (("level", level), ("query", query)) if value}
+    return uri + ("?" + urlencode(params) if params else "")
+
+
+def parse_resource_uri(uri: str) -> LogResource:
+    """Parse a log resource URI; raises ValueError when it is not one"""
+    parts = urlsplit(uri)
+    if parts.scheme != RESOURCE_SCHEME or parts.netloc != RESOURCE_HOST:
+        raise ValueError(f"Unknown resource: {uri}")
+    params = parse_qs(parts.query)
+    level = params.get("level", ["ALL"])[-1].upper()
+    if level != "ALL" and level not in LOG_LEVELS:
+        raise ValueError(f"Unknown level in resource URI: {level}")
+    min_level = LOG_LEVELS[level] if level != "ALL" else 0
+    query = params.get("query", [""])[-1].lower()
+    return LogResource(unquote(parts.path.lstrip("/")) or None, SearchSpec(query, min_level))
+
+
+class _Follower:
+    """Read what is appended to one file, from its size when following started
+
+    A file that only just appeared is read from the top instead.
+    """
+
+    def __init__(self, path: Path, from_start: bool = False):
+        self.path = path
+        self.identity: Optional[Tuple[int, int]] = None
+        self.offset = 0
+        self.pending = b""
+        if from_start:
+            return
+        try:
+            stat = os.stat(path)
+            self.identity = (stat.st_dev, stat.st_ino)
+            self.offset = stat.st_size
+        except FileNotFoundError:
+            pass
+
+    def read_lines(self) -> List[bytes]:
+        """Return the complete lines appended since the last call"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.identity, self.offset, self.pending = None, 0, b""
+            return []
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self.identity or stat.st_size < self.offset:
+            # Rotated or truncated: everything in the file now is new
+            self.identity, self.offset, self.pending = identity, 0, b""
+        if stat.st_size <= self.offset:
+            return []
+
+        lines: List[bytes] = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while self.offset < stat.st_size:
+                chunk = f.read(min(READ_CHUNK_SIZE, stat.st_size - self.offset))
+                if not chunk:
+                    break
+                self.offset += len(chunk)
+                lines.extend((self.pending + chunk).split(b"\n"))
+                self.pending = lines.pop()
+        return lines
+
+
+class _Subscription:
+    __slots__ = ("uri", "resource", "paths", "prefilter", "pending", "flush")
+
+    def __init__(self, uri: str, resource: LogResource, paths: List[Path]):
+        self.uri = uri
+        self.resource = resource
+        self.paths = set(paths)
+        self.prefilter: Optional[LinePrefilter] = combine_prefilters(level_prefilter(resource.spec.min_level),
+                                                                     query_prefilter(resource.spec.query))
+        # Matching entries not notified yet, and the timer that will notify them
+        self.pending = 0
+        self.flush: Optional[asyncio.TimerHandle] = None
+
+
+class LogSubscriptions:
+    """Resource subscriptions and the watcher thread that serves them
+
+    ``paths_for`` maps a resource to the log files it covers and raises
+    ValueError for an unknown one. ``notify(uri, count)`` runs on the event
+    loop at most once per debounce window for each subscription, with the
+    number of matching entries appended since the previous notification.
+    While there are subscriptions, ``discover`` runs on the event loop every
+    ``discover_interval`` seconds to look for new log files.
+    """
+
+    def __init__(self, paths_for: Callable[[LogResource], List[Path]], notify: Callable[[str, int], None],
+                 debounce: float, poll_interval: float, discover: Optional[Callable[[], object]] = None,
+                 discover_interval: float = 5.0):
+        self.paths_for = paths_for
+        self.notify = notify
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.discover = discover
+        self.discover_interval = discover_interval
+        self._subscriptions: Dict[str, _Subscription] = {}
+        self._followers: Dict[Path, _Follower] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self._watched_dirs: Set[Path] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, uri: str) -> None:
+        """Start notifying ``uri``'s updates; subscribing again is a no-op"""
+        if uri in self._subscriptions:
+            return
+        resource = parse_resource_uri(uri)
+        subscription = _Subscription(uri, resource, self.paths_for(resource))
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscriptions[uri] = subscription
+            self._sync_followers()
+        self._start()
+        logger.info(f"Subscribed to {uri}")
+
+    def unsubscribe(self, uri: str) -> bool:
+        """Stop notifying ``uri``; returns False when it was not subscribed"""
+        with self._lock:
+            subscription = self._subscriptions.pop(uri, None)
+            if subscription is None:
+                return False
+            self._sync_followers()
+        if subscription.flush is not None:
+            subscription.flush.cancel()
+        if not self._subscriptions:
+            self.stop()
+        logger.info(f"Unsubscribed from {uri}")
+        return True
+
+    def sources_changed(self) -> None:
+        """Pick up log files that appeared since the subscriptions were made"""
+        with self._lock:
+            for subscription in self._subscriptions.values():
+                try:
+                    subscription.paths = set(self.paths_for(subscription.resource))
+                except ValueError:
+                    subscription.paths = set()
+            self._sync_followers(new_files=True)
+
+    def stop(self) -> None:
+        """Stop following files; subscriptions made later start it again"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+            self._observer = None
+            self._watched_dirs.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _sync_followers(self, new_files: bool = False) -> None:
+        """Follow exactly the files some subscription covers; called with the lock held"""
+        wanted = set().union(*(subscription.paths for subscription in self._subscriptions.values()))
+        for path in set(self._followers) - wanted:
+            del self._followers[path]
+        for path in wanted - set(self._followers):
+            self._followers[path] = _Follower(path, from_start=new_files)
+            self._watch_dir(path.parent)
+
+    def _start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-subscriptions", daemon=True)
+        self._thread.start()
+
+    def _watch_dir(self, directory: Path) -> None:
+        if not HAS_WATCHDOG or directory in self._watched_dirs:
+            return
+        subscriptions = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = {getattr(event, "src_path", None), getattr(event, "dest_path", None)}
+                if any(path is not None and Path(path) in subscriptions._followers for path in paths):
+                    subscriptions._wake.set()
+
+        try:
+            if self._observer is None:
+                self._observer = Observer()
+                self._observer.start()
+            self._observer.schedule(_Handler(), str(directory), recursive=False)
+            self._watched_dirs.add(directory)
+        except Exception as e:
+            logger.warning(f"watchdog unavailable for {directory} ({e}), polling instead")
+
+    def _run(self) -> None:
+        discovered_at = time.monotonic()
+        while not self._stop_event.is_set():
+            interval = WATCHDOG_FALLBACK_INTERVAL if self._watched_dirs else self.poll_interval
+            self._wake.wait(min(interval, self.discover_interval))
+            self._wake.clear()
+            if self._stop_event.is_set():
+                break
+            if self.discover is not None and time.monotonic() - discovered_at >= self.discover_interval:
+                discovered_at = time.monotonic()
+                self._loop.call_soon_threadsafe(self.discover)
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error(f"Log subscription check failed: {e}")
+
+    def _poll(self) -> None:
+        """Read what every followed file gained and count the entries each subscription matches"""
+        with self._lock:
+            followers = list(self._followers.values())
+            subscriptions = list(self._subscriptions.values())
+        counts: Dict[str, int] = {}
+        for follower in followers:
+            lines = follower.read_lines()
+            interested = [subscription for subscription in subscriptions if follower.path in subscription.paths]
+            if not lines or not interested:
+                continue
+            for line in lines:
+                if not line.strip():
+                    continue
+                # Decoded at most once, and only when some subscription's prefilter passes it
+                entry = None
+                for subscription in interested:
+                    if subscription.prefilter is not None and not subscription.prefilter(line):
+                        continue
+                    if entry is None:
+                        entry = decode_entry(line)
+                        if entry is None:
+                            break
+                    if entry_matches(entry, subscription.resource.spec):
+                        counts[subscription.uri] = counts.get(subscription.uri, 0) + 1
+        if counts and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._add_pending, counts)
+
+    def _add_pending(self, counts: Dict[str, int]) -> None:
+        for uri, count in counts.items():
+            subscription = self._subscriptions.get(uri)
+            if subscription is None:
+                continue
+            subscription.pending += count
+            if subscription.flush is None:
+                subscription.flush = self._loop.call_later(self.debounce, self._flush, subscription)
+
+    def _flush(self, subscription: _Subscription) -> None:
+        count, subscription.pending, subscription.flush = subscription.pending, 0, None
+        if self._subscriptions.get(subscription.uri) is subscription and count:
+            self.notify(subscription.uri, count)
@@ -0,0 +1,243 @@
+"""
+Live tail of the WeChat log file
+Keeps a bounded ring buffer of the newest decoded entries up to date by following
+appends to the log, using watchdog when it is installed and stat polling otherwise.
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from log_reader import decode_entry, iter_lines_reverse
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead of a decoded dict on top of its raw JSON size, used for
+# the memory bound. Decoded entries are several times larger than their source line.
+ENTRY_OVERHEAD_BYTES = 256
+DECODED_SIZE_FACTOR = 3
+
+# Read appended bytes in chunks so a large burst never needs one huge allocation
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class BufferedEntry(NamedTuple):
+    """A decoded log entry held in the ring buffer"""
+    offset: int
+    line_num: Optional[int]
+    entry: Dict[str, Any]
+    size: int
+
+
+class TailSnapshot(NamedTuple):
+    """Consistent view of the ring buffer at one point in time
+
+    ``entries`` are oldest-first and cover every complete line in
+    ``[start_offset, end_offset)`` of the file. ``end_offset`` is the file size
+    when the snapshot was taken, so disk reads below ``start_offset`` join up
+    with the buffer without gaps or overlap.
+    """
+    entries: List[BufferedEntry]
+    start_offset: int
+    end_offset: int
+
+    @property
+    def complete(self) -> bool:
+        """True when the buffer holds the whole file"""
+        return self.start_offset == 0
+
+
+class LogRingBuffer:
+    """Bounded buffer of the newest decoded entries, limited by count and memory"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: Deque[BufferedEntry] = deque()
+        self.total_bytes = 0
+        self.start_offset = 0
+        self.end_offset = 0
+
+    def reset(self, offset: int) -> None:
+        """Drop everything and start covering the file from ``offset``"""
+        self.entries.clear()
+        self.total_bytes = 0
+        self.start_offset = offset
+        self.end_offset = offset
+
+    def append(self, entry: BufferedEntry, end_offset: int) -> None:
+        """Add an entry and evict the oldest ones until both limits hold"""
+        self.entries.append(entry)
+        self.total_bytes += entry.size
+        self.end_offset = end_offset
+        while self.entries and (len(self.entries) > self.max_entries
+                                or self.total_bytes > self.max_bytes):
+            evicted = self.entries.popleft()
+            self.total_bytes -= evicted.size
+            self.start_offset = self.entries[0].offset if self.entries else end_offset
+
+
+class LogTailer:
+    """Follow appends to a log file and keep a ring buffer of decoded entries
+
+    Only bytes written since the last refresh are read and parsed. Truncation
+    (the file shrinks) and rotation (the inode changes) reset the buffer and
+    re-prime it from the tail of the current file. A line with no trailing
+    newline is held back until it is complete.
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 10000,
+                 max_bytes: int = 32 * 1024 * 1024, poll_interval: float = 0.5):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.buffer = LogRingBuffer(max_entries, max_bytes)
+        self._lock = threading.Lock()
+        self._identity: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._line_num: Optional[int] = 0
+        self._pending = b""
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+
+    def start(self) -> None:
+        """Prime the buffer and begin following the file in the background"""
+        self.refresh()
+        if HAS_WATCHDOG:
+            try:
+                self._start_watchdog()
+                logger.info(f"Log tailer following {self.path} with watchdog")
+                return
+            except Exception as e:
+                logger.warning(f"watchdog unavailable ({e}), falling back to polling")
+        self._thread = threading.Thread(target=self._poll_loop, name="log-tailer", daemon=True)
+        self._thread.start()
+        logger.info(f"Log tailer polling {self.path} every {self.poll_interval}s")
+
+    def stop(self) -> None:
+        """Stop following the file"""
+        self._stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def snapshot(self) -> Optional[TailSnapshot]:
+        """Return the buffered entries, or None when the buffer can't be trusted
+
+        The buffer is brought up to date first, so a query never misses entries
+        the watcher has not delivered yet. None means the caller should read the
+        file directly: it is missing, or it ends in a line still being written.
+        """
+        self.refresh()
+        with self._lock:
+            if self._identity is None or self._pending:
+                return None
+            return TailSnapshot(list(self.buffer.entries), self.buffer.start_offset,
+                                self.buffer.end_offset)
+
+    def refresh(self) -> None:
+        """Consume any bytes appended since the last refresh"""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset(None, 0)
+                return
+
+            identity = (stat.st_dev, stat.st_ino)
+            if identity != self._identity or stat.st_size < self._offset:
+                if self._identity is not None:
+                    logger.info(f"Log file {self.path} was rotated or truncated, re-reading")
+                self._reset(identity, self._prime_offset(stat.st_size))
+
+            if stat.st_size > self._offset:
+                self._consume(stat.st_size)
+
+    def _reset(self, identity: Optional[Tuple[int, int]], offset: int) -> None:
+        self._identity = identity
+        self._offset = offset
+        # Line numbers are only known when reading starts at the top of the file
+        self._line_num = 0 if offset == 0 else None
+        self._pending = b""
+        self.buffer.reset(offset)
+
+    def _prime_offset(self, size: int) -> int:
+        """Find the line-aligned offset from which the tail fills the buffer"""
+        entries = 0
+        total = 0
+        offset = size
+        for line_offset, line in iter_lines_reverse(self.path, end=size):
+            entries += 1
+            total += self._entry_size(line)
+            if entries > self.buffer.max_entries or total > self.buffer.max_bytes:
+                return offset
+            offset = line_offset
+        return 0
+
+    def _consume(self, size: int) -> None:
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            while self._offset < size:
+                chunk = f.read(min(READ_CHUNK_SIZE, size - self._offset))
+                if not chunk:
+                    break
+                self._offset += len(chunk)
+                data = self._pending + chunk
+                line_start = self._offset - len(data)
+
+                lines = data.split(b"\n")
+                self._pending = lines.pop()
+                for line in lines:
+                    line_offset = line_start
+                    line_start += len(line) + 1
+                    if self._line_num is not None:
+                        self._line_num += 1
+                    entry = decode_entry(line)
+                    if entry is not None:
+                        buffered = BufferedEntry(line_offset, self._line_num, entry,
+                                                 self._entry_size(line))
+                        self.buffer.append(buffered, line_start)
+                    else:
+                        self.buffer.end_offset = line_start
+
+    @staticmethod
+    def _entry_size(line: bytes) -> int:
+        return len(line) * DECODED_SIZE_FACTOR + ENTRY_OVERHEAD_BYTES
+
+    def _poll_loop(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Log tailer refresh failed: {e}")
+
+    def _start_watchdog(self) -> None:
+        tailer = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = {getattr(event, "src_path", None), getattr(event, "dest_path", None)}
+                if str(tailer.path) in paths:
+                    try:
+                        tailer.refresh()
+                    except Exception as e:
+                        logger.error(f"Log tailer refresh failed: {e}")
+
+        observer = Observer()
+        observer.schedule(_Handler(), str(self.path.parent), recursive=False)
+        observer.start()
+        self._observer = observer
@@ -0,0 +1,199 @@
+"""
+Bounded views of large search results
+A MatchSampler takes every match of a pass, counts them all and keeps at most
+``limit`` of them, chosen by the mode:
+
+- first: the earliest matches in file order. The pass stops as soon as one
+  match more than ``limit`` is found, so ``total`` is then only a lower bound
+  (``total_exact`` is False)
+- last: the latest matches in file order
+- sample: a uniform random sample. Each match gets a pseudo-random key
+  derived from the seed and its position, and the ``limit`` smallest keys are
+  kept (reservoir sampling by priority), so the sample doesn't depend on how
+  the pass was split into pieces and the same seed gives the same sample.
+- stratified: the same keys, but kept per time bucket and handed out to the
+  buckets in turn, so the result is spread evenly over the matches' time
+  span. Buckets start STRATUM_MIN_MS wide and double whenever there are more
+  than twice as many as wanted, so no time range is needed up front.
+
+Samplers filled from separate pieces of a pass merge into the sampler of the
+whole pass, so they can be built in worker processes. ``done`` tells a pass
+that further matches can't change the result.
+"""
+
+import heapq
+import math
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from log_index import entry_timestamp
+
+SAMPLE_MODES = ("first", "last", "sample", "stratified")
+
+# Time buckets a stratified result is spread over (fewer when limit is smaller)
+STRATA = 10
+
+# Narrowest time bucket of a stratified result
+STRATUM_MIN_MS = 1000
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    """splitmix64 finalizer: scramble a 64-bit integer"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+
+def position_salt(*parts: Any) -> int:
+    """Salt telling apart matches at the same offset of different files"""
+    return zlib.crc32(":".join(str(part) for part in parts).encode("utf-8", "surrogatepass"))
+
+
+class MatchSampler:
+    """Count matches and keep a bounded selection of them
+
+    Matches are (line_num, entry, byte offset) triples; ``salt`` identifies the
+    file the offsets belong to. ``merge`` accepts another sampler's matches,
+    optionally transformed by ``wrap``, as coming after this one's in file order.
+    """
+
+    def __init__(self, mode: str, limit: int, seed: int = 0, salt: int = 0):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"'mode' must be one of {', '.join(SAMPLE_MODES)}, got {mode!r}")
+        if limit < 1:
+            raise ValueError(f"'limit' must be at least 1, got {limit!r}")
+        self.mode = mode
+        self.limit = limit
+        self.seed = seed
+        self.salt = salt
+        self.total = 0
+        self.strata = max(1, min(self.limit, STRATA))
+        self.width = STRATUM_MIN_MS
+        self._first: List[Any] = []
+        self._last: Deque[Any] = deque(maxlen=self.limit)
+        # Max-heaps of (-key, sequence, item) holding the smallest keys
+        self._heap: List[Tuple[int, int, Any]] = []
+        self._buckets: Dict[Optional[int], List[Tuple[int, int, Any]]] = {}
+        self._sequence = 0
+        self._seed_hash = _mix(seed & _MASK)
+
+    def empty_copy(self, salt: Optional[int] = None) -> "MatchSampler":
+        """A sampler with the same settings, or another file's ``salt``, and nothing in it"""
+        return MatchSampler(self.mode, self.limit, self.seed, self.salt if salt is None else salt)
+
+    def copy(self) -> "MatchSampler":
+        sampler = self.empty_copy()
+        sampler.merge(self)
+        return sampler
+
+    def add(self, match: Tuple[int, Dict[str, Any], int]) -> None:
+        self.total += 1
+        if self.mode == "first":
+            if len(self._first) <= self.limit:
+                self._first.append(match)
+        elif self.mode == "last":
+            self._last.append(match)
+        else:
+            key = _mix(self._seed_hash ^ _mix((self.salt << 40) ^ match[2]))
+            if self.mode == "sample":
+                self._keep(self._heap, key, match)
+            else:
+                self._add_stratified(entry_timestamp(match[1]), key, match)
+
+    def merge(self, other: "MatchSampler", wrap: Optional[Callable[[Any], Any]] = None) -> None:
+        """Take in ``other``'s matches, which come after this sampler's"""
+        wrap = wrap or (lambda item: item)
+        self.total += other.total
+        if self.mode == "first":
+            room = self.limit + 1 - len(self._first)
+            self._first.extend(wrap(item) for item in other._first[:max(room, 0)])
+        elif self.mode == "last":
+            self._last.extend(wrap(item) for item in other._last)
+        elif self.mode == "sample":
+            for negative_key, _, item in other._heap:
+                self._keep(self._heap, -negative_key, wrap(item))
+        else:
+            while self.width < other.width:
+                self._coarsen()
+            shift = self.width // other.width
+            for index, heap in other._buckets.items():
+                target = self._bucket(None if index is None else index // shift)
+                for negative_key, _, item in heap:
+                    self._keep(target, -negative_key, wrap(item))
+            self._rebalance()
+
+    def matches(self) -> List[Any]:
+        """The kept matches: in file order for first/last, otherwise in no particular order"""
+        if self.mode == "first":
+            return self._first[:self.limit]
+        if self.mode == "last":
+            return list(self._last)
+        if self.mode == "sample":
+            return [item for _, _, item in self._heap]
+        # Hand the slots to the time buckets in turn, each giving its lowest key next;
+        # when slots run out partway through a round, the buckets served are spread out
+        queues = [sorted(self._buckets[index], reverse=True) for index in sorted(
+            self._buckets, key=lambda index: -math.inf if index is None else index)]
+        chosen: List[Any] = []
+        depth = 0
+        while len(chosen) < self.limit:
+            available = [queue for queue in queues if depth < len(queue)]
+            if not available:
+                break
+            slots = min(self.limit - len(chosen), len(available))
+            for slot in range(slots):
+                chosen.append(available[(2 * slot + 1) * len(available) // (2 * slots)][depth][2])
+            depth += 1
+        return chosen
+
+    @property
+    def done(self) -> bool:
+        """Whether later matches can no longer change the selection (mode first only)"""
+        return self.mode == "first" and len(self._first) > self.limit
+
+    @property
+    def total_exact(self) -> bool:
+        """False when the pass stopped early and ``total`` only counts the matches seen"""
+        return not self.done
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "total": self.total, "total_exact": self.total_exact, "width": self.width,
+                "matches": self.matches()}
+
+    def _keep(self, heap: List[Tuple[int, int, Any]], key: int, item: Any) -> None:
+        if not self.limit:
+            return
+        self._sequence += 1
+        if len(heap) < self.limit:
+            heapq.heappush(heap, (-key, self._sequence, item))
+        elif key < -heap[0][0]:
+            heapq.heapreplace(heap, (-key, self._sequence, item))
+
+    def _bucket(self, index: Optional[int]) -> List[Tuple[int, int, Any]]:
+        heap = self._buckets.get(index)
+        if heap is None:
+            heap = self._buckets[index] = []
+        return heap
+
+    def _add_stratified(self, timestamp: Optional[float], key: int, item: Any) -> None:
+        index = None if timestamp is None else int(timestamp // self.width)
+        self._keep(self._bucket(index), key, item)
+        if len(self._buckets) > 2 * self.strata:
+            self._rebalance()
+
+    def _rebalance(self) -> None:
+        while sum(index is not None for index in self._buckets) > 2 * self.strata:
+            self._coarsen()
+
+    def _coarsen(self) -> None:
+        """Double the bucket width, merging neighbouring buckets"""
+        buckets = self._buckets
+        self._buckets = {}
+        self.width *= 2
+        for index, heap in buckets.items():
+            target = self._bucket(None if index is None else index // 2)
+            for negative_key, _, item in heap:
+                self._keep(target, -negative_key, item)
@@ -4,30 +4,135 @@ MCP Server for WeChat DevTools Logs
 This server provides tools for LLM agents (Cursor, Claude Code) to interact with WeChat development logs.
 
 Protocol: MCP via stdio (JSON-RPC 2.0)
-Tools: get_recent_logs, search_logs, get_error_summary, health_check
+Tools: get_recent_logs, search_logs, get_error_summary, log_stats, health_check, server_metrics
 Prompts: analyze_logs, debug_session
+Resources: wechat-log://logs/<file> (subscribable, filterable with ?level= and ?query=)
 """
 
 import asyncio
 import json
+import math
+import statistics
 import sys
 import os
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from contextvars import ContextVar
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
 
+from column_store import GROUP_BY, LEVEL_NAMES, StatsResult
+from cursors import Cursor, decode_cursor, encode_cursor, next_line_offset
+from error_groups import ErrorGroups
+from field_index import FieldFilter, decode_candidates, parse_where
+from health import CollectorProbe
+from log_index import in_window, parse_time
+from line_filter import LinePrefilter
+from log_reader import LOG_LEVELS, decode_entry, entry_message, iter_lines_reverse
+from log_segments import Segment, iter_segment_lines_reverse, list_segments
+from log_sources import LogSource, ProgressSplitter, merge_by_time, resolve_log_paths, unique_name
+from log_subscriptions import LogResource, LogSubscriptions, parse_resource_uri, resource_uri
+from match_sampler import SAMPLE_MODES, MatchSampler, position_salt
+from metrics import (CallStats, Metrics, MetricsExporter, SlowRequestProfiler, current_profile, current_stats,
+                     profiled_thread)
+from result_cache import FileState, ResultCache
+from scan_engine import (ProgressCallback, ScanCancelled, ScanEngine, SearchSpec, SummaryPart,
+                         entry_matches, merge_summaries, search_entries, search_segment, summarize_entries, summarize_segment)
+from stdio_transport import StdioTransport
+
 # Setup logging to stderr so it doesn't interfere with MCP communication
 logging.basicConfig(level=logging.INFO, stream=sys.stderr)
 logger = logging.getLogger(__name__)
 
 # Configuration - defaults can be overridden by environment variables
-LOG_FILE_PATH = Path(os.getenv('WECHAT_LOG_PATH', '../logs/wechat_logs.log'))
-if not LOG_FILE_PATH.is_absolute():
-    LOG_FILE_PATH = (Path(__file__).parent / LOG_FILE_PATH).resolve()
+# The log file to read: one path, a glob pattern, or several of either separated by os.pathsep.
+# Relative paths are taken from this directory.
+LOG_PATH_SPEC = os.getenv('WECHAT_LOG_PATH', '../logs/wechat_logs.log')
+
+# Seconds between checks of the log path for files that appeared since
+SOURCE_REFRESH_INTERVAL = 5.0
+
+# Optional live tail: keep the newest entries decoded in memory, following appends
+TAIL_ENABLED = os.getenv('WECHAT_LOG_TAIL', '0').lower() in ('1', 'true', 'yes')
+TAIL_MAX_ENTRIES = int(os.getenv('WECHAT_TAIL_MAX_ENTRIES', '10000'))
+TAIL_MAX_BYTES = int(os.getenv('WECHAT_TAIL_MAX_MB', '32')) * 1024 * 1024
+TAIL_POLL_INTERVAL = float(os.getenv('WECHAT_TAIL_POLL_INTERVAL', '0.5'))
+
+# Persistent trigram index stored next to the log to speed up search_logs
+SEARCH_INDEX_ENABLED = os.getenv('WECHAT_SEARCH_INDEX', '1').lower() in ('1', 'true', 'yes')
+
+# Top-level entry fields with a secondary index for `where` filters; empty disables the index
+INDEXED_FIELDS = [field.strip() for field in os.getenv('WECHAT_INDEXED_FIELDS', 'source,type').split(',')
+                  if field.strip()]
+
+# Background compaction of the log into column stores read by log_stats
+COLUMN_STORE_ENABLED = os.getenv('WECHAT_COLUMN_STORE', '1').lower() in ('1', 'true', 'yes')
+
+# log_stats: most buckets in one call, buckets aimed for when the size is chosen
+# automatically, and groups shown as table columns
+STATS_MAX_BUCKETS = 1000
+STATS_TARGET_BUCKETS = 60
+STATS_COLUMNS = 8
+STATS_BUCKET_SECONDS = (1, 5, 10, 30, 60, 300, 600, 900, 1800, 3600, 10800, 21600, 43200, 86400, 604800)
+STATS_BUCKET_UNITS = {"s": 1000, "m": 60 * 1000, "h": 3600 * 1000, "d": 86400 * 1000}
+
+# Full-file scans larger than the threshold are split across a process pool
+SCAN_WORKERS = int(os.getenv('WECHAT_SCAN_WORKERS', str(min(os.cpu_count() or 1, 8))))
+PARALLEL_THRESHOLD_BYTES = int(os.getenv('WECHAT_PARALLEL_THRESHOLD_MB', '64')) * 1024 * 1024
+
+# Memory budget for cached search_logs/get_error_summary results; 0 disables the cache
+RESULT_CACHE_BYTES = int(os.getenv('WECHAT_RESULT_CACHE_MB', '16')) * 1024 * 1024
+
+# Error groups listed per level by get_error_summary
+SUMMARY_GROUPS = 10
+
+# Log collection server probed by health_check; results are cached for the TTL in seconds
+COLLECTOR_HEALTH_URL = os.getenv('WECHAT_COLLECTOR_URL', 'http://127.0.0.1:3001/health')
+HEALTH_PROBE_TTL = float(os.getenv('WECHAT_HEALTH_PROBE_TTL', '5'))
+
+# Requests are handled concurrently; beyond this many, new requests wait for a slot
+MAX_CONCURRENT_REQUESTS = int(os.getenv('WECHAT_MAX_CONCURRENT_REQUESTS', '8'))
+
+# Per-tool latency and work counters reported by server_metrics. With a metrics file they
+# are also written there every interval seconds: JSON for a .json path, Prometheus text otherwise.
+# Relative paths are taken from this directory.
+METRICS_ENABLED = os.getenv('WECHAT_METRICS', '1').lower() in ('1', 'true', 'yes')
+METRICS_FILE = os.getenv('WECHAT_METRICS_FILE', '')
+METRICS_INTERVAL = float(os.getenv('WECHAT_METRICS_INTERVAL', '15'))
+
+# Tool calls slower than this many milliseconds get their hottest stacks logged; 0 turns the
+# sampling profiler off. Stacks are sampled every PROFILE_INTERVAL_MS while a call runs.
+PROFILE_SLOW_MS = float(os.getenv('WECHAT_PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_MS = float(os.getenv('WECHAT_PROFILE_INTERVAL_MS', '5'))
+
+# Cancel event of the request being handled. asyncio.to_thread copies it into worker
+# threads, where scans poll it so notifications/cancelled can stop them early.
+current_cancel: ContextVar[Optional[threading.Event]] = ContextVar('current_cancel', default=None)
+
+# Progress callback of the request being handled, set when it carries a progressToken
+current_progress: ContextVar[Optional[ProgressCallback]] = ContextVar('current_progress', default=None)
+
+# Least time in seconds between two notifications/progress for the same request
+PROGRESS_INTERVAL = float(os.getenv('WECHAT_PROGRESS_INTERVAL', '0.25'))
+
+# Resource subscriptions: matching entries appended within this many seconds are
+# announced with one notifications/resources/updated
+SUBSCRIPTION_DEBOUNCE = float(os.getenv('WECHAT_SUBSCRIPTION_DEBOUNCE', '0.5'))
 
-LOG_LEVELS = {"DEBUG": 1, "INFO": 2, "WARN": 3, "ERROR": 4, "log": 2, "info": 2, "warn": 3, "error": 4}
+# Newest matching entries returned by resources/read
+RESOURCE_READ_ENTRIES = int(os.getenv('WECHAT_RESOURCE_READ_ENTRIES', '100'))
 
-logger.info(f"MCP Server starting with log file: {LOG_FILE_PATH}")
+# A recent entry: (source, rotated segment or None, byte offset, entry)
+RecentEntry = Tuple[LogSource, Optional[Segment], int, Dict[str, Any]]
+
+# A search match: (source, rotated segment or None, line_num, entry, byte offset)
+SourceMatch = Tuple[LogSource, Optional[Segment], int, Dict[str, Any], int]
+
+logger.info(f"MCP Server starting with log path: {LOG_PATH_SPEC}")
 
 
 class WeChatMCPServer:
@@ -40,7 +145,150 @@ class WeChatMCPServer:
         self.request_count = 0
         self.error_count = 0
         self.last_error = None
+        # Log files by path; sources found while running get a live tail and index
+        self.sources: Dict[Path, LogSource] = {}
+        self.sources_checked_at: Optional[float] = None
+        self.running = False
+        self.scan_engine = ScanEngine(SCAN_WORKERS, PARALLEL_THRESHOLD_BYTES)
+        self.result_cache = ResultCache(RESULT_CACHE_BYTES)
+        self.collector_probe = CollectorProbe(COLLECTOR_HEALTH_URL, HEALTH_PROBE_TTL)
+        self.metrics = Metrics() if METRICS_ENABLED else None
+        self.profiler = (SlowRequestProfiler(PROFILE_SLOW_MS / 1000, PROFILE_INTERVAL_MS / 1000)
+                         if PROFILE_SLOW_MS > 0 else None)
+        self.in_flight: Dict[str, Tuple[asyncio.Task, threading.Event]] = {}
+        self.slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        # Sends a notification to the client outside of any response; set by main()
+        self.notify: Optional[Callable[[Any], None]] = None
+        self.subscriptions = LogSubscriptions(self._resource_paths, self._send_resource_updated,
+                                              SUBSCRIPTION_DEBOUNCE, TAIL_POLL_INTERVAL, self.log_sources,
+                                              SOURCE_REFRESH_INTERVAL)
+        # Static list results, built once; the encoded copies are spliced into responses
+        self.listings = {
+            "tools/list": {"tools": self._tool_definitions()},
+            "prompts/list": {"prompts": self._prompt_definitions()},
+            "resources/templates/list": {"resourceTemplates": self._resource_template_definitions()},
+        }
+        self.encoded_listings = {method: json.dumps(result).encode("utf-8")
+                                 for method, result in self.listings.items()}
+        self.tool_names = {tool["name"] for tool in self.listings["tools/list"]["tools"]}
+        
+    def dispatch(self, message: Any, respond: Callable[[Any], None]) -> Optional[asyncio.Task]:
+        """Start handling one incoming message without waiting for it to finish
+
+        Requests run as tasks and ``respond`` is called with each response as soon
+        as it is ready, so responses may arrive out of order; clients match them
+        by id. A batch (JSON array) is answered with one array once all of its
+        requests finish. Notifications are handled inline and never answered.
+        Responses are dicts, or bytes when they were encoded ahead of time.
+        """
+        if isinstance(message, list):
+            return self._dispatch_batch(message, respond)
+        if not isinstance(message, dict):
+            respond(self._error_response(None, -32600, "Invalid Request"))
+            return None
+        if "id" not in message:
+            self._handle_notification(message)
+            return None
         
+        encoded = self.encoded_listings.get(message.get("method"))
+        if encoded is not None:
+            self.request_count += 1
+            respond(b'{"jsonrpc": "2.0", "id": %s, "result": %s}'
+                    % (json.dumps(message["id"]).encode("utf-8"), encoded))
+            return None
+        
+        key = json.dumps(message["id"], sort_keys=True)
+        cancel = threading.Event()
+        task = asyncio.create_task(self._run_request(message, cancel, respond),
+                                   name=str(message.get("method")))
+        self.in_flight[key] = (task, cancel)
+        
+        def forget(_):
+            if self.in_flight.get(key, (None,))[0] is task:
+                del self.in_flight[key]
+        
+        task.add_done_callback(forget)
+        return task
+
+    def _dispatch_batch(self, messages: List[Any], respond: Callable[[Any], None]) -> Optional[asyncio.Task]:
+        """Dispatch every message of a batch and answer with a single array"""
+        if not messages:
+            respond(self._error_response(None, -32600, "Invalid Request: empty batch"))
+            return None
+        
+        responses: List[Any] = []
+        tasks = [task for task in (self.dispatch(message, responses.append) for message in messages)
+                 if task is not None]
+        if not tasks:
+            if responses:
+                respond(responses)
+            return None
+        
+        async def gather() -> None:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if responses:
+                respond(responses)
+        
+        return asyncio.create_task(gather())
+
+    def cancel_request(self, request_id: Any, reason: Optional[str] = None) -> bool:
+        """Stop an in-flight request; it will not get a response"""
+        entry = self.in_flight.get(json.dumps(request_id, sort_keys=True))
+        if entry is None or entry[0].get_name() == "initialize":
+            return False
+        task, cancel = entry
+        cancel.set()
+        task.cancel()
+        logger.info(f"Cancelled request {request_id!r}" + (f": {reason}" if reason else ""))
+        return True
+
+    def _handle_notification(self, message: Dict[str, Any]) -> None:
+        """Handle a message without an id; nothing is sent back"""
+        method = message.get("method")
+        params = message.get("params") or {}
+        if method == "notifications/cancelled":
+            self.cancel_request(params.get("requestId"), params.get("reason"))
+        elif method != "notifications/initialized":
+            logger.debug(f"Ignoring notification: {method}")
+
+    async def _run_request(self, request: Dict[str, Any], cancel: threading.Event,
+                           respond: Callable[[Any], None]) -> None:
+        """Handle one request once a concurrency slot is free and send its response"""
+        async with self.slots:
+            current_cancel.set(cancel)
+            meta = (request.get("params") or {}).get("_meta") or {}
+            if meta.get("progressToken") is not None:
+                current_progress.set(self._progress_reporter(meta["progressToken"], cancel))
+            response = await self.handle_request(request)
+        if not cancel.is_set():
+            respond(response)
+
+    def _progress_reporter(self, token: Any, cancel: threading.Event) -> ProgressCallback:
+        """Return a callback that sends notifications/progress for ``token``
+
+        It may be called from worker threads. Notifications are spaced at least
+        PROGRESS_INTERVAL apart, except the final one, and stop once the
+        request is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        last_sent = [0.0]
+        
+        def report(done: int, total: int) -> None:
+            now = time.monotonic()
+            if self.notify is None or cancel.is_set():
+                return
+            if done < total and now - last_sent[0] < PROGRESS_INTERVAL:
+                return
+            last_sent[0] = now
+            notification = {
+                "jsonrpc": "2.0",
+                "method": "notifications/progress",
+                "params": {"progressToken": token, "progress": done, "total": total}
+            }
+            loop.call_soon_threadsafe(self.notify, notification)
+        
+        return report
+
     async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """Handle incoming MCP requests"""
         method = request.get("method")
@@ -60,6 +308,16 @@ class WeChatMCPServer:
                 return await self._handle_prompts_list(request_id)
             elif method == "prompts/get":
                 return await self._handle_prompts_get(request_id, params)
+            elif method == "resources/list":
+                return await self._handle_resources_list(request_id)
+            elif method == "resources/templates/list":
+                return await self._handle_resource_templates_list(request_id)
+            elif method == "resources/read":
+                return await self._handle_resources_read(request_id, params)
+            elif method == "resources/subscribe":
+                return await self._handle_resources_subscribe(request_id, params)
+            elif method == "resources/unsubscribe":
+                return await self._handle_resources_unsubscribe(request_id, params)
             else:
                 return self._error_response(request_id, -32601, f"Method not found: {method}")
         except Exception as e:
@@ -68,6 +326,52 @@ class WeChatMCPServer:
             logger.error(f"Error handling request: {e}")
             return self._error_response(request_id, -32603, f"Internal error: {str(e)}")
 
+    def log_sources(self) -> List[LogSource]:
+        """Return the log files to read, checking the log path for new ones every few seconds"""
+        now = time.monotonic()
+        if self.sources_checked_at is None or now - self.sources_checked_at >= SOURCE_REFRESH_INTERVAL:
+            self.sources_checked_at = now
+            added = False
+            for path in resolve_log_paths(LOG_PATH_SPEC, Path(__file__).parent):
+                if path not in self.sources:
+                    source = LogSource(path, unique_name(path, (known.name for known in self.sources.values())))
+                    if self.running:
+                        self.start_source(source)
+                    self.sources[path] = source
+                    added = True
+            if added and self.running:
+                self.subscriptions.sources_changed()
+                if self.notify is not None:
+                    self.notify({"jsonrpc": "2.0", "method": "notifications/resources/list_changed"})
+        return list(self.sources.values())
+
+    def start_source(self, source: LogSource) -> None:
+        """Start a source's live tail and trigram index and restore its saved summaries"""
+        tail_options = None
+        if TAIL_ENABLED:
+            tail_options = {"max_entries": TAIL_MAX_ENTRIES, "max_bytes": TAIL_MAX_BYTES,
+                            "poll_interval": TAIL_POLL_INTERVAL}
+        source.start(tail_options, SEARCH_INDEX_ENABLED, INDEXED_FIELDS, COLUMN_STORE_ENABLED)
+        self.load_error_summaries(source)
+        logger.info(f"📁 Monitoring log file: {source.path}")
+
+    async def _each_source(self, sources: List[LogSource], func: Callable[..., Any], *args: Any) -> List[Any]:
+        """Run ``func(source, *args)`` for every source side by side in worker threads
+
+        Progress from the separate scans is reported as one total.
+        """
+        progress = current_progress.get()
+        splitter = ProgressSplitter(progress, len(sources)) if progress is not None and len(sources) > 1 else None
+        
+        def run(index: int, source: LogSource) -> Any:
+            if splitter is not None:
+                current_progress.set(splitter.part(index))
+            with profiled_thread():
+                return func(source, *args)
+        
+        return await asyncio.gather(*(asyncio.to_thread(run, index, source)
+                                      for index, source in enumerate(sources)))
+
     async def _handle_initialize(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle initialization request"""
         # Record start time on first initialize
@@ -83,7 +387,8 @@ class WeChatMCPServer:
                 "protocolVersion": "2024-11-05",
                 "capabilities": {
                     "tools": {},
-                    "prompts": {}
+                    "prompts": {},
+                    "resources": {"subscribe": True, "listChanged": True}
                 },
                 "serverInfo": {
                     "name": self.name,
@@ -92,12 +397,13 @@ class WeChatMCPServer:
             }
         }
 
-    async def _handle_tools_list(self, request_id: Any) -> Dict[str, Any]:
-        """List available tools"""
-        tools = [
+    @staticmethod
+    def _tool_definitions() -> List[Dict[str, Any]]:
+        """Tool descriptors returned by tools/list"""
+        return [
             {
                 "name": "get_recent_logs",
-                "description": "Get recent logs from WeChat DevTools with optional filtering by log level",
+                "description": "Get recent logs from WeChat DevTools with optional filtering by log level, newest page first; results come with a cursor for the next, older page",
                 "inputSchema": {
                     "type": "object",
                     "properties": {
@@ -111,6 +417,55 @@ class WeChatMCPServer:
                             "enum": ["DEBUG", "INFO", "WARN", "ERROR", "ALL"],
                             "description": "Minimum log level to include",
                             "default": "INFO"
+                        },
+                        "since": {
+                            "type": "string",
+                            "description": "Only include logs at or after this time (ISO 8601 or epoch milliseconds)"
+                        },
+                        "until": {
+                            "type": "string",
+                            "description": "Only include logs at or before this time (ISO 8601 or epoch milliseconds)"
+                        },
+                        "where": {
+                            "type": "object",
+                            "description": "Filter on top-level entry fields: {\"type\": \"global_error\"} for equality, {\"source\": {\"prefix\": \"pages/\"}} for a string prefix; all conditions must hold",
+                            "additionalProperties": True
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": "Cursor returned with the previous page; pass it with the same other arguments to get the next page"
+                        }
+                    }
+                }
+            },
+            {
+                "name": "log_stats",
+                "description": "Count logs per time bucket grouped by level, type or source, with each group's peak bucket; use it to see when errors spiked",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "hours": {
+                            "type": "number",
+                            "description": "Number of hours to look back when 'since' is not given",
+                            "default": 6
+                        },
+                        "since": {
+                            "type": "string",
+                            "description": "Start of the window (ISO 8601 or epoch milliseconds)"
+                        },
+                        "until": {
+                            "type": "string",
+                            "description": "End of the window (ISO 8601 or epoch milliseconds); defaults to now"
+                        },
+                        "bucket": {
+                            "type": "string",
+                            "description": "Bucket size such as 30s, 5m, 1h or 1d, or a number of seconds; chosen from the window when omitted"
+                        },
+                        "group_by": {
+                            "type": "string",
+                            "enum": list(GROUP_BY),
+                            "description": "Entry field the counts are split by",
+                            "default": "level"
                         }
                     }
                 }
@@ -124,15 +479,31 @@ class WeChatMCPServer:
                     "additionalProperties": False
                 }
             },
+            {
+                "name": "server_metrics",
+                "description": "Per-tool call counts, latency percentiles, bytes read, lines decoded and cache hits since the server started",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "format": {
+                            "type": "string",
+                            "enum": ["text", "prometheus"],
+                            "description": "Summary text, or the Prometheus text exposition format",
+                            "default": "text"
+                        }
+                    },
+                    "additionalProperties": False
+                }
+            },
             {
                 "name": "search_logs",
-                "description": "Search logs for specific text patterns",
+                "description": "Search logs for specific text patterns; full pages come with a cursor for the next page",
                 "inputSchema": {
                     "type": "object",
                     "properties": {
                         "query": {
                             "type": "string",
-                            "description": "Text to search for in log messages"
+                            "description": "Text to search for in log messages; may be left out when 'where' is given"
                         },
                         "level": {
                             "type": "string",
@@ -144,14 +515,41 @@ class WeChatMCPServer:
                             "type": "number",
                             "description": "Maximum number of results",
                             "default": 50
+                        },
+                        "mode": {
+                            "type": "string",
+                            "enum": list(SAMPLE_MODES),
+                            "description": "Which matches to show when there are more than 'limit': the oldest (first, pages with a cursor), the newest (last), a random sample (sample) or a sample spread evenly over time (stratified). Mode first stops reading after the matches it shows and reports the total as a lower bound; the other modes read every match and report the exact total",
+                            "default": "first"
+                        },
+                        "seed": {
+                            "type": "number",
+                            "description": "Seed for the sample and stratified modes; the same seed gives the same selection",
+                            "default": 0
+                        },
+                        "since": {
+                            "type": "string",
+                            "description": "Only include logs at or after this time (ISO 8601 or epoch milliseconds)"
+                        },
+                        "until": {
+                            "type": "string",
+                            "description": "Only include logs at or before this time (ISO 8601 or epoch milliseconds)"
+                        },
+                        "where": {
+                            "type": "object",
+                            "description": "Filter on top-level entry fields: {\"type\": \"global_error\"} for equality, {\"source\": {\"prefix\": \"pages/\"}} for a string prefix; all conditions must hold",
+                            "additionalProperties": True
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": "Cursor returned with the previous page of mode 'first'; pass it with the same other arguments to get the next page"
                         }
-                    },
-                    "required": ["query"]
+                    }
                 }
             },
             {
                 "name": "get_error_summary",
-                "description": "Get a summary of recent errors and warnings",
+                "description": "Get a summary of recent errors and warnings, grouped by fingerprint (numbers, ids, URLs and line numbers ignored) with counts and first/last seen times",
                 "inputSchema": {
                     "type": "object",
                     "properties": {
@@ -164,11 +562,13 @@ class WeChatMCPServer:
                 }
             }
         ]
-        
+
+    async def _handle_tools_list(self, request_id: Any) -> Dict[str, Any]:
+        """List available tools"""
         return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {"tools": tools}
+            "result": self.listings["tools/list"]
         }
 
     async def _handle_tools_call(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -178,26 +578,61 @@ class WeChatMCPServer:
         
         logger.info(f"Tool call: {tool_name} with args: {arguments}")
         
+        stats = CallStats() if self.metrics is not None else None
+        profile = self.profiler.begin() if self.profiler is not None else None
+        stats_token = current_stats.set(stats)
+        profile_token = current_profile.set(profile)
+        started = time.perf_counter()
+        called = None
+        try:
+            called = await self._call_tool(tool_name, arguments)
+        finally:
+            seconds = time.perf_counter() - started
+            current_stats.reset(stats_token)
+            current_profile.reset(profile_token)
+            if profile is not None:
+                self.profiler.finish(profile, str(tool_name), seconds)
+            if stats is not None and tool_name in self.tool_names:
+                # Tools report their own failures as text starting with ❌
+                text = called[0] if called is not None else ""
+                self.metrics.record(tool_name, seconds, stats, len(text.encode("utf-8")),
+                                    called is None or text.startswith("❌"))
+        if called is None:
+            return self._error_response(request_id, -32601, f"Unknown tool: {tool_name}")
+        
+        result, structured = called
+        tool_result: Dict[str, Any] = {"content": [{"type": "text", "text": result}]}
+        if structured is not None:
+            tool_result["structuredContent"] = structured
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": tool_result
+        }
+
+    async def _call_tool(self, tool_name: Any, arguments: Dict[str, Any]) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Run a tool, returning its text and structured result, or None for an unknown tool"""
+        structured = None
         if tool_name == "get_recent_logs":
             result = await self._get_recent_logs(arguments)
         elif tool_name == "search_logs":
             result = await self._search_logs(arguments)
         elif tool_name == "get_error_summary":
             result = await self._get_error_summary(arguments)
+        elif tool_name == "log_stats":
+            result, structured = await self._log_stats(arguments)
         elif tool_name == "health_check":
-            result = await self._health_check(arguments)
+            result, structured = await self._health_check(arguments)
+        elif tool_name == "server_metrics":
+            result, structured = await self._server_metrics(arguments)
         else:
-            return self._error_response(request_id, -32601, f"Unknown tool: {tool_name}")
-        
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {"content": [{"type": "text", "text": result}]}
-        }
+            return None
+        return result, structured
 
-    async def _handle_prompts_list(self, request_id: Any) -> Dict[str, Any]:
-        """List available prompts"""
-        prompts = [
+    @staticmethod
+    def _prompt_definitions() -> List[Dict[str, Any]]:
+        """Prompt descriptors returned by prompts/list"""
+        return [
             {
                 "name": "analyze_logs",
                 "description": "Analyze WeChat development logs for issues and patterns"
@@ -207,11 +642,13 @@ class WeChatMCPServer:
                 "description": "Start a debugging session with recent error logs"
             }
         ]
-        
+
+    async def _handle_prompts_list(self, request_id: Any) -> Dict[str, Any]:
+        """List available prompts"""
         return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {"prompts": prompts}
+            "result": self.listings["prompts/list"]
         }
 
     async def _handle_prompts_get(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -260,56 +697,156 @@ Please help me:
             }
         }
 
+    @staticmethod
+    def _resource_template_definitions() -> List[Dict[str, Any]]:
+        return [
+            {
+                "uriTemplate": "wechat-log://logs/{source}{?level,query}",
+                "name": "Filtered log file",
+                "description": "Newest entries of one log file at a minimum level (DEBUG, INFO, WARN, ERROR) and/or containing some text. Subscribe to be notified when matching entries are appended",
+                "mimeType": "text/plain"
+            },
+            {
+                "uriTemplate": "wechat-log://logs{?level,query}",
+                "name": "Filtered logs",
+                "description": "Like the above across every log file, merged by time",
+                "mimeType": "text/plain"
+            }
+        ]
+
+    async def _handle_resource_templates_list(self, request_id: Any) -> Dict[str, Any]:
+        """List resource templates for filtered logs"""
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": self.listings["resources/templates/list"]
+        }
+
+    async def _handle_resources_list(self, request_id: Any) -> Dict[str, Any]:
+        """List the log files as resources"""
+        sources = self.log_sources()
+        resources = [
+            {
+                "uri": resource_uri(source.name),
+                "name": source.name,
+                "description": f"Newest entries of {source.path}",
+                "mimeType": "text/plain"
+            }
+            for source in sources
+        ]
+        if len(sources) > 1:
+            resources.insert(0, {
+                "uri": resource_uri(),
+                "name": "All logs",
+                "description": "Newest entries of every log file, merged by time",
+                "mimeType": "text/plain"
+            })
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {"resources": resources}
+        }
+
+    async def _handle_resources_read(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Read the newest entries of a log resource; reads from the end, however large the log"""
+        uri = params.get("uri", "")
+        try:
+            resource = parse_resource_uri(uri)
+            sources = [source for source in self._resource_sources(resource) if source.path.exists()]
+        except ValueError as e:
+            return self._error_response(request_id, -32002, f"Resource not found: {e}")
+        
+        spec = resource.spec
+        per_source = await self._each_source(sources, self._collect_recent, RESOURCE_READ_ENTRIES, spec.min_level,
+                                             None, None, None, spec.query)
+        logs = list(islice(merge_by_time(per_source, lambda item: item[3], newest_first=True),
+                           RESOURCE_READ_ENTRIES))
+        text = "\n".join(self._format_entry(source, sources, log) for source, _, _, log in reversed(logs))
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {"contents": [{"uri": uri, "mimeType": "text/plain", "text": text}]}
+        }
+
+    async def _handle_resources_subscribe(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send notifications/resources/updated when entries matching a log resource are appended"""
+        try:
+            self.subscriptions.subscribe(params.get("uri", ""))
+        except ValueError as e:
+            return self._error_response(request_id, -32002, f"Resource not found: {e}")
+        return {"jsonrpc": "2.0", "id": request_id, "result": {}}
+
+    async def _handle_resources_unsubscribe(self, request_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Stop the notifications of a log resource"""
+        self.subscriptions.unsubscribe(params.get("uri", ""))
+        return {"jsonrpc": "2.0", "id": request_id, "result": {}}
+
+    def _resource_sources(self, resource: LogResource) -> List[LogSource]:
+        """The log files a resource covers; raises ValueError for an unknown one"""
+        sources = self.log_sources()
+        if resource.source is None:
+            return sources
+        for source in sources:
+            if source.name == resource.source:
+                return [source]
+        raise ValueError(f"Unknown log file: {resource.source}")
+
+    def _resource_paths(self, resource: LogResource) -> List[Path]:
+        return [source.path for source in self._resource_sources(resource)]
+
+    def _send_resource_updated(self, uri: str, count: int) -> None:
+        """Tell the client a subscribed resource gained ``count`` matching entries"""
+        if self.notify is None:
+            return
+        self.notify({
+            "jsonrpc": "2.0",
+            "method": "notifications/resources/updated",
+            "params": {"uri": uri, "_meta": {"newEntries": count}}
+        })
+
     async def _get_recent_logs(self, args: Dict[str, Any]) -> str:
-        """Get recent logs from the log file"""
+        """Get recent logs from the log files"""
         count = args.get("count", 10)
         level_filter = args.get("level", "INFO").upper()
         
         try:
-            if not LOG_FILE_PATH.exists():
-                return "📋 Log file not found. Make sure:\n1. Log collection server is running (make start)\n2. WeChat Mini-App is sending logs\n3. Check path: " + str(LOG_FILE_PATH)
+            since, until = self._parse_time_window(args)
+            sources = [source for source in self.log_sources() if source.path.exists()]
+            if not sources:
+                return "📋 Log file not found. Make sure:\n1. Log collection server is running (make start)\n2. WeChat Mini-App is sending logs\n3. Check path: " + LOG_PATH_SPEC
             
-            logs = []
             min_level = LOG_LEVELS.get(level_filter, 2) if level_filter != "ALL" else 0
+            where = parse_where(args.get("where"))
+            cursor_query = {"level": level_filter, "since": args.get("since"), "until": args.get("until")}
+            if where:
+                cursor_query["where"] = args["where"]
+            positions: Dict[Path, Cursor] = {}
+            if args.get("cursor"):
+                positions = decode_cursor(args["cursor"], "get_recent_logs", cursor_query)
             
-            with open(LOG_FILE_PATH, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            
-            # Process lines in reverse to get most recent first
-            for line in reversed(lines):
-                if len(logs) >= count:
-                    break
-                try:
-                    log_entry = json.loads(line.strip())
-                    log_level = log_entry.get("level", "INFO").upper()
-                    log_level_num = LOG_LEVELS.get(log_level, 2)
-                    
-                    if log_level_num >= min_level:
-                        logs.append(log_entry)
-                except json.JSONDecodeError:
-                    continue
+            # Each source is read newest-first on its own thread; the heads are merged by time
+            per_source = await self._each_source(
+                sources, lambda source: self._collect_recent(source, count, min_level, since, until,
+                                                             positions.get(source.path), where=where))
+            logs = list(islice(merge_by_time(per_source, lambda item: item[3], newest_first=True), count))
             
+            if not logs and positions:
+                return "📋 No older logs: this was the last page."
             if not logs:
-                return f"📋 No logs found matching level {level_filter} or higher.\n\nTry:\n- Lower the log level filter\n- Check if logs are being sent from WeChat app\n- Run 'make status' to check services"
+                matching = f"level {level_filter} or higher" + "".join(f", {c.describe()}" for c in where)
+                return f"📋 No logs found matching {matching}.\n\nTry:\n- Lower the log level filter\n- Check if logs are being sent from WeChat app\n- Run 'make status' to check services"
             
             # Format the logs nicely
-            formatted_logs = []
-            for log in reversed(logs):  # Reverse again to show chronological order
-                timestamp = log.get("timestamp", "Unknown time")
-                level = log.get("level", "INFO").upper()
-                
-                # Handle both message and arguments fields
-                if "message" in log:
-                    message = log.get("message")
-                elif "arguments" in log:
-                    args_list = log.get("arguments", [])
-                    message = " ".join(str(arg) for arg in args_list)
-                else:
-                    message = str(log)
-                
-                formatted_logs.append(f"[{timestamp}] {level}: {message}")
+            # Reverse again to show chronological order
+            formatted_logs = [self._format_entry(source, sources, log) for source, _, _, log in reversed(logs)]
             
-            return f"📋 Found {len(formatted_logs)} recent logs:\n\n" + "\n".join(formatted_logs)
+            result = f"📋 Found {len(formatted_logs)} recent logs:\n\n" + "\n".join(formatted_logs)
+            if len(logs) >= count:
+                for source, segment, offset, _ in logs:
+                    positions[source.path] = Cursor(offset, 0, segment.seq if segment else None)
+                next_cursor = encode_cursor("get_recent_logs", cursor_query, positions)
+                result += f"\n\n➡️ Older logs may follow; pass cursor \"{next_cursor}\" for the next page."
+            return result
             
         except Exception as e:
             logger.error(f"Error reading logs: {e}")
@@ -320,44 +857,68 @@ Please help me:
         query = args.get("query", "")
         level_filter = args.get("level", "ALL").upper()
         limit = args.get("limit", 50)
+        mode = args.get("mode", "first")
         
         try:
-            if not LOG_FILE_PATH.exists():
+            since, until = self._parse_time_window(args)
+            sources = [source for source in self.log_sources() if source.path.exists()]
+            if not sources:
                 return "📋 Log file not found. Make sure the log collection server is running."
             
-            matches = []
             min_level = LOG_LEVELS.get(level_filter, 0) if level_filter != "ALL" else 0
+            where = parse_where(args.get("where"))
+            spec = SearchSpec(query.lower(), min_level, since, until, where)
+            sampler = MatchSampler(mode, int(limit), int(args.get("seed", 0)))
+            cursor_query = {"query": query, "level": level_filter, "since": args.get("since"),
+                            "until": args.get("until")}
+            if where:
+                cursor_query["where"] = args["where"]
+            described = " and ".join(([f"'{query}'"] if query or not where else [])
+                                     + [condition.describe() for condition in where])
+            positions: Dict[Path, Cursor] = {}
+            if args.get("cursor"):
+                if mode != "first":
+                    raise ValueError("'cursor' pages through mode 'first' only")
+                positions = decode_cursor(args["cursor"], "search_logs", cursor_query)
             
-            with open(LOG_FILE_PATH, "r", encoding="utf-8") as f:
-                for line_num, line in enumerate(f, 1):
-                    if len(matches) >= limit:
-                        break
-                    try:
-                        log_entry = json.loads(line.strip())
-                        log_level = log_entry.get("level", "INFO").upper()
-                        log_level_num = LOG_LEVELS.get(log_level, 2)
-                        
-                        if log_level_num >= min_level:
-                            # Search in message or arguments
-                            if "message" in log_entry:
-                                searchable = log_entry.get("message", "")
-                            elif "arguments" in log_entry:
-                                args_list = log_entry.get("arguments", [])
-                                searchable = " ".join(str(arg) for arg in args_list)
-                            else:
-                                searchable = str(log_entry)
-                            
-                            if query.lower() in searchable.lower():
-                                timestamp = log_entry.get("timestamp", "Unknown")
-                                level = log_entry.get("level", "INFO").upper()
-                                matches.append(f"Line {line_num} [{timestamp}] {level}: {searchable}")
-                    except json.JSONDecodeError:
-                        continue
+            # Each source is searched on its own thread; the selections are merged by time
+            per_source = await self._each_source(
+                sources, lambda source: self._find_all_matches(source, spec, sampler, positions.get(source.path)))
+            found = self._select_matches(sources, per_source, sampler)
+            total = sum(matches.total for matches in per_source)
+            # Mode first stops reading once it has more matches than it shows
+            total_text = f"{total}" if all(matches.total_exact for matches in per_source) else f"at least {total}"
+            matches = []
+            for source, segment, line_num, log_entry, _ in found:
+                # Search in message or arguments
+                searchable = entry_message(log_entry)
+                timestamp = log_entry.get("timestamp", "Unknown")
+                level = log_entry.get("level", "INFO").upper()
+                location = f"{segment.name} line {line_num}" if segment else f"Line {line_num}"
+                matches.append(f"{self._source_tag(source, sources)}{location} [{timestamp}] {level}: {searchable}")
             
+            if not matches and positions:
+                return f"🔍 No more logs matching {described}: this was the last page."
             if not matches:
-                return f"🔍 No logs found matching '{query}'\n\nTry:\n- Different search terms\n- Broader log level filter\n- Check if logs contain the text you're looking for"
+                return f"🔍 No logs found matching {described}\n\nTry:\n- Different search terms\n- Broader log level filter\n- Check if logs contain the text you're looking for"
             
-            return f"🔍 Found {len(matches)} matching logs:\n\n" + "\n".join(matches)
+            matching = "more matching logs" if positions else "matching logs"
+            if total <= len(matches):
+                result = f"🔍 Found {total} {matching}:\n\n"
+            else:
+                shown = {"first": f"the {'next' if positions else 'first'} {len(matches)}",
+                         "last": f"the last {len(matches)}",
+                         "sample": f"a random sample of {len(matches)} (seed {sampler.seed})",
+                         "stratified": f"{len(matches)} spread over time (seed {sampler.seed})"}[mode]
+                result = f"🔍 Found {total_text} {matching}, showing {shown}:\n\n"
+            result += "\n".join(matches)
+            if mode == "first" and total > len(found):
+                # Each source resumes on the line after its last match shown
+                for source, segment, line_num, _, offset in found:
+                    positions[source.path] = Cursor(offset, line_num, segment.seq if segment else None)
+                next_cursor = encode_cursor("search_logs", cursor_query, positions)
+                result += f"\n\n➡️ More matches follow; pass cursor \"{next_cursor}\" for the next page."
+            return result
             
         except Exception as e:
             logger.error(f"Error searching logs: {e}")
@@ -368,50 +929,29 @@ Please help me:
         hours = args.get("hours", 24)
         
         try:
-            if not LOG_FILE_PATH.exists():
+            sources = [source for source in self.log_sources() if source.path.exists()]
+            if not sources:
                 return "📋 Log file not found."
             
-            errors = []
-            warnings = []
-            
-            with open(LOG_FILE_PATH, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        log_entry = json.loads(line.strip())
-                        level = log_entry.get("level", "INFO").upper()
-                        
-                        # Get message from various fields
-                        if "message" in log_entry:
-                            message = log_entry.get("message")
-                        elif "arguments" in log_entry:
-                            args_list = log_entry.get("arguments", [])
-                            message = " ".join(str(arg) for arg in args_list)
-                        else:
-                            message = str(log_entry)
-                        
-                        if level == "ERROR" or level == "error":
-                            errors.append(message)
-                        elif level == "WARN" or level == "warn":
-                            warnings.append(message)
-                    except json.JSONDecodeError:
-                        continue
+            since = time.time() * 1000 - hours * 3600 * 1000
+            per_source = await self._each_source(sources, self._summarize_source, since, hours)
+            result = merge_summaries(per_source)
             
             summary = f"📊 Error Summary (last {hours} hours):\n\n"
-            summary += f"🔴 **{len(errors)} Errors found:**\n"
-            if errors:
-                for i, error in enumerate(errors[-10:], 1):  # Show last 10 errors
-                    summary += f"{i}. {error}\n"
-            else:
-                summary += "  (No errors)\n"
+            if len(sources) > 1:
+                for source, part in zip(sources, per_source):
+                    summary += f"📁 {source.name}: {part.error_count} errors, {part.warning_count} warnings\n"
+                summary += "\n"
             
-            summary += f"\n🟡 **{len(warnings)} Warnings found:**\n"
-            if warnings:
-                for i, warning in enumerate(warnings[-10:], 1):  # Show last 10 warnings
-                    summary += f"{i}. {warning}\n"
-            else:
-                summary += "  (No warnings)\n"
+            error_sources = [(source.name, part.error_groups) for source, part in zip(sources, per_source)]
+            summary += f"🔴 **{result.error_count} Errors found{self._distinct(result.error_groups)}:**\n"
+            summary += self._format_groups(result.error_groups, error_sources) or "  (No errors)\n"
+            
+            warning_sources = [(source.name, part.warning_groups) for source, part in zip(sources, per_source)]
+            summary += f"\n🟡 **{result.warning_count} Warnings found{self._distinct(result.warning_groups)}:**\n"
+            summary += self._format_groups(result.warning_groups, warning_sources) or "  (No warnings)\n"
             
-            if not errors and not warnings:
+            if not result.error_count and not result.warning_count:
                 summary += "\n✅ No errors or warnings found! Your app is running smoothly."
             
             return summary
@@ -420,100 +960,690 @@ Please help me:
             logger.error(f"Error generating summary: {e}")
             return f"❌ Error generating summary: {str(e)}"
 
-    async def _health_check(self, arguments: Dict[str, Any]) -> str:
-        """Check the health of the MCP server and related components"""
+    async def _log_stats(self, args: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Count entries per time bucket, grouped by level, type or source
+
+        Returns the text rendering together with the structured counts.
+        """
+        group_by = args.get("group_by", "level")
+        
         try:
-            # Try to import requests, but don't fail if not available
-            try:
-                import requests
-                has_requests = True
-            except ImportError:
-                has_requests = False
-                logger.warning("requests library not available, skipping log server check")
-            
-            uptime = asyncio.get_event_loop().time() - self.start_time if self.start_time else 0
-            health_status = {
-                "mcp_server": {"status": "healthy", "uptime": f"{uptime:.2f}s"},
-                "request_stats": {"total": self.request_count, "errors": self.error_count},
-                "log_file": {"path": str(LOG_FILE_PATH), "status": "unknown"},
-                "log_server": {"url": "http://127.0.0.1:3001/health", "status": "unknown"}
-            }
+            if group_by not in GROUP_BY:
+                raise ValueError(f"'group_by' must be one of {', '.join(GROUP_BY)}, got {group_by!r}")
+            since, until = self._parse_time_window(args)
+            if until is None:
+                until = time.time() * 1000
+            if since is None:
+                since = until - float(args.get("hours", 6)) * 3600 * 1000
+            if since >= until:
+                raise ValueError("'since' must be before 'until'")
+            bucket_ms = self._parse_bucket(args.get("bucket"), until - since)
+            first_bucket, last_bucket = int(since // bucket_ms), int(until // bucket_ms)
+            if last_bucket - first_bucket + 1 > STATS_MAX_BUCKETS:
+                raise ValueError(f"{last_bucket - first_bucket + 1} buckets requested but at most "
+                                 f"{STATS_MAX_BUCKETS} are returned; use a larger bucket or a shorter window")
             
-            # Check log file accessibility
-            try:
-                if LOG_FILE_PATH.exists():
-                    if os.access(LOG_FILE_PATH, os.R_OK):
-                        health_status["log_file"]["status"] = "readable"
-                        stat = os.stat(LOG_FILE_PATH)
-                        health_status["log_file"]["size"] = f"{stat.st_size} bytes"
-                        health_status["log_file"]["lines"] = sum(1 for _ in open(LOG_FILE_PATH, 'r'))
-                    else:
-                        health_status["log_file"]["status"] = "permission_denied"
-                else:
-                    health_status["log_file"]["status"] = "not_found"
-            except Exception as e:
-                health_status["log_file"]["status"] = f"error: {str(e)}"
-            
-            # Check log server health (if requests available)
-            if has_requests:
-                try:
-                    response = requests.get("http://127.0.0.1:3001/health", timeout=5)
-                    if response.status_code == 200:
-                        health_status["log_server"]["status"] = "healthy"
-                        health_status["log_server"]["details"] = response.json()
-                    else:
-                        health_status["log_server"]["status"] = f"unhealthy (HTTP {response.status_code})"
-                except requests.exceptions.ConnectionError:
-                    health_status["log_server"]["status"] = "connection_refused"
-                except Exception as e:
-                    health_status["log_server"]["status"] = f"error: {str(e)}"
+            sources = [source for source in self.log_sources() if source.path.exists()]
+            if not sources:
+                return "📋 Log file not found. Make sure the log collection server is running.", None
+            
+            per_source = await self._each_source(sources, self._source_stats, since, until, bucket_ms, group_by)
+            counts: Counter = Counter()
+            totals: Counter = Counter()
+            for part in per_source:
+                counts.update(part.counts)
+                for (_, group), count in part.counts.items():
+                    totals[group] += count
+            
+            def when(timestamp: float) -> str:
+                fmt = "%Y-%m-%d %H:%M:%S" if bucket_ms < 60 * 1000 else "%Y-%m-%d %H:%M"
+                return datetime.fromtimestamp(timestamp / 1000).strftime(fmt)
+            
+            label = self._bucket_label(bucket_ms)
+            header = f"📈 Log stats by {group_by} ({label} buckets), {when(since)} → {when(until)}:\n\n"
+            if not totals:
+                return header + "No logs in this window.", None
+            
+            if group_by == "level":
+                groups = [name for name in reversed(LEVEL_NAMES) if totals[name]]
             else:
-                health_status["log_server"]["status"] = "not_checked (requests library not available)"
-            
-            # Determine overall health
-            overall_status = "healthy"
-            if health_status["log_file"]["status"] not in ["readable"]:
-                overall_status = "degraded"
-            if has_requests and health_status["log_server"]["status"] not in ["healthy"]:
-                overall_status = "degraded"
-            if self.error_count > 0:
-                overall_status = "degraded"
-            
-            # Format response
-            result = f"🏥 **System Health Check**\n\n"
-            result += f"**Overall Status**: {'✅' if overall_status == 'healthy' else '⚠️'} {overall_status.upper()}\n\n"
-            
-            result += f"**📊 MCP Server**\n"
-            result += f"- Status: ✅ {health_status['mcp_server']['status']}\n"
-            result += f"- Uptime: {health_status['mcp_server']['uptime']}\n"
-            result += f"- Requests: {health_status['request_stats']['total']} total, {health_status['request_stats']['errors']} errors\n\n"
+                groups = [name for name, _ in totals.most_common()]
+            shown = groups[:STATS_COLUMNS]
+            other = groups[STATS_COLUMNS:]
+            buckets = range(first_bucket, last_bucket + 1)
             
-            result += f"**📁 Log File**\n"
-            result += f"- Path: {health_status['log_file']['path']}\n"
-            status_icon = "✅" if health_status['log_file']['status'] == 'readable' else "❌"
-            result += f"- Status: {status_icon} {health_status['log_file']['status']}\n"
-            if "size" in health_status['log_file']:
-                result += f"- Size: {health_status['log_file']['size']}\n"
-            if "lines" in health_status['log_file']:
-                result += f"- Lines: {health_status['log_file']['lines']}\n"
-            
-            result += f"\n**🌐 Log Collection Server**\n"
-            result += f"- URL: {health_status['log_server']['url']}\n"
-            status_icon = "✅" if health_status['log_server']['status'] == 'healthy' else "❌"
-            result += f"- Status: {status_icon} {health_status['log_server']['status']}\n"
-            if "details" in health_status['log_server']:
-                details = health_status['log_server']['details']
-                result += f"- Uptime: {details.get('uptime', 0)/1000:.2f}s\n"
-                result += f"- Requests: {details.get('requestCount', 0)}, Errors: {details.get('errorCount', 0)}\n"
-            
-            if self.last_error:
-                result += f"\n**🔴 Last Error**: {self.last_error}\n"
+            peaks = {}
+            for group in shown:
+                series = [counts[(bucket, group)] for bucket in buckets]
+                peak = max(range(len(series)), key=series.__getitem__)
+                peaks[group] = {"count": series[peak], "start": (first_bucket + peak) * bucket_ms,
+                                "median": statistics.median(series)}
             
-            return result
+            result = header
+            if len(sources) > 1:
+                for source, part in zip(sources, per_source):
+                    result += f"📁 {source.name}: {sum(part.counts.values())} entries\n"
+                result += "\n"
+            result += "Totals: " + " · ".join(f"{group} {totals[group]}" for group in shown)
+            if other:
+                result += f" · {len(other)} more {group_by} values {sum(totals[group] for group in other)}"
+            result += "\n\nPeaks:\n"
+            for group, peak in peaks.items():
+                result += f"- {group}: {peak['count']} at {when(peak['start'])} (median {peak['median']:g} per bucket)\n"
+            
+            columns = shown + (["other"] if other else [])
+            result += "\n| Time | " + " | ".join(columns) + " |\n|" + "---|" * (len(columns) + 1) + "\n"
+            structured_buckets = []
+            empty = 0
+            for bucket in buckets:
+                row = {group: counts[(bucket, group)] for group in groups if counts[(bucket, group)]}
+                if not row:
+                    empty += 1
+                    continue
+                structured_buckets.append({"start": bucket * bucket_ms, "counts": row})
+                cells = [row.get(group, 0) for group in shown]
+                if other:
+                    cells.append(sum(row.get(group, 0) for group in other))
+                result += f"| {when(bucket * bucket_ms)} | " + " | ".join(str(cell) for cell in cells) + " |\n"
+            if empty:
+                result += f"\n({empty} buckets without logs not shown)\n"
+            
+            compacted = sum(part.compacted_rows for part in per_source)
+            scanned = sum(part.scanned_rows for part in per_source)
+            result += f"\n📦 {compacted} entries counted from column stores, {scanned} read from the log"
             
+            structured = {
+                "group_by": group_by,
+                "since": since,
+                "until": until,
+                "bucket_ms": bucket_ms,
+                "totals": {group: totals[group] for group in groups},
+                "peaks": peaks,
+                "buckets": structured_buckets,
+                "rows": {"compacted": compacted, "scanned": scanned}
+            }
+            return result, structured
+            
+        except Exception as e:
+            logger.error(f"Error computing log stats: {e}")
+            return f"❌ Error computing log stats: {str(e)}", None
+
+    def _source_stats(self, source: LogSource, since: float, until: float, bucket_ms: float,
+                      group_by: str) -> StatsResult:
+        """log_stats counts for one source, its rotated segments included"""
+        # With the compactor running only a short tail is read; without it, narrow the read by time
+        window: Tuple[int, Optional[int]] = (0, None)
+        if not COLUMN_STORE_ENABLED:
+            start, _, end = source.time_index.window(since, until)
+            window = (start, end)
+        return source.compactor.stats(since, until, bucket_ms, group_by, window, current_cancel.get())
+
+    @staticmethod
+    def _parse_bucket(value: Any, span_ms: float) -> float:
+        """Bucket size in milliseconds from "30s", "5m", "1h", "1d" or seconds; chosen from the span when absent"""
+        if value in (None, ""):
+            for seconds in STATS_BUCKET_SECONDS:
+                if span_ms <= seconds * 1000 * STATS_TARGET_BUCKETS:
+                    return seconds * 1000.0
+            return STATS_BUCKET_SECONDS[-1] * 1000.0
+        text = str(value).strip().lower()
+        unit = STATS_BUCKET_UNITS.get(text[-1:])
+        try:
+            amount = float(text[:-1] if unit else text)
+        except ValueError:
+            amount = math.nan
+        if not amount > 0 or math.isinf(amount):
+            raise ValueError(f"'bucket' must look like 30s, 5m, 1h or 1d, or be a number of seconds, got {value!r}")
+        return amount * (unit or 1000)
+
+    @staticmethod
+    def _bucket_label(bucket_ms: float) -> str:
+        for unit, size in sorted(STATS_BUCKET_UNITS.items(), key=lambda item: -item[1]):
+            if bucket_ms >= size and bucket_ms % size == 0:
+                return f"{int(bucket_ms // size)}{unit}"
+        return f"{bucket_ms / 1000:g}s"
+
+    def _format_entry(self, source: LogSource, sources: List[LogSource], log: Dict[str, Any]) -> str:
+        """One line of get_recent_logs output"""
+        timestamp = log.get("timestamp", "Unknown time")
+        level = log.get("level", "INFO").upper()
+        
+        # Handle both message and arguments fields
+        message = entry_message(log)
+        
+        return f"{self._source_tag(source, sources)}[{timestamp}] {level}: {message}"
+
+    @staticmethod
+    def _source_tag(source: LogSource, sources: List[LogSource]) -> str:
+        """Prefix naming the log file a line came from, when there is more than one"""
+        return f"[{source.name}] " if len(sources) > 1 else ""
+
+    @staticmethod
+    def _distinct(groups: ErrorGroups) -> str:
+        if not groups:
+            return ""
+        return f" in {len(groups)}{'+' if groups.full else ''} groups"
+
+    @staticmethod
+    def _format_groups(groups: ErrorGroups, sources: List[Tuple[str, ErrorGroups]]) -> str:
+        """List the most frequent groups with their counts and when they were seen
+
+        With more than one source, each group is tagged with the sources it came from.
+        """
+        def when(timestamp: Optional[float]) -> str:
+            if timestamp is None:
+                return "unknown"
+            return datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d %H:%M:%S")
+        
+        lines = []
+        for i, group in enumerate(groups.top(SUMMARY_GROUPS), 1):
+            count = f"~{group.count}" if group.error else f"{group.count}"
+            tag = ""
+            if len(sources) > 1:
+                tag = "[" + ", ".join(name for name, part in sources if group.key in part.groups) + "] "
+            lines.append(f"{i}. [×{count}] {tag}{group.sample}\n"
+                         f"   first seen {when(group.first_seen)}, last seen {when(group.last_seen)}\n")
+        return "".join(lines)
+
+    async def _health_check(self, arguments: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Check the health of the MCP server and related components
+
+        Returns the text rendering together with the structured status.
+        """
+        try:
+            health_status = await self._health_status()
+            return self._format_health(health_status), health_status
         except Exception as e:
             logger.error(f"Health check failed: {e}")
-            return f"❌ Health check failed: {str(e)}"
+            return f"❌ Health check failed: {str(e)}", None
+
+    async def _health_status(self) -> Dict[str, Any]:
+        """Collect health information; the cost does not depend on the log size"""
+        # Probe the collector while the log file is checked
+        log_server = asyncio.ensure_future(self.collector_probe.status())
+        
+        uptime = asyncio.get_event_loop().time() - self.start_time if self.start_time else 0
+        log_files = await asyncio.gather(*(self._source_health(source) for source in self.log_sources()))
+        
+        health_status = {
+            "status": "healthy",
+            "mcp_server": {
+                "status": "healthy",
+                "uptime": round(uptime, 2),
+                "requests": self.request_count,
+                "errors": self.error_count,
+                "last_error": self.last_error
+            },
+            "log_files": log_files,
+            "log_server": await log_server,
+            "result_cache": self.result_cache.stats()
+        }
+        
+        # Determine overall health
+        if (not log_files or any(log_file["status"] != "readable" for log_file in log_files)
+                or health_status["log_server"]["status"] != "healthy" or self.error_count > 0):
+            health_status["status"] = "degraded"
+        return health_status
+
+    async def _source_health(self, source: LogSource) -> Dict[str, Any]:
+        """Status, size and line count of one log file"""
+        log_file: Dict[str, Any] = {"path": str(source.path), "status": "unknown"}
+        try:
+            if source.path.exists():
+                if os.access(source.path, os.R_OK):
+                    lines, size = await asyncio.to_thread(source.line_counter.count)
+                    segments = await asyncio.to_thread(list_segments, source.path)
+                    log_file.update(status="readable", size=size, lines=lines, segments=len(segments),
+                                    segment_lines=sum(segment.lines or 0 for segment in segments))
+                else:
+                    log_file["status"] = "permission_denied"
+            else:
+                log_file["status"] = "not_found"
+        except Exception as e:
+            log_file["status"] = f"error: {str(e)}"
+        return log_file
+
+    def _format_health(self, health_status: Dict[str, Any]) -> str:
+        """Render a health status as the health_check text"""
+        overall_status = health_status["status"]
+        mcp_server = health_status["mcp_server"]
+        log_files = health_status["log_files"]
+        log_server = health_status["log_server"]
+        
+        result = f"🏥 **System Health Check**\n\n"
+        result += f"**Overall Status**: {'✅' if overall_status == 'healthy' else '⚠️'} {overall_status.upper()}\n\n"
+        
+        result += f"**📊 MCP Server**\n"
+        result += f"- Status: ✅ {mcp_server['status']}\n"
+        result += f"- Uptime: {mcp_server['uptime']:.2f}s\n"
+        result += f"- Requests: {mcp_server['requests']} total, {mcp_server['errors']} errors\n\n"
+        
+        if not log_files:
+            result += f"**📁 Log File**\n- Path: {LOG_PATH_SPEC}\n- Status: ❌ not_found\n\n"
+        for log_file in log_files:
+            result += f"**📁 Log File**\n"
+            result += f"- Path: {log_file['path']}\n"
+            status_icon = "✅" if log_file['status'] == 'readable' else "❌"
+            result += f"- Status: {status_icon} {log_file['status']}\n"
+            if "size" in log_file:
+                result += f"- Size: {log_file['size']} bytes\n"
+            if "lines" in log_file:
+                result += f"- Lines: {log_file['lines']}\n"
+            if log_file.get("segments"):
+                result += f"- Rotated segments: {log_file['segments']} ({log_file['segment_lines']} lines)\n"
+            result += "\n"
+        
+        result += f"**🌐 Log Collection Server**\n"
+        result += f"- URL: {log_server['url']}\n"
+        status_icon = "✅" if log_server['status'] == 'healthy' else "❌"
+        result += f"- Status: {status_icon} {log_server['status']}\n"
+        if isinstance(log_server.get("details"), dict):
+            details = log_server['details']
+            result += f"- Uptime: {details.get('uptime', 0)/1000:.2f}s\n"
+            result += f"- Requests: {details.get('requestCount', 0)}, Errors: {details.get('errorCount', 0)}\n"
+        
+        cache = health_status["result_cache"]
+        result += "\n**🗃️ Result Cache**\n"
+        result += f"- Entries: {cache['entries']} ({cache['bytes']} bytes, {cache['evictions']} evicted)\n"
+        result += f"- Hits: {cache['hits']}, Extended: {cache['extends']}, Misses: {cache['misses']}\n"
+        
+        if mcp_server["last_error"]:
+            result += f"\n**🔴 Last Error**: {mcp_server['last_error']}\n"
+        
+        return result
+
+    async def _server_metrics(self, arguments: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Report per-tool metrics as text or Prometheus exposition, with the structured form"""
+        if self.metrics is None:
+            return "📈 Metrics are off; set WECHAT_METRICS=1 to collect them.", None
+        status = self._metrics_status()
+        if arguments.get("format") == "prometheus":
+            return self._render_metrics("prometheus"), status
+        
+        result = (f"📈 Server metrics: {status['requests']} requests, {status['errors']} errors, "
+                  f"up {status['uptime_seconds']:.0f}s\n")
+        cache = status["result_cache"]
+        result += f"Result cache: {cache['hits']} hits, {cache['extends']} extends, {cache['misses']} misses\n\n"
+        
+        def bound(value: Optional[float]) -> str:
+            return "?" if value is None else "> 60 s" if math.isinf(value) else f"≤ {value:g} ms"
+        
+        for tool, tool_metrics in sorted(status["tools"].items()):
+            latency = tool_metrics["latency_ms"]
+            calls = tool_metrics["calls"]
+            result += (f"🔧 {tool}: {calls} calls, {tool_metrics['errors']} errors\n"
+                       f"  latency: p50 {bound(latency['p50'])}, p90 {bound(latency['p90'])}, "
+                       f"p99 {bound(latency['p99'])}, mean {latency['mean']:.1f} ms\n"
+                       f"  per call: {tool_metrics['bytes_read'] / calls / 1024:,.1f} KB read, "
+                       f"{tool_metrics['lines_decoded'] / calls:,.0f} lines decoded, "
+                       f"{tool_metrics['result_bytes']['sum'] / calls / 1024:,.1f} KB returned\n"
+                       f"  totals: {tool_metrics['decode_failures']} decode failures, "
+                       f"{tool_metrics['cache_hits']} cache hits, {tool_metrics['cache_misses']} cache misses\n")
+        if not status["tools"]:
+            result += "No tool calls yet.\n"
+        return result, status
+
+    def _metrics_status(self) -> Dict[str, Any]:
+        """Per-tool metrics with the server-wide counters"""
+        status = self.metrics.to_dict()
+        status.update(requests=self.request_count, errors=self.error_count,
+                      uptime_seconds=round(time.time() - status["since"], 2),
+                      result_cache=self.result_cache.stats())
+        return status
+
+    def _render_metrics(self, file_format: str) -> str:
+        """The metrics as JSON ("json") or Prometheus text ("prometheus")"""
+        if file_format == "json":
+            return json.dumps(self._metrics_status(), indent=2)
+        cache = self.result_cache.stats()
+        return self.metrics.to_prometheus({
+            "requests": self.request_count,
+            "request_errors": self.error_count,
+            **{f"result_cache_{key}": value for key, value in cache.items()}
+        })
+
+    def _parse_time_window(self, args: Dict[str, Any]):
+        """Read the optional since/until arguments as epoch milliseconds"""
+        window = []
+        for key in ("since", "until"):
+            value = args.get(key)
+            timestamp = parse_time(value) if value not in (None, "") else None
+            if value not in (None, "") and timestamp is None:
+                raise ValueError(f"'{key}' must be an ISO 8601 time or epoch milliseconds, got {value!r}")
+            window.append(timestamp)
+        return window[0], window[1]
+
+    def _iter_entries_newest_first(self, source: LogSource, since: Optional[float] = None,
+                                   until: Optional[float] = None, prefilter: Optional[LinePrefilter] = None,
+                                   before: Optional[Cursor] = None, where: Tuple[FieldFilter, ...] = ()):
+        """Yield (segment, offset, entry) newest-first across the log file and its rotated segments
+
+        ``segment`` is None for entries of the active log file. Segments whose
+        time range misses the window are skipped without being opened.
+        ``before`` is a cursor at the last entry already returned. ``where``
+        lets the field index choose the active file's candidate lines; the
+        caller still checks it on every entry.
+        """
+        if before is None or before.segment is None:
+            for offset, entry in self._iter_active_newest_first(source, since, until, prefilter,
+                                                                before.offset if before else None, where):
+                yield None, offset, entry
+        
+        windowed = since is not None or until is not None
+        cancel = current_cancel.get()
+        for segment in reversed(list_segments(source.path)):
+            end = None
+            if before is not None and before.segment is not None:
+                if segment.seq > before.segment:
+                    continue
+                if segment.seq == before.segment:
+                    end = before.offset
+            if not segment.overlaps(since, until):
+                continue
+            for offset, raw_line in iter_segment_lines_reverse(segment, end):
+                if cancel is not None and cancel.is_set():
+                    raise ScanCancelled()
+                if prefilter is not None and not prefilter(raw_line):
+                    continue
+                log_entry = decode_entry(raw_line)
+                if log_entry is not None and (not windowed or in_window(log_entry, since, until)):
+                    yield segment, offset, log_entry
+
+    def _iter_active_newest_first(self, source: LogSource, since: Optional[float] = None,
+                                  until: Optional[float] = None, prefilter: Optional[LinePrefilter] = None,
+                                  before: Optional[int] = None, where: Tuple[FieldFilter, ...] = ()):
+        """Yield (offset, entry) pairs of the active log file newest-first
+
+        Entries come from the live tail buffer while it lasts; anything older is
+        read backwards from disk starting exactly where the buffer begins, so the
+        cost depends on how many entries the caller consumes, not the file size.
+        With a time window, the timestamp index narrows the byte range first.
+        Disk lines rejected by ``prefilter`` are skipped without being decoded.
+        ``before`` starts the walk at the line ending just before that offset.
+        When the field index can answer ``where``, only its candidate lines
+        are read and the tail buffer is not needed.
+        """
+        windowed = since is not None or until is not None
+        start, end = 0, None
+        if windowed:
+            start, _, end = source.time_index.window(since, until)
+        if before is not None:
+            end = before if end is None else min(end, before)
+        
+        candidates = None
+        if where and source.field_index is not None:
+            candidates = source.field_index.candidate_lines_reverse(where, start, end)
+        
+        snapshot = source.tailer.snapshot() if source.tailer and candidates is None else None
+        if snapshot is not None:
+            for buffered in reversed(snapshot.entries):
+                if buffered.offset < start:
+                    return
+                if end is not None and buffered.offset >= end:
+                    continue
+                if not windowed or in_window(buffered.entry, since, until):
+                    yield buffered.offset, buffered.entry
+            if snapshot.start_offset <= start:
+                return
+            end = snapshot.start_offset if end is None else min(end, snapshot.start_offset)
+        
+        if end is None:
+            end = os.path.getsize(source.path)
+        if candidates is None:
+            candidates = iter_lines_reverse(source.path, end=end, start=start)
+        cancel = current_cancel.get()
+        progress = current_progress.get()
+        for line_count, (offset, raw_line) in enumerate(candidates):
+            if cancel is not None and cancel.is_set():
+                raise ScanCancelled()
+            if progress is not None and line_count % 1024 == 0:
+                progress(end - offset, end - start)
+            if prefilter is not None and not prefilter(raw_line):
+                continue
+            log_entry = decode_entry(raw_line)
+            if log_entry is not None and (not windowed or in_window(log_entry, since, until)):
+                yield offset, log_entry
+
+    def _collect_recent(self, source: LogSource, count: int, min_level: int, since: Optional[float],
+                        until: Optional[float], before: Optional[Cursor] = None,
+                        query: str = "", where: Tuple[FieldFilter, ...] = ()) -> List[RecentEntry]:
+        """Return up to ``count`` (source, segment, offset, entry) at ``min_level`` or above, newest first
+
+        A lower-cased ``query`` also requires the entry's text to contain it,
+        and ``where`` its fields to match.
+        """
+        logs = []
+        spec = SearchSpec(query, min_level, where=where)
+        entries = self._iter_entries_newest_first(source, since, until, spec.prefilter(), before, where)
+        for segment, offset, log_entry in entries:
+            if len(logs) >= count:
+                break
+            log_level = log_entry.get("level", "INFO").upper()
+            if LOG_LEVELS.get(log_level, 2) >= min_level and (not (query or where) or entry_matches(log_entry, spec)):
+                logs.append((source, segment, offset, log_entry))
+        return logs
+
+    def _scan_plan(self, source: LogSource, since: Optional[float], until: Optional[float],
+                   query: Optional[str] = None, after: Optional[Tuple[int, int]] = None, size: Optional[int] = None,
+                   where: Tuple[FieldFilter, ...] = ()):
+        """Work out what a forward pass over the log has to read
+
+        Returns (entries, None) with (line_num, entry, offset) candidates when the live tail
+        buffer holds the whole file or the field index can answer ``where``,
+        otherwise (None, ranges) with the (start, end, first_line) byte ranges
+        to scan. A time window narrows the range through the timestamp index
+        and a search query through the trigram index; ranges and candidates may
+        still contain entries that don't match.
+        ``after`` is an (offset, lines before it) pair where the pass starts at
+        the earliest, and ``size`` caps it at that many bytes of the file.
+        """
+        start, line_num, end = 0, 0, None
+        if since is not None or until is not None:
+            start, line_num, end = source.time_index.window(since, until)
+        if after is not None and after[0] > start:
+            start, line_num = after
+        if size is not None and (end is None or end > size):
+            end = size
+        if end is not None and end <= start:
+            return [], None
+        
+        snapshot = source.tailer.snapshot() if source.tailer else None
+        if snapshot is not None and snapshot.complete:
+            entries = [(buffered.line_num, buffered.entry, buffered.offset) for buffered in snapshot.entries
+                       if buffered.offset >= start and (end is None or buffered.offset < end)]
+            return entries, None
+        
+        if where and source.field_index is not None:
+            lines = source.field_index.candidate_lines(where, start, line_num, end)
+            if lines is not None:
+                return decode_candidates(lines), None
+        
+        ranges = None
+        if query and source.search_index is not None:
+            ranges = source.search_index.candidate_ranges(query, start, line_num, end)
+        if ranges is None:
+            ranges = [(start, end, line_num)]
+        elif end is not None:
+            ranges = [(range_start, end if range_end is None else min(range_end, end), first_line)
+                      for range_start, range_end, first_line in ranges if range_start < end]
+        return None, ranges
+
+    def _find_all_matches(self, source: LogSource, spec: SearchSpec, sampler: MatchSampler,
+                          after: Optional[Cursor] = None) -> MatchSampler:
+        """Pass over one source's matches, selecting (source, segment, line_num, entry, offset) as ``sampler`` does
+
+        Rotated segments are searched oldest first, then the active log file
+        (``segment`` None). ``after`` is a cursor at the last match already
+        returned. The result counts every match after it, or in mode first
+        stops counting once it has more than it keeps.
+        """
+        found = sampler.empty_copy()
+        active_after = None
+        if after is None or after.segment is not None:
+            self._search_segments(source, spec, found, after)
+            if found.done:
+                return found
+        else:
+            active_after = (next_line_offset(source.path, after.offset), after.line)
+        matches = self._find_matches(source, spec, sampler.empty_copy(position_salt(source.path)), active_after)
+        found.merge(matches, lambda match: (source, None) + match)
+        return found
+
+    def _search_segments(self, source: LogSource, spec: SearchSpec, found: MatchSampler,
+                         after: Optional[Cursor]) -> None:
+        """Search the rotated segments overlapping the search window into ``found``, oldest first"""
+        cancel = current_cancel.get()
+        for segment in list_segments(source.path):
+            if found.done:
+                break
+            if after is not None and segment.seq < after.segment or not segment.overlaps(spec.since, spec.until):
+                continue
+            # A resumed search starts after the previous page's last match
+            resuming = after is not None and segment.seq == after.segment
+            start, line_base = (after.offset, after.line) if resuming else (0, 0)
+            empty = found.empty_copy(position_salt(source.path, segment.seq))
+            
+            def scan(_size: Optional[int]) -> MatchSampler:
+                return search_segment(segment, spec, empty.empty_copy(), start, cancel, resuming)
+            
+            # Segments never change, so their results are only ever reused or recomputed
+            matches = self.result_cache.fetch(segment.path, ("search_logs", spec, empty.mode, empty.limit,
+                                                             empty.seed, start), scan, lambda *_: scan(None))
+            found.merge(matches, lambda match: (source, segment, line_base + match[0], match[1], match[2]))
+
+    def _find_matches(self, source: LogSource, spec: SearchSpec, sampler: MatchSampler,
+                      after: Optional[Tuple[int, int]] = None) -> MatchSampler:
+        """Pass over the active log file's (line_num, entry, offset) matches, selecting them as ``sampler`` does
+
+        ``sampler`` is left empty. ``after`` is an (offset, lines before it)
+        pair where the search resumes.
+        """
+        def scan(after: Optional[Tuple[int, int]], size: Optional[int]) -> MatchSampler:
+            entries, ranges = self._scan_plan(source, spec.since, spec.until, spec.query, after, size, spec.where)
+            if entries is not None:
+                return search_entries(entries, spec, sampler.empty_copy())
+            return self.scan_engine.search(source.path, ranges, spec, sampler.empty_copy(), current_cancel.get(),
+                                           current_progress.get())
+        
+        def extend(matches: MatchSampler, old_size: int, new_size: int) -> MatchSampler:
+            # Appended lines come after every cached match, so they can't change a finished selection
+            if matches.done:
+                return matches
+            extended = matches.copy()
+            extended.merge(scan((old_size, source.line_counter.lines_before(old_size)), new_size))
+            return extended
+        
+        key = ("search_logs", spec, sampler.mode, sampler.limit, sampler.seed, after)
+        return self.result_cache.fetch(source.path, key, lambda size: scan(after, size), extend)
+
+    @staticmethod
+    def _select_matches(sources: List[LogSource], per_source: List[MatchSampler],
+                        sampler: MatchSampler) -> List[SourceMatch]:
+        """Combine the sources' selections into one, oldest first"""
+        if sampler.mode == "first":
+            return list(islice(merge_by_time([matches.matches() for matches in per_source],
+                                             lambda match: match[3]), sampler.limit))
+        if sampler.mode == "last":
+            newest = merge_by_time([reversed(matches.matches()) for matches in per_source],
+                                   lambda match: match[3], newest_first=True)
+            return list(islice(newest, sampler.limit))[::-1]
+        
+        combined = sampler.empty_copy()
+        for matches in per_source:
+            combined.merge(matches)
+        # Put each source's picks back in file order, then merge the sources by time
+        chosen = combined.matches()
+        streams = [sorted((match for match in chosen if match[0] is source),
+                          key=lambda match: (math.inf if match[1] is None else match[1].seq, match[4]))
+                   for source in sources]
+        return list(merge_by_time(streams, lambda match: match[3]))
+
+    def _summarize(self, source: LogSource, since: Optional[float], until: Optional[float],
+                   cache_key: Optional[Any] = None) -> SummaryPart:
+        """Count errors and warnings in a time window
+
+        ``cache_key`` lets calls whose window start moves with the clock share a
+        cached summary, which stays valid as long as none of the entries it
+        counted has dropped out of the window.
+        """
+        def scan(after: Optional[Tuple[int, int]], size: Optional[int]) -> SummaryPart:
+            entries, ranges = self._scan_plan(source, since, until, None, after, size)
+            if entries is not None:
+                return summarize_entries((entry for _, entry, _ in entries), since, until)
+            return self.scan_engine.summarize(source.path, ranges, since, until, current_cancel.get(),
+                                              current_progress.get())
+        
+        def extend(summary: SummaryPart, old_size: int, new_size: int) -> SummaryPart:
+            return merge_summaries([summary, scan((old_size, 0), new_size)])
+        
+        def reusable(cached) -> bool:
+            cached_since = cached.context
+            if since is None or cached_since is None:
+                return since == cached_since
+            oldest = cached.value.oldest
+            return cached_since <= since and (oldest is None or oldest >= since)
+        
+        key = ("get_error_summary", since, until) if cache_key is None else cache_key
+        return self.result_cache.fetch(source.path, key, lambda size: scan(None, size), extend, reusable, since)
+
+    def _summarize_source(self, source: LogSource, since: float, hours: Any) -> SummaryPart:
+        """Errors and warnings of one source since a time, its rotated segments included"""
+        active = self._summarize(source, since, None, ("get_error_summary", hours))
+        return merge_summaries(self._summarize_segments(source, since, None) + [active])
+
+    def _summarize_segments(self, source: LogSource, since: Optional[float],
+                            until: Optional[float]) -> List[SummaryPart]:
+        """Count errors and warnings in the rotated segments overlapping a time window, oldest first
+
+        Segments never change, so the summary of one lying wholly inside the
+        window is worked out once and reused.
+        """
+        parts = []
+        cancel = current_cancel.get()
+        segments = list_segments(source.path)
+        for seq in set(source.segment_summaries) - {segment.seq for segment in segments}:
+            source.segment_summaries.pop(seq, None)
+        for segment in segments:
+            if not segment.overlaps(since, until):
+                continue
+            if segment.within(since, until):
+                part = source.segment_summaries.get(segment.seq)
+                if part is None:
+                    part = summarize_segment(segment, segment.first_timestamp, segment.last_timestamp, cancel)
+                    source.segment_summaries[segment.seq] = part
+            else:
+                part = summarize_segment(segment, since, until, cancel)
+            parts.append(part)
+        return parts
+
+    def save_error_summaries(self, source: LogSource) -> None:
+        """Write a source's cached error summaries next to its log"""
+        path = source.error_summary_path
+        records = [{"key": list(key), "state": list(cached.state), "since": cached.context,
+                    "summary": cached.value.to_dict()}
+                   for key, cached in self.result_cache.items(source.path) if key[0] == "get_error_summary"]
+        try:
+            temp_path = path.with_name(path.name + ".tmp")
+            temp_path.write_text(json.dumps({"version": 1, "summaries": records}), encoding="utf-8")
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save error summaries to {path}: {e}")
+
+    def load_error_summaries(self, source: LogSource) -> None:
+        """Restore a source's error summaries saved by an earlier run; stale ones are never used"""
+        path = source.error_summary_path
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") != 1:
+                return
+            for record in data["summaries"]:
+                summary = SummaryPart.from_dict(record["summary"])
+                self.result_cache.restore(source.path, tuple(record["key"]), FileState(*record["state"]), summary,
+                                          record["since"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring saved error summaries in {path}: {e}")
 
     def _error_response(self, request_id: Any, code: int, message: str) -> Dict[str, Any]:
         """Create an error response"""
@@ -529,26 +1659,43 @@ async def main():
     server = WeChatMCPServer()
     
     logger.info(f"🚀 {server.name} v{server.version} starting...")
-    logger.info(f"📁 Monitoring log file: {LOG_FILE_PATH}")
+    logger.info(f"📁 Log path: {LOG_PATH_SPEC}")
+    server.running = True
+    for source in server.log_sources():
+        server.start_source(source)
+    exporter = None
+    if server.metrics is not None and METRICS_FILE:
+        exporter = MetricsExporter(Path(__file__).parent / METRICS_FILE, METRICS_INTERVAL, server._render_metrics)
+        exporter.start()
+        logger.info(f"📈 Writing metrics to {exporter.path} every {METRICS_INTERVAL:g}s")
+    
     logger.info("📡 Ready to receive MCP requests via stdio")
     
-    # Read requests from stdin and write responses to stdout
+    transport = StdioTransport()
+    await transport.open()
+    server.notify = transport.send
+    
+    # Read requests from stdin and dispatch them; responses are written as they finish
+    pending = set()
     while True:
         try:
-            line = await asyncio.to_thread(sys.stdin.readline)
-            if not line:
+            line = await transport.read_line()
+            if line is None:
                 logger.info("EOF received, shutting down")
                 break
             
-            request = json.loads(line.strip())
-            response = await server.handle_request(request)
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Invalid JSON received: {e}")
+                transport.send(server._error_response(None, -32700, "Parse error"))
+                continue
             
-            # Write response to stdout (MCP communication channel)
-            print(json.dumps(response), flush=True)
+            task = server.dispatch(request, transport.send)
+            if task is not None:
+                pending.add(task)
+                task.add_done_callback(pending.discard)
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON received: {e}")
-            continue
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received, shutting down")
             break
@@ -556,6 +1703,20 @@ async def main():
             logger.error(f"Unexpected error: {e}")
             continue
     
+    # Let requests already received finish and send their responses
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    await transport.close()
+    
+    server.subscriptions.stop()
+    for source in server.log_sources():
+        server.save_error_summaries(source)
+        source.stop()
+    server.scan_engine.shutdown()
+    if exporter is not None:
+        exporter.stop()
+    
     logger.info("MCP server shutdown complete")
 
 
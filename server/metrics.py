@@ -0,0 +1,328 @@
+"""
+Per-tool metrics for the MCP server
+Every tool call gets a CallStats in the current_stats context variable, and
+the readers on its path add to it: bytes read, lines decoded, JSON decode
+failures and result cache hits. Scans run in the process pool count into a
+CallStats of their own that is returned with their result. When the call
+ends, its wall time and result size go into fixed-bucket histograms for the
+tool, next to running totals of the counters. With metrics off no CallStats
+is set and each hook costs one context variable lookup.
+
+Metrics renders everything as a dict or in the Prometheus text format, and
+MetricsExporter writes either to a file periodically. SlowRequestProfiler
+samples the stacks of the threads working for a call and logs the hottest
+ones when the call turns out to be slow.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Upper bounds of the result size histogram buckets, in bytes
+RESULT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Frames kept per sampled stack, innermost first
+PROFILE_STACK_DEPTH = 24
+
+# Hottest stacks logged for a slow call
+PROFILE_TOP_STACKS = 5
+
+
+class CallStats:
+    """Work done for one tool call"""
+
+    FIELDS = ("bytes_read", "lines_decoded", "decode_failures", "cache_hits", "cache_misses")
+    __slots__ = FIELDS
+
+    def __init__(self, *values: int):
+        for field, value in zip(self.FIELDS, values or (0,) * len(self.FIELDS)):
+            setattr(self, field, value)
+
+    def add(self, other: "CallStats") -> None:
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def to_dict(self) -> Dict[str, int]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __reduce__(self):
+        return CallStats, tuple(getattr(self, field) for field in self.FIELDS)
+
+
+# Stats of the tool call being handled; asyncio.to_thread carries it into worker threads
+current_stats: ContextVar[Optional[CallStats]] = ContextVar('current_stats', default=None)
+
+
+def count_read(size: int) -> None:
+    """Add ``size`` bytes read to the current call"""
+    stats = current_stats.get()
+    if stats is not None:
+        stats.bytes_read += size
+
+
+def counted(worker: Callable, *args: Any) -> Tuple[Any, CallStats]:
+    """Run ``worker(*args)`` in a pool process, returning its result with what it counted"""
+    stats = CallStats()
+    token = current_stats.set(stats)
+    try:
+        return worker(*args), stats
+    finally:
+        current_stats.reset(token)
+
+
+class Histogram:
+    """Counts of observations at or below each bound, plus one bucket above the last"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile; inf when it is above the last bound"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+
+class ToolMetrics:
+    """Calls of one tool"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.result_bytes = Histogram(RESULT_SIZE_BUCKETS)
+        self.totals = CallStats()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ms": {"p50": self.latency_ms.quantile(0.5), "p90": self.latency_ms.quantile(0.9),
+                           "p99": self.latency_ms.quantile(0.99),
+                           "mean": self.latency_ms.sum / self.calls if self.calls else None,
+                           "histogram": self.latency_ms.to_dict()},
+            "result_bytes": self.result_bytes.to_dict(),
+            **self.totals.to_dict()
+        }
+
+
+class Metrics:
+    """Per-tool metrics, safe to record from any thread"""
+
+    def __init__(self):
+        self.tools: Dict[str, ToolMetrics] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, tool: str, seconds: float, stats: CallStats, result_bytes: int, failed: bool) -> None:
+        with self._lock:
+            metrics = self.tools.get(tool)
+            if metrics is None:
+                metrics = self.tools[tool] = ToolMetrics()
+            metrics.calls += 1
+            metrics.errors += failed
+            metrics.latency_ms.observe(seconds * 1000)
+            metrics.result_bytes.observe(result_bytes)
+            metrics.totals.add(stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"since": self.started, "tools": {tool: metrics.to_dict() for tool, metrics in self.tools.items()}}
+
+    def to_prometheus(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """Render in the Prometheus text exposition format; ``extra`` adds server-wide gauges"""
+        lines: List[str] = []
+        with self._lock:
+            tools = sorted(self.tools.items())
+            for name, help_text in (("calls", "Tool calls"), ("errors", "Tool calls that failed")):
+                lines += [f"# HELP wechat_mcp_tool_{name}_total {help_text}",
+                          f"# TYPE wechat_mcp_tool_{name}_total counter"]
+                lines += [f'wechat_mcp_tool_{name}_total{{tool="{tool}"}} {getattr(metrics, name)}'
+                          for tool, metrics in tools]
+            for field in CallStats.FIELDS:
+                lines += [f"# TYPE wechat_mcp_tool_{field}_total counter"]
+                lines += [f'wechat_mcp_tool_{field}_total{{tool="{tool}"}} {getattr(metrics.totals, field)}'
+                          for tool, metrics in tools]
+            for name, scale, attribute in (("latency_seconds", 1000, "latency_ms"),
+                                           ("result_bytes", 1, "result_bytes")):
+                lines.append(f"# TYPE wechat_mcp_tool_{name} histogram")
+                for tool, metrics in tools:
+                    histogram = getattr(metrics, attribute)
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else f"{bound / scale:.10g}"
+                        lines.append(f'wechat_mcp_tool_{name}_bucket{{tool="{tool}",le="{le}"}} {cumulative}')
+                    lines.append(f'wechat_mcp_tool_{name}_sum{{tool="{tool}"}} {histogram.sum / scale:.10g}')
+                    lines.append(f'wechat_mcp_tool_{name}_count{{tool="{tool}"}} {histogram.count}')
+        for name, value in (extra or {}).items():
+            lines += [f"# TYPE wechat_mcp_{name} gauge", f"wechat_mcp_{name} {value:.10g}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Write the output of ``render(format)`` to a file every ``interval`` seconds
+
+    The format is JSON for a path ending in .json and Prometheus text
+    otherwise. Each write replaces the file atomically.
+    """
+
+    def __init__(self, path: Union[str, Path], interval: float, render: Callable[[str], str]):
+        self.path = Path(path)
+        self.interval = interval
+        self.render = render
+        self.format = "json" if self.path.suffix == ".json" else "prometheus"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.write()
+
+    def write(self) -> None:
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        try:
+            temporary.write_text(self.render(self.format), encoding="utf-8")
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.path}: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+class CallProfile:
+    """Stack samples taken while one call ran"""
+
+    def __init__(self):
+        self.threads: Set[int] = set()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+
+# Profile of the tool call being handled, when the profiler is on
+current_profile: ContextVar[Optional[CallProfile]] = ContextVar('current_profile', default=None)
+
+
+@contextmanager
+def profiled_thread() -> Iterator[None]:
+    """Have the profiler sample this thread for the current call while the block runs"""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profile.threads.add(thread_id)
+    try:
+        yield
+    finally:
+        profile.threads.discard(thread_id)
+
+
+class SlowRequestProfiler:
+    """Sample the stacks of calls' worker threads and log the hottest for slow calls
+
+    One background thread wakes every ``interval`` seconds while a call is
+    being profiled and records the stack of each thread registered with
+    profiled_thread(). Calls taking at least ``threshold`` seconds have their
+    most frequent stacks logged. Work done in the scan pool's processes shows
+    up as the thread waiting for it.
+    """
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self._profiles: Set[CallProfile] = set()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self) -> CallProfile:
+        profile = CallProfile()
+        with self._lock:
+            self._profiles.add(profile)
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def finish(self, profile: CallProfile, tool: str, seconds: float) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+            if not self._profiles:
+                self._active.clear()
+        if seconds < self.threshold or not profile.sample_count:
+            return
+        hot = "\n".join(f"  {count / profile.sample_count:5.1%} {stack}"
+                        for stack, count in profile.samples.most_common(PROFILE_TOP_STACKS))
+        logger.warning(f"🐢 Slow {tool} call took {seconds * 1000:.0f} ms; hottest of {profile.sample_count} "
+                       f"stack samples (outermost first):\n{hot}")
+
+    def _run(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                profiles = list(self._profiles)
+            for profile in profiles:
+                for thread_id in list(profile.threads):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.samples[_stack_key(frame)] += 1
+                        profile.sample_count += 1
+
+
+def _stack_key(frame) -> str:
+    """A stack as 'outer;...;inner' of file:function:line"""
+    parts = []
+    while frame is not None and len(parts) < PROFILE_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    # Thread pool plumbing is the same for every stack
+    while parts and parts[-1].startswith(("threading.py:", "thread.py:")):
+        parts.pop()
+    return ";".join(reversed(parts))
@@ -0,0 +1,189 @@
+"""
+Result cache for tool calls
+An LRU cache bounded by approximate memory use. Each result is stored with
+the state of the log file it was computed from; it is returned as-is while
+the file is unchanged and extended over the appended bytes when the file
+has only grown.
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from metrics import current_stats
+
+T = TypeVar("T")
+
+# Bytes before the cached end of file that must be unchanged for an append
+TAIL_CHECK_BYTES = 4096
+
+
+class FileState(NamedTuple):
+    """Identity and extent of the log file a result was computed from"""
+    dev: int
+    ino: int
+    size: int
+    mtime_ns: int
+    tail_crc: int
+
+
+class CachedResult(NamedTuple):
+    state: FileState
+    value: Any
+    context: Any
+    nbytes: int
+
+
+def file_state(path: Union[str, Path]) -> Optional[FileState]:
+    """Return the file's current state, or None when it can't be cached
+
+    Files ending in a partly written line are not cached: the line may still
+    change, and appends are only recognised at line boundaries. Compressed
+    segments are exempt; they are renamed into place complete.
+    """
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            tail = b""
+            if stat.st_size:
+                f.seek(max(stat.st_size - TAIL_CHECK_BYTES, 0))
+                tail = f.read(min(stat.st_size, TAIL_CHECK_BYTES))
+    except OSError:
+        return None
+    if tail and not tail.endswith(b"\n") and not str(path).endswith(".gz"):
+        return None
+    return FileState(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, zlib.crc32(tail))
+
+
+def _appended(old: FileState, new: FileState, path: Union[str, Path]) -> bool:
+    """True when ``new`` is ``old`` with bytes appended to it"""
+    if (old.dev, old.ino) != (new.dev, new.ino) or new.size <= old.size:
+        return False
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(old.size - TAIL_CHECK_BYTES, 0))
+            tail = f.read(min(old.size, TAIL_CHECK_BYTES))
+    except OSError:
+        return False
+    return zlib.crc32(tail) == old.tail_crc
+
+
+def approximate_size(value: Any) -> int:
+    """Rough memory footprint of a result made of dicts, lists and scalars"""
+    if isinstance(value, str):
+        return 50 + len(value)
+    if isinstance(value, dict):
+        return 100 + sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 60 + sum(approximate_size(item) for item in value)
+    if hasattr(value, "to_dict"):
+        return approximate_size(value.to_dict())
+    return 32
+
+
+class ResultCache:
+    """LRU cache of tool results tied to the state of the log file they read
+
+    ``fetch`` returns a cached result when the file is unchanged (a hit),
+    extends it over the appended bytes when the file has only grown (an
+    extend), and computes it from scratch otherwise (a miss). Results are
+    evicted least recently used first once their total estimated size
+    exceeds ``max_bytes``, shared by all log files.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[Path, Hashable], CachedResult]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.extends = 0
+        self.evictions = 0
+
+    def fetch(self, path: Union[str, Path], key: Hashable, compute: Callable[[Optional[int]], T],
+              extend: Callable[[T, int, int], T],
+              reusable: Optional[Callable[[CachedResult], bool]] = None, context: Any = None) -> T:
+        """Return the result for ``key`` computed from the log file at ``path``
+
+        ``compute(size)`` must read the file only up to ``size`` bytes (or to
+        its end when ``size`` is None, for files that can't be cached), and
+        ``extend(value, old_size, new_size)`` must return ``value`` updated
+        with the bytes between the two sizes. ``reusable`` can reject a cached
+        result whose ``context`` no longer fits the call.
+        """
+        path = Path(path)
+        state = file_state(path)
+        if state is None or self.max_bytes <= 0:
+            return compute(None)
+        key = (path, key)
+        # Extending a result counts as a hit for the call's stats
+        stats = current_stats.get()
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        if cached is not None and (reusable is None or reusable(cached)):
+            if cached.state == state:
+                with self._lock:
+                    self.hits += 1
+                if stats is not None:
+                    stats.cache_hits += 1
+                return cached.value
+            if _appended(cached.state, state, path):
+                value = extend(cached.value, cached.state.size, state.size)
+                with self._lock:
+                    self.extends += 1
+                if stats is not None:
+                    stats.cache_hits += 1
+                self._store(key, state, value, cached.context)
+                return value
+
+        value = compute(state.size)
+        with self._lock:
+            self.misses += 1
+        if stats is not None:
+            stats.cache_misses += 1
+        self._store(key, state, value, context)
+        return value
+
+    def items(self, path: Union[str, Path]) -> List[Tuple[Hashable, CachedResult]]:
+        """Return the results cached for the log file at ``path``, least recently used first"""
+        path = Path(path)
+        with self._lock:
+            return [(key, cached) for (key_path, key), cached in self._entries.items() if key_path == path]
+
+    def restore(self, path: Union[str, Path], key: Hashable, state: FileState, value: Any,
+                context: Any = None) -> None:
+        """Add a result computed elsewhere, e.g. saved by an earlier run"""
+        self._store((Path(path), key), state, value, context)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "extends": self.extends,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, key: Hashable, state: FileState, value: Any, context: Any) -> None:
+        nbytes = approximate_size(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = CachedResult(state, value, context, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
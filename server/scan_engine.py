@@ -0,0 +1,414 @@
+"""
+Parallel scan engine for full-file log passes
+Memory-maps the log, splits the requested byte ranges into newline-aligned
+pieces and filters/aggregates them in a process pool. Partial results are merged
+in file order, so limits and line numbers match a single-threaded pass exactly.
+Small scans stay on the calling thread.
+"""
+
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from error_groups import ErrorGroups
+from field_index import FieldFilter
+from line_filter import LinePrefilter, combine_prefilters, field_prefilter, level_prefilter, query_prefilter
+from log_index import entry_timestamp, in_window
+from log_reader import LOG_LEVELS, decode_entry, entry_message
+from log_segments import Segment, iter_segment_lines
+from match_sampler import MatchSampler
+from metrics import CallStats, count_read, counted, current_stats
+
+logger = logging.getLogger(__name__)
+
+# Serial scans run in pieces of at most this size so a cancellation is noticed quickly
+SERIAL_PIECE_BYTES = 4 * 1024 * 1024
+
+
+class ScanCancelled(Exception):
+    """Raised when a scan's cancel event is set before it finishes"""
+
+
+class SearchSpec(NamedTuple):
+    """What search_logs is looking for"""
+    query: str
+    min_level: int
+    since: Optional[float] = None
+    until: Optional[float] = None
+    where: Tuple[FieldFilter, ...] = ()
+
+    def prefilter(self) -> Optional[LinePrefilter]:
+        """The raw-line prefilters for this search combined"""
+        return combine_prefilters(level_prefilter(self.min_level), query_prefilter(self.query),
+                                  field_prefilter(self.where))
+
+
+# A search match: (line_num, entry, byte offset of the line)
+Match = Tuple[int, Dict[str, Any], int]
+
+# Called with (bytes done, bytes in total) as a scan advances
+ProgressCallback = Callable[[int, int], None]
+
+
+class SearchPart(NamedTuple):
+    """Matches found in one byte range; line numbers are relative to the range start"""
+    line_count: int
+    matches: MatchSampler
+
+
+class SummaryPart(NamedTuple):
+    """Error/warning counts and fingerprint groups for one byte range
+
+    ``oldest`` is the earliest timestamp among the counted entries when the
+    summary has a time window, so callers can tell whether moving the window's
+    start forward would drop any of them.
+    """
+    error_count: int
+    warning_count: int
+    error_groups: ErrorGroups
+    warning_groups: ErrorGroups
+    oldest: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"error_count": self.error_count, "warning_count": self.warning_count,
+                "error_groups": self.error_groups.to_dict(), "warning_groups": self.warning_groups.to_dict(),
+                "oldest": self.oldest}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SummaryPart":
+        return cls(data["error_count"], data["warning_count"], ErrorGroups.from_dict(data["error_groups"]),
+                   ErrorGroups.from_dict(data["warning_groups"]), data["oldest"])
+
+
+def entry_matches(entry: Dict[str, Any], spec: SearchSpec) -> bool:
+    """Apply search_logs' level, time window, field and substring filters to one entry"""
+    log_level = entry.get("level", "INFO").upper()
+    if LOG_LEVELS.get(log_level, 2) < spec.min_level:
+        return False
+    if (spec.since is not None or spec.until is not None) and not in_window(entry, spec.since, spec.until):
+        return False
+    if not all(condition.matches(entry) for condition in spec.where):
+        return False
+    return spec.query in entry_message(entry).lower()
+
+
+def search_entries(numbered_entries: Iterable[Match], spec: SearchSpec, sampler: MatchSampler) -> MatchSampler:
+    """Feed the (line_num, entry, offset) triples that match ``spec`` to ``sampler`` until it is done"""
+    for numbered in numbered_entries:
+        if entry_matches(numbered[1], spec):
+            sampler.add(numbered)
+            if sampler.done:
+                break
+    return sampler
+
+
+def summarize_entries(entries: Iterable[Dict[str, Any]], since: Optional[float] = None,
+                      until: Optional[float] = None) -> SummaryPart:
+    """Count errors and warnings in a window, grouping them by fingerprint"""
+    error_groups = ErrorGroups()
+    warning_groups = ErrorGroups()
+    oldest = None
+    windowed = since is not None or until is not None
+    for entry in entries:
+        level = entry.get("level", "INFO").upper()
+        if level != "ERROR" and level != "WARN":
+            continue
+        timestamp = entry_timestamp(entry)
+        if windowed:
+            if timestamp is None or (since is not None and timestamp < since) \
+                    or (until is not None and timestamp > until):
+                continue
+            if oldest is None or timestamp < oldest:
+                oldest = timestamp
+        groups = error_groups if level == "ERROR" else warning_groups
+        groups.add(level, entry_message(entry), entry.get("stack"), timestamp)
+    return SummaryPart(error_groups.total, warning_groups.total, error_groups, warning_groups, oldest)
+
+
+def merge_summaries(parts: Iterable[SummaryPart]) -> SummaryPart:
+    """Combine per-range summaries given in file order"""
+    merged = None
+    for part in parts:
+        if merged is None:
+            merged = part
+            continue
+        oldest = merged.oldest if part.oldest is None else \
+            part.oldest if merged.oldest is None else min(merged.oldest, part.oldest)
+        merged = SummaryPart(merged.error_count + part.error_count, merged.warning_count + part.warning_count,
+                             merged.error_groups.merge(part.error_groups),
+                             merged.warning_groups.merge(part.warning_groups), oldest)
+    if merged is None:
+        return SummaryPart(0, 0, ErrorGroups(), ErrorGroups())
+    return merged
+
+
+# ----------------------------------------------------------------------
+# Range workers. These run in pool processes, so they take a path rather than
+# an open file and return plain picklable results.
+
+def _open_map(path: Union[str, Path]) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _iter_mapped_lines(mm: mmap.mmap, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    position = start
+    while position < end:
+        newline = mm.find(b"\n", position, end)
+        if newline == -1:
+            yield position, mm[position:end]
+            return
+        yield position, mm[position:newline]
+        position = newline + 1
+
+
+def _decode_numbered(lines: Iterable[Tuple[int, bytes]],
+                     prefilter: Optional[LinePrefilter] = None) -> Iterator[Match]:
+    """Decode (offset, line) pairs that pass ``prefilter``, numbering every line from 1"""
+    for line_num, (offset, raw_line) in enumerate(lines, 1):
+        if prefilter is not None and not prefilter(raw_line):
+            continue
+        entry = decode_entry(raw_line)
+        if entry is not None:
+            yield line_num, entry, offset
+
+
+def _count_lines(mm: mmap.mmap, start: int, end: int) -> int:
+    if end <= start:
+        return 0
+    count = 0
+    position = start
+    while position < end:
+        block_end = min(position + (16 << 20), end)
+        count += mm[position:block_end].count(b"\n")
+        position = block_end
+    return count + (mm[end - 1] != 0x0A)
+
+
+def search_range(path: Union[str, Path], start: int, end: int, spec: SearchSpec,
+                 sampler: MatchSampler) -> SearchPart:
+    """Search one byte range into an empty copy of ``sampler``; always reports the range's full line count"""
+    matches = sampler.empty_copy()
+    mm = _open_map(path)
+    if mm is None:
+        return SearchPart(0, matches)
+    with mm:
+        end = min(end, len(mm))
+        count_read(end - start)
+        prefilter = spec.prefilter()
+        entries = _decode_numbered(_iter_mapped_lines(mm, start, end), prefilter)
+        return SearchPart(_count_lines(mm, start, end), search_entries(entries, spec, matches))
+
+
+def summarize_range(path: Union[str, Path], start: int, end: int, since: Optional[float],
+                    until: Optional[float]) -> SummaryPart:
+    """Summarize errors and warnings in one byte range"""
+    mm = _open_map(path)
+    if mm is None:
+        return SummaryPart(0, 0, ErrorGroups(), ErrorGroups())
+    with mm:
+        end = min(end, len(mm))
+        count_read(end - start)
+        # Only WARN and ERROR entries are counted
+        lines = _iter_mapped_lines(mm, start, end)
+        entries = (entry for _, entry, _ in _decode_numbered(lines, level_prefilter(LOG_LEVELS["WARN"])))
+        return summarize_entries(entries, since, until)
+
+
+def search_segment(segment: Segment, spec: SearchSpec, sampler: MatchSampler, start: int = 0,
+                   cancel: Optional[threading.Event] = None, resume: bool = False) -> MatchSampler:
+    """Search a rotated segment from the uncompressed offset ``start`` into ``sampler``
+
+    Line numbers are relative to ``start``. With ``resume`` the line at
+    ``start``, returned by a previous page, is skipped and not numbered.
+    """
+    prefilter = spec.prefilter()
+    lines = iter_segment_lines(segment, start)
+    if resume:
+        next(lines, None)
+    return search_entries(_decode_numbered(check_cancel(lines, cancel), prefilter), spec, sampler)
+
+
+def summarize_segment(segment: Segment, since: Optional[float], until: Optional[float],
+                      cancel: Optional[threading.Event] = None) -> SummaryPart:
+    """Summarize errors and warnings in a rotated segment"""
+    lines = check_cancel(iter_segment_lines(segment), cancel)
+    entries = (entry for _, entry, _ in _decode_numbered(lines, level_prefilter(LOG_LEVELS["WARN"])))
+    return summarize_entries(entries, since, until)
+
+
+def check_cancel(lines: Iterable[Tuple[int, bytes]],
+                  cancel: Optional[threading.Event]) -> Iterator[Tuple[int, bytes]]:
+    """Pass lines through, raising ScanCancelled once ``cancel`` is set"""
+    for count, line in enumerate(lines):
+        if cancel is not None and count % 1024 == 0 and cancel.is_set():
+            raise ScanCancelled()
+        yield line
+
+
+# ----------------------------------------------------------------------
+
+class ScanEngine:
+    """Run range workers serially or across a process pool
+
+    Ranges are (start, end, first_line) triples as produced by the time and
+    search indexes; an ``end`` of None means end of file. Scans smaller than
+    ``parallel_threshold`` bytes, or any scan when ``workers`` is 1, run on the
+    calling thread. The pool is created on first use. Every scan takes an
+    optional ``cancel`` event, checked between pieces; once it is set the scan
+    raises ScanCancelled. An optional ``progress`` callback is told how many
+    bytes are done after each piece.
+    """
+
+    def __init__(self, workers: int, parallel_threshold: int, pieces_per_worker: int = 4):
+        self.workers = max(1, workers)
+        self.parallel_threshold = parallel_threshold
+        self.pieces_per_worker = pieces_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Sources are scanned from several threads at once
+        self._executor_lock = threading.Lock()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def search(self, path: Path, ranges: Sequence[Tuple[int, Optional[int], int]], spec: SearchSpec,
+               sampler: MatchSampler, cancel: Optional[threading.Event] = None,
+               progress: Optional[ProgressCallback] = None) -> MatchSampler:
+        """Feed the matches across ``ranges`` to ``sampler`` until it is done, with absolute line numbers"""
+        parts = self._run(path, ranges, search_range, (spec, sampler.empty_copy()), cancel, progress)
+        try:
+            for first_line, part in parts:
+                sampler.merge(part.matches, lambda match: (first_line + match[0], match[1], match[2]))
+                if sampler.done:
+                    break
+        finally:
+            # Cancels the pieces still queued
+            parts.close()
+        return sampler
+
+    def summarize(self, path: Path, ranges: Sequence[Tuple[int, Optional[int], int]],
+                  since: Optional[float], until: Optional[float], cancel: Optional[threading.Event] = None,
+                  progress: Optional[ProgressCallback] = None) -> SummaryPart:
+        """Summarize errors and warnings across ``ranges``"""
+        parts = self._run(path, ranges, summarize_range, (since, until), cancel, progress)
+        return merge_summaries(part for _, part in parts)
+
+    def _run(self, path: Path, ranges: Sequence[Tuple[int, Optional[int], int]],
+             worker: Callable, worker_args: tuple, cancel: Optional[threading.Event] = None,
+             progress: Optional[ProgressCallback] = None) -> Iterator[Tuple[int, Any]]:
+        """Yield (first_line, result) per piece in file order
+
+        ``first_line`` is the number of lines before the piece, worked out from
+        the line counts of the pieces before it. Pieces still queued in the pool
+        are cancelled when the caller stops consuming results.
+        """
+        size = os.path.getsize(path)
+        resolved = [(start, size if end is None else min(end, size), first_line)
+                    for start, end, first_line in ranges]
+        resolved = [(start, end, first_line) for start, end, first_line in resolved if end > start]
+        total = sum(end - start for start, end, _ in resolved)
+        if not resolved:
+            return
+
+        if self.workers == 1 or total < self.parallel_threshold:
+            pieces = self._split(path, resolved, SERIAL_PIECE_BYTES)
+            results = ((worker(path, start, end, *worker_args), is_first, first_line, end - start)
+                       for start, end, first_line, is_first in pieces)
+            yield from self._in_order(results, total, cancel, progress)
+            return
+
+        pieces = self._split(path, resolved, max(total // (self.workers * self.pieces_per_worker), 1 << 20))
+        executor = self._pool()
+        # Pool processes can't see the calling thread's stats, so they send theirs back
+        stats = current_stats.get()
+        wrapper = (counted, worker) if stats is not None else (worker,)
+        futures: List[Future] = [executor.submit(*wrapper, path, start, end, *worker_args)
+                                 for start, end, _, _ in pieces]
+        try:
+            results = ((self._collect(self._wait(future, cancel), stats), is_first, first_line, end - start)
+                       for future, (start, end, first_line, is_first) in zip(futures, pieces))
+            yield from self._in_order(results, total, cancel, progress)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _in_order(results: Iterable[Tuple[Any, bool, int, int]], total: int, cancel: Optional[threading.Event],
+                  progress: Optional[ProgressCallback]) -> Iterator[Tuple[int, Any]]:
+        """Turn piece results into (first_line, result)
+
+        ``cancel`` is checked before each piece and ``progress`` told about
+        each piece once its result is in.
+        """
+        line_base = 0
+        done = 0
+        iterator = iter(results)
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise ScanCancelled()
+            try:
+                result, is_first, first_line, size = next(iterator)
+            except StopIteration:
+                return
+            done += size
+            if progress is not None:
+                progress(done, total)
+            if is_first:
+                line_base = first_line
+            yield line_base, result
+            line_base += result.line_count if isinstance(result, SearchPart) else 0
+
+    @staticmethod
+    def _collect(result: Any, stats: Optional[CallStats]) -> Any:
+        """Unwrap a result of counted(), adding its counts to ``stats``"""
+        if stats is None:
+            return result
+        result, counts = result
+        stats.add(counts)
+        return result
+
+    @staticmethod
+    def _wait(future: Future, cancel: Optional[threading.Event]) -> Any:
+        """Wait for a pool result, giving up early once ``cancel`` is set"""
+        while cancel is not None:
+            try:
+                return future.result(timeout=0.1)
+            except FuturesTimeoutError:
+                if cancel.is_set():
+                    raise ScanCancelled()
+        return future.result()
+
+    def _split(self, path: Path, ranges: List[Tuple[int, int, int]],
+               piece_size: int) -> List[Tuple[int, int, int, bool]]:
+        """Cut ranges into newline-aligned pieces of about ``piece_size`` bytes"""
+        pieces = []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end, first_line in ranges:
+                piece_start = start
+                while piece_start < end:
+                    piece_end = end
+                    if end - piece_start > piece_size:
+                        newline = mm.find(b"\n", piece_start + piece_size, end)
+                        if newline != -1:
+                            piece_end = newline + 1
+                    pieces.append((piece_start, piece_end, first_line, piece_start == start))
+                    piece_start = piece_end
+        return pieces
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawn rather than fork: the server has watcher threads running
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                logger.info(f"Started scan pool with {self.workers} workers")
+            return self._executor
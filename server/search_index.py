@@ -0,0 +1,375 @@
+"""
+Persistent trigram index for search_logs
+Splits the log into line-aligned chunks and stores a Bloom filter of the byte
+trigrams of each line's searchable text, so a query only reads the chunks that
+can contain it. The index lives next to the log, survives restarts and is shared
+by every mcp-server.py process: one process builds it under a file lock while the
+others read it.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from log_reader import decode_entry, entry_message, iter_lines
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"WXTRGM\x00\x00"
+INDEX_VERSION = 1
+
+# Log bytes covered by one index record, and the Bloom filter size for each.
+# Two hash functions over 256K bits keep the false positive rate for a typical
+# chunk's ~30k distinct trigrams around 4% per trigram, much less per query.
+INDEX_CHUNK_SIZE = 256 * 1024
+BLOOM_BITS = 256 * 1024
+
+# Bytes of the log start whose checksum tells a rewritten log from the indexed one
+SIGNATURE_BYTES = 4096
+
+# magic, version, chunk size, bloom bits, device, inode, signature length,
+# signature crc, generation id, header crc
+_HEADER = struct.Struct("<8sIIIQQII16sI")
+# start, end, first line, line count, record crc
+_RECORD = struct.Struct("<QQQII")
+_BLOOM_BYTES = BLOOM_BITS // 8
+
+
+class IndexChunk(NamedTuple):
+    """One indexed range of the log and where its Bloom filter sits in the index file"""
+    start: int
+    end: int
+    first_line: int
+    line_count: int
+    bloom_offset: int
+
+
+def _trigram_codes(text: bytes) -> Set[Tuple[int, int, int]]:
+    return set(zip(text, text[1:], text[2:]))
+
+
+def _bloom_positions(trigram: Tuple[int, int, int]) -> Tuple[int, int]:
+    code = (trigram[0] << 16) | (trigram[1] << 8) | trigram[2]
+    return ((code * 0x9E3779B1) & 0xFFFFFFFF) % BLOOM_BITS, ((code * 0x85EBCA77 + 0x165667B1) & 0xFFFFFFFF) % BLOOM_BITS
+
+
+def searchable_bytes(entry: Dict[str, Any]) -> bytes:
+    """Case-folded UTF-8 bytes of the text search_logs matches against"""
+    return str(entry_message(entry)).lower().encode("utf-8", "surrogatepass")
+
+
+class TrigramIndex:
+    """Reader and incremental builder for the on-disk trigram index
+
+    The file holds a fixed header followed by one record per chunk, each with
+    its own checksum. Records are only ever appended; a rebuild rewrites the
+    header with a new generation id so readers in other processes notice and
+    reload. The index is considered stale when the log's inode changes, the log
+    shrinks below the indexed size, or its first bytes no longer match.
+    """
+
+    def __init__(self, log_path: Union[str, Path], index_path: Optional[Union[str, Path]] = None,
+                 update_interval: float = 2.0):
+        self.log_path = Path(log_path)
+        self.index_path = Path(index_path) if index_path else self.log_path.with_name(self.log_path.name + ".trgm")
+        self.lock_path = self.index_path.with_name(self.index_path.name + ".lock")
+        self.update_interval = update_interval
+        self._lock = threading.Lock()
+        # Reader state: records loaded so far from the index file
+        self._chunks: List[IndexChunk] = []
+        self._header: Optional[bytes] = None
+        self._read_position = 0
+        # Builder state: where the last update left off, to skip re-validation
+        self._built: Optional[Tuple[bytes, int, int, int]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Background building
+
+    def start(self) -> None:
+        """Keep the index up to date from a background thread"""
+        self._thread = threading.Thread(target=self._update_loop, name="search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _update_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Search index update failed: {e}")
+            self._stop_event.wait(self.update_interval)
+
+    def update(self) -> bool:
+        """Index complete chunks appended to the log; False if another process holds the lock"""
+        if not self.log_path.exists():
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not try_lock_file(lock_fd):
+                return False
+            try:
+                self._update_locked()
+            finally:
+                unlock_file(lock_fd)
+        finally:
+            os.close(lock_fd)
+        return True
+
+    def _update_locked(self) -> None:
+        stat = os.stat(self.log_path)
+        resume = self._resume_point(stat)
+        if resume is None:
+            logger.info(f"Rebuilding search index {self.index_path}")
+            self._write_header(stat)
+            resume = (0, 0, _HEADER.size)
+        start, first_line, index_size = resume
+
+        with open(self.index_path, "r+b") as index_file:
+            index_file.truncate(index_size)
+            index_file.seek(index_size)
+            for chunk, bloom in self._build_chunks(start, first_line, stat.st_size):
+                index_file.write(_encode_record(chunk, bloom))
+                index_file.flush()
+                start, first_line = chunk.end, chunk.first_line + chunk.line_count
+                index_size += _RECORD.size + _BLOOM_BYTES
+                if self._stop_event.is_set():
+                    break
+            index_file.seek(0)
+            header = index_file.read(_HEADER.size)
+        self._built = (header, start, first_line, index_size)
+
+    def _resume_point(self, stat: os.stat_result) -> Optional[Tuple[int, int, int]]:
+        """Return (log offset, line number, index size) to continue from, or None to rebuild"""
+        try:
+            index_stat = os.stat(self.index_path)
+            with open(self.index_path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if self._check_header(header, stat) is None:
+            return None
+
+        if self._built is not None:
+            built_header, start, first_line, index_size = self._built
+            if built_header == header and index_stat.st_size == index_size and start <= stat.st_size:
+                return start, first_line, index_size
+
+        # Another process may have built part of the index; verify what's there
+        with open(self.index_path, "rb") as f:
+            f.seek(_HEADER.size)
+            chunks, consumed, corrupt = _decode_records(f.read(), 0, 0, _HEADER.size)
+        if corrupt or (chunks and chunks[-1].end > stat.st_size):
+            return None
+        if not chunks:
+            return 0, 0, _HEADER.size
+        # A record cut short by a crash is dropped by truncating to `consumed`
+        return chunks[-1].end, chunks[-1].first_line + chunks[-1].line_count, _HEADER.size + consumed
+
+    def _build_chunks(self, start: int, first_line: int, size: int) -> Iterable[Tuple[IndexChunk, bytes]]:
+        trigrams: Set[Tuple[int, int, int]] = set()
+        chunk_start = start
+        line_count = 0
+        for offset, line in iter_lines(self.log_path, start=start, end=size):
+            line_end = offset + len(line) + 1
+            if line_end > size:
+                break  # No newline yet: the line is still being written
+            line_count += 1
+            entry = decode_entry(line)
+            if entry is not None:
+                trigrams |= _trigram_codes(searchable_bytes(entry))
+            if line_end - chunk_start >= INDEX_CHUNK_SIZE:
+                yield IndexChunk(chunk_start, line_end, first_line, line_count, 0), _build_bloom(trigrams)
+                first_line += line_count
+                chunk_start = line_end
+                line_count = 0
+                trigrams = set()
+
+    def _write_header(self, stat: os.stat_result) -> None:
+        with open(self.log_path, "rb") as f:
+            signature = f.read(SIGNATURE_BYTES)
+        fields = (INDEX_MAGIC, INDEX_VERSION, INDEX_CHUNK_SIZE, BLOOM_BITS, stat.st_dev, stat.st_ino,
+                  len(signature), zlib.crc32(signature), uuid.uuid4().bytes)
+        header = _HEADER.pack(*fields, 0)
+        header = _HEADER.pack(*fields, zlib.crc32(header[:-4]))
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+        os.replace(tmp_path, self.index_path)
+
+    def _check_header(self, header: bytes, stat: os.stat_result) -> Optional[tuple]:
+        if len(header) < _HEADER.size:
+            return None
+        fields = _HEADER.unpack(header)
+        magic, version, chunk_size, bloom_bits, device, inode, signature_length, signature_crc, _, header_crc = fields
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION or chunk_size != INDEX_CHUNK_SIZE
+                or bloom_bits != BLOOM_BITS or zlib.crc32(header[:-4]) != header_crc):
+            return None
+        if (device, inode) != (stat.st_dev, stat.st_ino) or stat.st_size < signature_length:
+            return None
+        with open(self.log_path, "rb") as f:
+            if zlib.crc32(f.read(signature_length)) != signature_crc:
+                return None
+        return fields
+
+    # ------------------------------------------------------------------
+    # Queries
+
+    def candidate_ranges(self, query: str, start: int = 0, start_line: int = 0,
+                         end: Optional[int] = None) -> Optional[List[Tuple[int, Optional[int], int]]]:
+        """Return (start, end, first_line) ranges of ``[start, end)`` that may contain ``query``
+
+        ``start`` must be line-aligned with ``start_line`` lines before it. The
+        returned ranges are in file order and line-aligned; ``first_line`` is the
+        number of lines before each range and an ``end`` of None means end of
+        file. Whatever lies past the last indexed chunk is always included.
+        Returns None when the query is too short for trigrams or the index is
+        missing or stale, in which case the caller scans normally.
+        """
+        needle = query.lower().encode("utf-8", "surrogatepass")
+        if len(needle) < 3:
+            return None
+        chunks = self._load()
+        if chunks is None:
+            return None
+
+        ranges: List[Tuple[int, Optional[int], int]] = []
+
+        def add(range_start: int, range_end: Optional[int], first_line: int) -> None:
+            if range_start < start:
+                range_start, first_line = start, start_line
+            if ranges and ranges[-1][1] == range_start:
+                ranges[-1] = (ranges[-1][0], range_end, ranges[-1][2])
+            else:
+                ranges.append((range_start, range_end, first_line))
+
+        positions = [_bloom_positions(trigram) for trigram in _trigram_codes(needle)]
+        tail_start, tail_line = 0, 0
+        if chunks:
+            tail_start, tail_line = chunks[-1].end, chunks[-1].first_line + chunks[-1].line_count
+            with open(self.index_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                for chunk in chunks:
+                    if chunk.end <= start:
+                        continue
+                    if end is not None and chunk.start >= end:
+                        return ranges
+                    if all(_bloom_test(index, chunk.bloom_offset, position) for position in positions):
+                        add(chunk.start, chunk.end if end is None else min(chunk.end, end), chunk.first_line)
+
+        if end is None or max(tail_start, start) < end:
+            add(tail_start, end, tail_line)
+        return ranges
+
+    def _load(self) -> Optional[List[IndexChunk]]:
+        """Read records appended since the last call, reloading after a rebuild"""
+        with self._lock:
+            try:
+                stat = os.stat(self.log_path)
+                with open(self.index_path, "rb") as f:
+                    header = f.read(_HEADER.size)
+                    if header != self._header:
+                        if self._check_header(header, stat) is None:
+                            self._header = None
+                            return None
+                        self._header = header
+                        self._chunks = []
+                        self._read_position = _HEADER.size
+                    f.seek(self._read_position)
+                    data = f.read()
+            except FileNotFoundError:
+                self._header = None
+                return None
+
+            expected_start = self._chunks[-1].end if self._chunks else 0
+            chunks, consumed, corrupt = _decode_records(data, 0, expected_start, self._read_position)
+            if corrupt:
+                self._header = None
+                return None
+            self._chunks.extend(chunks)
+            self._read_position += consumed
+            if self._chunks and self._chunks[-1].end > stat.st_size:
+                return None
+            return self._chunks
+
+
+def _build_bloom(trigrams: Set[Tuple[int, int, int]]) -> bytes:
+    bloom = bytearray(_BLOOM_BYTES)
+    for trigram in trigrams:
+        for position in _bloom_positions(trigram):
+            bloom[position >> 3] |= 1 << (position & 7)
+    return bytes(bloom)
+
+
+def _bloom_test(index: mmap.mmap, bloom_offset: int, positions: Tuple[int, int]) -> bool:
+    return all(index[bloom_offset + (position >> 3)] & (1 << (position & 7)) for position in positions)
+
+
+def _record_crc(start: int, end: int, first_line: int, line_count: int, bloom: bytes) -> int:
+    return zlib.crc32(bloom, zlib.crc32(struct.pack("<QQQI", start, end, first_line, line_count)))
+
+
+def _encode_record(chunk: IndexChunk, bloom: bytes) -> bytes:
+    crc = _record_crc(chunk.start, chunk.end, chunk.first_line, chunk.line_count, bloom)
+    return _RECORD.pack(chunk.start, chunk.end, chunk.first_line, chunk.line_count, crc) + bloom
+
+
+def _decode_records(data: bytes, position: int, expected_start: int,
+                    file_position: int) -> Tuple[List[IndexChunk], int, bool]:
+    """Decode consecutive records; returns (chunks, bytes consumed, corrupt)
+
+    A record cut off at the end of ``data`` is still being written and simply
+    ends the list. A complete record with a bad checksum, or one that doesn't
+    start where the previous one ended, means the file is corrupt.
+    """
+    chunks = []
+    record_size = _RECORD.size + _BLOOM_BYTES
+    start_position = position
+    while position + record_size <= len(data):
+        start, end, first_line, line_count, crc = _RECORD.unpack_from(data, position)
+        bloom = data[position + _RECORD.size:position + record_size]
+        if crc != _record_crc(start, end, first_line, line_count, bloom) or start != expected_start or end <= start:
+            return chunks, position - start_position, True
+        bloom_offset = file_position + position - start_position + _RECORD.size
+        chunks.append(IndexChunk(start, end, first_line, line_count, bloom_offset))
+        expected_start = end
+        position += record_size
+    return chunks, position - start_position, False
+
+
+def try_lock_file(fd: int) -> bool:
+    """Take an exclusive lock on an open lock file without waiting; False if another process holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def unlock_file(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,145 @@
+"""
+Stdio transport for the MCP server
+Newline-delimited JSON-RPC over stdin/stdout on asyncio pipes. Responses
+that become ready together are coalesced into one write, and payloads
+encoded ahead of time are written as they are.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest request line the reader accepts
+MAX_LINE_BYTES = 64 * 1024 * 1024
+
+
+def encode_message(payload: Any) -> bytes:
+    """Serialize a response, a batch of responses or an already encoded payload"""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, list):
+        return b"[" + b", ".join(encode_message(item) for item in payload) + b"]"
+    return json.dumps(payload).encode("utf-8")
+
+
+class _WriteProtocol(asyncio.Protocol):
+    """Write-side protocol tracking whether the stdout pipe can take more data and when it closes"""
+
+    def __init__(self):
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def pause_writing(self) -> None:
+        self._can_write.clear()
+
+    def resume_writing(self) -> None:
+        self._can_write.set()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._can_write.set()
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    async def drain(self) -> None:
+        """Wait until the pipe's write buffer is below its high-water mark"""
+        await self._can_write.wait()
+
+
+class StdioTransport:
+    """Read request lines from stdin and write response lines to stdout
+
+    Uses an asyncio StreamReader on stdin and a write pipe transport on
+    stdout. When stdin or stdout is not a pipe (a regular file, or a console on
+    Windows), that side falls back to blocking I/O in a worker thread.
+    """
+
+    def __init__(self):
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._transport: Optional[asyncio.WriteTransport] = None
+        self._protocol: Optional[_WriteProtocol] = None
+        self._pending: List[bytes] = []
+        self._ready: Optional[asyncio.Event] = None
+        self._closing = False
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            reader = asyncio.StreamReader(limit=MAX_LINE_BYTES)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            self._reader = reader
+        except (ValueError, OSError, NotImplementedError) as e:
+            logger.info(f"stdin is not a pipe, reading it from a thread ({e})")
+        try:
+            sys.stdout.flush()
+            self._transport, self._protocol = await loop.connect_write_pipe(_WriteProtocol, sys.stdout)
+        except (ValueError, OSError, NotImplementedError) as e:
+            logger.info(f"stdout is not a pipe, writing it from a thread ({e})")
+        self._ready = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def read_line(self) -> Optional[bytes]:
+        """Return the next non-blank line, or None at EOF"""
+        while True:
+            if self._reader is None:
+                line = await asyncio.to_thread(sys.stdin.buffer.readline)
+            else:
+                try:
+                    line = await self._reader.readline()
+                except ValueError:
+                    logger.error(f"Discarding request line longer than {MAX_LINE_BYTES} bytes")
+                    continue
+            if not line:
+                return None
+            if line.strip():
+                return line
+
+    def send(self, payload: Any) -> None:
+        """Queue a response; it is written with any others ready at the same time"""
+        self._pending.append(encode_message(payload) + b"\n")
+        self._ready.set()
+
+    async def close(self) -> None:
+        """Write everything queued, then close stdout"""
+        self._closing = True
+        self._ready.set()
+        await self._flusher
+        if self._transport is not None:
+            self._transport.close()
+            await self._protocol.closed
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._pending:
+                data = b"".join(self._pending)
+                self._pending = []
+                try:
+                    await self._write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.info("stdout closed, dropping responses")
+                    self._closing = True
+                    return
+            if self._closing and not self._pending:
+                return
+
+    async def _write(self, data: bytes) -> None:
+        if self._transport is None:
+            await asyncio.to_thread(self._write_blocking, data)
+            return
+        if self._protocol.closed.done():
+            raise BrokenPipeError("stdout is closed")
+        self._transport.write(data)
+        if self._transport.get_write_buffer_size():
+            await self._protocol.drain()
+
+    @staticmethod
+    def _write_blocking(data: bytes) -> None:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
@@ -9,5 +9,11 @@ module.exports = {
   MAX_RETRIES: 3,
   TIMEOUT: 5000,
   FALLBACK_STORAGE_KEY: 'mcp_fallback_logs',
-  MAX_FALLBACK_LOGS: 100
+  MAX_FALLBACK_LOGS: 100,
+  // Send logs in batches to /logs/batch instead of one request per log
+  BATCH_ENABLED: false,
+  BATCH_MAX_SIZE: 20,
+  BATCH_MAX_DELAY: 1000,
+  // Logs per request when fallback logs are sent again
+  REPLAY_BATCH_SIZE: 50
 };
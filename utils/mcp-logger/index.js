@@ -31,7 +31,12 @@ if (MCP_ENABLED) {
     maxRetries: config.MAX_RETRIES,
     timeout: config.TIMEOUT,
     fallbackStorageKey: config.FALLBACK_STORAGE_KEY,
-    maxFallbackLogs: config.MAX_FALLBACK_LOGS
+    maxFallbackLogs: config.MAX_FALLBACK_LOGS,
+    batch: envConfig.MCP_BATCH !== undefined ? envConfig.MCP_BATCH === true : config.BATCH_ENABLED,
+    batchEndpoint: envConfig.MCP_LOG_BATCH_ENDPOINT || null,
+    batchMaxSize: config.BATCH_MAX_SIZE,
+    batchMaxDelay: config.BATCH_MAX_DELAY,
+    replayBatchSize: config.REPLAY_BATCH_SIZE
   });
 } else {
   console.log('⚠️  MCP Logger: Disabled (not in development mode)');